@@ -0,0 +1,291 @@
+# alerts.py
+#
+# Ценовые алерты по позиции из TradeForm: цель, стоп и ликвидация.
+#
+# На каждый (биржа, символ) — два отсортированных типизированных массива
+# уровней (array('d') + параллельный array('q') с id):
+#   up   — срабатывают, когда марк >= уровня (уровень был выше цены);
+#   down — срабатывают, когда марк <= уровня (уровень был ниже цены).
+# Все сработавшие up — это префикс до bisect_right(up, цена), все down —
+# суффикс от bisect_left(down, цена). Тик цены без срабатываний — два
+# бисекта, O(log n), сколько бы алертов ни висело на символе; сработавшие
+# вырезаются одним срезом.
+#
+# Алерты одной позиции — группа (OCO): первый сработавший снимает остальные,
+# позиция считается закрытой. Если тик перепрыгнул несколько уровней группы
+# (гэп), уведомление — по тому, что цена прошла бы первым.
+#
+# Уведомления уходят через колбэк notify из main.py (рендер карточки и
+# sendPhoto) под общим бюджетом отправок в секунду. notify возвращает None
+# или число секунд RetryAfter — тогда bucket на паузе, алерт в голову очереди.
+
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from itertools import count
+
+import numpy as np
+
+from live import TokenBucket
+
+log = logging.getLogger("tg_trade_bot.alerts")
+
+# С какого числа снимаемых на одном символе выгоднее пересобрать массивы
+_BULK_CANCEL = 64
+
+KINDS = {"target": "🎯 Цель", "stop": "🛑 Стоп", "liquidation": "💀 Ликвидация"}
+
+
+class Alert:
+    __slots__ = ("id", "bot", "chat_id", "group", "exchange", "symbol", "kind", "level", "up", "data")
+
+    def __init__(self, alert_id: int, bot, chat_id: int, group, exchange: str, symbol: str,
+                 kind: str, level: float, up: bool, data: dict):
+        self.id = alert_id
+        self.bot = bot
+        self.chat_id = chat_id
+        self.group = group  # позиция: (bot_id, chat_id, message_id) карточки
+        self.exchange = exchange
+        self.symbol = symbol
+        self.kind = kind
+        self.level = level
+        self.up = up
+        self.data = data  # карточка из build_trade_card — для рендера при срабатывании
+
+
+class _Triggers:
+    # Уровни одного направления по возрастанию; равные — в порядке добавления
+    __slots__ = ("levels", "ids")
+
+    def __init__(self):
+        self.levels = array("d")
+        self.ids = array("q")
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def add(self, level: float, alert_id: int) -> None:
+        i = bisect_right(self.levels, level)
+        self.levels.insert(i, level)
+        self.ids.insert(i, alert_id)
+
+    def remove(self, level: float, alert_id: int) -> None:
+        i = bisect_left(self.levels, level)
+        while self.ids[i] != alert_id:
+            i += 1
+        del self.levels[i]
+        del self.ids[i]
+
+    def discard(self, alert_ids: set[int]) -> None:
+        # Снять пачку разом: одна векторная фильтрация вместо memmove на каждый
+        ids = np.frombuffer(self.ids, dtype=np.int64)
+        keep = ~np.isin(ids, np.fromiter(alert_ids, np.int64, len(alert_ids)))
+        levels = np.frombuffer(self.levels, dtype=np.float64)[keep].tobytes()
+        kept_ids = ids[keep].tobytes()
+        del ids
+        self.levels = array("d")
+        self.levels.frombytes(levels)
+        self.ids = array("q")
+        self.ids.frombytes(kept_ids)
+
+    def pop_below(self, price: float) -> array:
+        # up: все уровни <= price, от ближнего к старой цене (снизу вверх)
+        k = bisect_right(self.levels, price)
+        if not k:
+            return array("q")
+        fired = self.ids[:k]
+        del self.levels[:k]
+        del self.ids[:k]
+        return fired
+
+    def pop_above(self, price: float) -> array:
+        # down: все уровни >= price, сверху вниз — в том порядке, как их проходит падающая цена
+        k = bisect_left(self.levels, price)
+        if k == len(self.levels):
+            return array("q")
+        fired = self.ids[k:]
+        del self.levels[k:]
+        del self.ids[k:]
+        fired.reverse()
+        return fired
+
+
+class AlertEngine:
+    def __init__(self, fetch_price, notify, interval: float = 10.0, sends_per_second: float = 20.0,
+                 per_chat: int = 30):
+        self.fetch_price = fetch_price  # async (exchange, symbol) -> float | None
+        self.notify = notify  # async (alert, price) -> None | retry_after
+        self.interval = interval
+        self.per_chat = per_chat
+        self.bucket = TokenBucket(sends_per_second)
+        self._ids = count(1)
+        self._alerts: dict[int, Alert] = {}
+        # (exchange, symbol) -> (up, down)
+        self._books: dict[tuple[str, str], tuple[_Triggers, _Triggers]] = {}
+        self._groups: dict[tuple, dict[int, None]] = {}
+        self._chats: dict[tuple[int, int], dict[int, None]] = {}
+        self._outbox: deque[tuple[Alert, float]] = deque()
+        self._wakeup: asyncio.Event | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+    def symbols(self) -> int:
+        return len(self._books)
+
+    def queued(self) -> int:
+        return len(self._outbox)
+
+    def add(self, bot, chat_id: int, group, data: dict, kind: str, level: float,
+            mark: float) -> Alert | None:
+        # Направление — по текущей цене: уровень выше — ждём роста, ниже — падения.
+        # None — уровень совпадает с ценой или в чате уже per_chat алертов
+        chat = (bot.id, chat_id)
+        if level <= 0 or level == mark or len(self._chats.get(chat, ())) >= self.per_chat:
+            return None
+        alert = Alert(next(self._ids), bot, chat_id, group, data["exchange"], data["symbol"],
+                      kind, level, level > mark, data)
+        book = self._books.get((alert.exchange, alert.symbol))
+        if book is None:
+            book = self._books[(alert.exchange, alert.symbol)] = (_Triggers(), _Triggers())
+        book[0 if alert.up else 1].add(level, alert.id)
+        self._alerts[alert.id] = alert
+        self._groups.setdefault(group, {})[alert.id] = None
+        self._chats.setdefault(chat, {})[alert.id] = None
+        return alert
+
+    def _forget(self, alert: Alert) -> None:
+        # Убрать из индексов всё, кроме массивов уровней
+        del self._alerts[alert.id]
+        for index, key in ((self._groups, alert.group), (self._chats, (alert.bot.id, alert.chat_id))):
+            ids = index.get(key)
+            if ids is not None:
+                ids.pop(alert.id, None)
+                if not ids:
+                    del index[key]
+
+    def cancel(self, alert_id: int) -> Alert | None:
+        alert = self._alerts.get(alert_id)
+        if alert is None:
+            return None
+        book_key = (alert.exchange, alert.symbol)
+        up, down = self._books[book_key]
+        (up if alert.up else down).remove(alert.level, alert.id)
+        if not up and not down:
+            del self._books[book_key]
+        self._forget(alert)
+        return alert
+
+    def cancel_group(self, group) -> list[Alert]:
+        return [self.cancel(alert_id) for alert_id in list(self._groups.get(group, ()))]
+
+    def _cancel_many(self, alert_ids: list[int]) -> None:
+        # Массовое снятие (гэп цены закрыл тысячи позиций разом): по одному
+        # remove — это memmove массива на каждый, дальше порога — пачкой
+        by_book: dict[tuple[str, str], list[Alert]] = {}
+        for alert_id in alert_ids:
+            alert = self._alerts[alert_id]
+            by_book.setdefault((alert.exchange, alert.symbol), []).append(alert)
+        for book_key, alerts in by_book.items():
+            up, down = self._books[book_key]
+            if len(alerts) < _BULK_CANCEL:
+                for alert in alerts:
+                    (up if alert.up else down).remove(alert.level, alert.id)
+            else:
+                up.discard({a.id for a in alerts if a.up})
+                down.discard({a.id for a in alerts if not a.up})
+            if not up and not down:
+                del self._books[book_key]
+            for alert in alerts:
+                self._forget(alert)
+
+    def cancel_chat(self, bot_id: int, chat_id: int) -> int:
+        ids = list(self._chats.get((bot_id, chat_id), ()))
+        for alert_id in ids:
+            self.cancel(alert_id)
+        return len(ids)
+
+    def chat_alerts(self, bot_id: int, chat_id: int) -> list[Alert]:
+        return [self._alerts[i] for i in self._chats.get((bot_id, chat_id), ())]
+
+    def on_price(self, exchange: str, symbol: str, price: float) -> list[Alert]:
+        # Сработавшие алерты (по одному на позицию) уходят в очередь уведомлений
+        book = self._books.get((exchange, symbol))
+        if book is None:
+            return []
+        up, down = book
+        crossed = up.pop_below(price)
+        crossed.extend(down.pop_above(price))
+        if not crossed:
+            return []
+        # Из массивов они уже вырезаны — сначала убираем из индексов все,
+        # чтобы cancel_group ниже трогал только несработавшие уровни
+        alerts = [self._alerts[alert_id] for alert_id in crossed]
+        for alert in alerts:
+            self._forget(alert)
+        fired, groups, siblings = [], set(), []
+        for alert in alerts:
+            if alert.group in groups:
+                # Гэп через несколько уровней позиции: уведомляем по первому
+                continue
+            groups.add(alert.group)
+            # Остальные уровни позиции больше не нужны
+            siblings.extend(self._groups.get(alert.group, ()))
+            fired.append(alert)
+            self._outbox.append((alert, price))
+        if siblings:
+            self._cancel_many(siblings)
+        if not up and not down and (exchange, symbol) in self._books:
+            del self._books[(exchange, symbol)]
+        if fired and self._wakeup is not None:
+            self._wakeup.set()
+        return fired
+
+    async def poll(self) -> None:
+        symbols = list(self._books)
+        prices = await asyncio.gather(*(self.fetch_price(ex, sym) for ex, sym in symbols))
+        for (exchange, symbol), price in zip(symbols, prices):
+            if price is not None:
+                self.on_price(exchange, symbol, price)
+
+    async def _poll_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if self._books:
+                    await self.poll()
+            except Exception:
+                log.warning("alert price poll failed", exc_info=True)
+
+    async def _send_loop(self) -> None:
+        while True:
+            if not self._outbox:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self.bucket.acquire()
+            alert, price = self._outbox.popleft()
+            try:
+                retry_after = await self.notify(alert, price)
+            except Exception:
+                log.warning("alert notification failed", exc_info=True)
+                continue
+            if retry_after is not None:
+                self.bucket.pause(float(retry_after))
+                self._outbox.appendleft((alert, price))
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._poll_loop()),
+            asyncio.create_task(self._send_loop()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,232 @@
+# batch_render.py
+#
+# Пакетный рендер карточек без бота — например, сотни карточек под кампанию.
+# Вход: JSONL или CSV, одна карточка на строку, поля как у data в get_leverage
+# (kind=trade: exchange, symbol, side, entry, mark, amount, leverage
+# [, deposit, price_precision]) или в custom_finish (kind=custom: exchange,
+# username, symbol, side, entry, exit, leverage [, referral, datetime_str]).
+# Если kind не указан: есть exit — custom, иначе trade.
+#
+# Рендер идёт в процессах; шаблоны и шрифты прогреваются один раз (до fork —
+# в родителе, иначе в инициализаторе воркера) и переиспользуются всю партию.
+# Готовые файлы пишутся по мере готовности в каталог, .zip или .tar.
+#
+#   python batch_render.py cards.jsonl --out campaign.zip --workers 8
+#   python batch_render.py cards.csv --out out_dir --format jpeg
+
+import argparse
+import csv
+import io
+import json
+import multiprocessing as mp
+import os
+import re
+import sys
+import tarfile
+import time
+import traceback
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import render
+from calc import build_custom_card, build_trade_card
+from utils.encode import EXTENSIONS, Encoder
+
+_FLOAT_FIELDS = ("entry", "mark", "exit", "amount", "deposit")
+_INT_FIELDS = ("price_precision",)
+
+
+# =====================================================
+# Чтение входа
+# =====================================================
+def _coerce(row: dict) -> dict:
+    # CSV отдаёт строки: приводим числа, пустые ячейки выкидываем
+    if not isinstance(row, dict):
+        # Валидный JSON, но не объект: [1, 2], "text", 42
+        raise ValueError(f"expected object, got {type(row).__name__}")
+    spec = {k: v for k, v in row.items() if k and v not in (None, "")}
+    for key in _FLOAT_FIELDS:
+        if isinstance(spec.get(key), str):
+            spec[key] = float(spec[key].replace(",", "."))
+    for key in _INT_FIELDS:
+        if isinstance(spec.get(key), str):
+            spec[key] = int(spec[key])
+    return spec
+
+def read_specs(path: str):
+    # (номер строки, спецификация или текст ошибки разбора)
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            for line, row in enumerate(csv.DictReader(f), start=2):
+                try:
+                    yield line, _coerce(row)
+                except ValueError as e:
+                    yield line, f"bad row: {e}"
+        else:
+            for line, text in enumerate(f, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    yield line, _coerce(json.loads(text))
+                except ValueError as e:
+                    yield line, f"bad row: {e}"
+
+
+# =====================================================
+# Воркер
+# =====================================================
+_ENCODER: Encoder | None = None
+
+def _init_worker(fmt: str | None) -> None:
+    global _ENCODER
+    _ENCODER = Encoder(fmt) if fmt else render.ENCODER
+    render.warmup()
+
+def render_spec(spec: dict) -> tuple[str, bytes]:
+    kind = spec.get("kind") or ("custom" if "exit" in spec else "trade")
+    exchange = spec.get("exchange", "bybit")
+    if kind == "trade":
+        leverage = int(float(str(spec["leverage"]).lower().replace("x", "")))
+        data, percent, pnl_usdt = build_trade_card(spec, leverage)
+        img = render.draw_trade_image(data, percent, percent, pnl_usdt)
+        prefix = f"trade_{exchange}"
+    elif kind == "custom":
+        data = build_custom_card(spec)
+        draw = render.draw_custom_bingx_image if exchange == "bingx" else render.draw_custom_bybit_image
+        img = draw(data)
+        prefix = f"custom_{exchange}"
+    else:
+        raise ValueError(f"unknown kind: {kind}")
+    fmt, body = _ENCODER.encode(img, prefix)
+    return EXTENSIONS[fmt], body
+
+def _render_job(line: int, spec: dict) -> tuple[int, str | None, bytes | None, float, str | None]:
+    start = time.perf_counter()
+    try:
+        ext, body = render_spec(spec)
+        return line, ext, body, time.perf_counter() - start, None
+    except Exception:
+        return line, None, None, time.perf_counter() - start, traceback.format_exc(limit=3)
+
+
+# =====================================================
+# Вывод: каталог, zip или tar — файлы пишутся сразу, в памяти ничего не копится
+# =====================================================
+class Sink:
+    def __init__(self, out: str):
+        self.out = out
+        self._zip = self._tar = None
+        if out.endswith(".zip"):
+            # PNG/JPEG/WebP уже сжаты — без deflate
+            self._zip = zipfile.ZipFile(out, "w", zipfile.ZIP_STORED)
+        elif out.endswith((".tar", ".tar.gz", ".tgz")):
+            self._tar = tarfile.open(out, "w:gz" if out.endswith(("gz", "tgz")) else "w")
+        else:
+            os.makedirs(out, exist_ok=True)
+
+    def write(self, name: str, body: bytes) -> None:
+        if self._zip is not None:
+            self._zip.writestr(name, body)
+        elif self._tar is not None:
+            info = tarfile.TarInfo(name)
+            info.size = len(body)
+            info.mtime = int(time.time())
+            self._tar.addfile(info, io.BytesIO(body))
+        else:
+            with open(os.path.join(self.out, name), "wb") as f:
+                f.write(body)
+
+    def close(self) -> None:
+        if self._zip is not None:
+            self._zip.close()
+        if self._tar is not None:
+            self._tar.close()
+
+
+def _file_name(line: int, spec: dict, ext: str) -> str:
+    symbol = re.sub(r"[^A-Za-z0-9]", "", str(spec.get("symbol", "card")))[:20]
+    return f"{line:06d}_{spec.get('exchange', 'bybit')}_{symbol}{ext}"
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(args) -> int:
+    render.warmup()  # при fork воркеры унаследуют тёплые кэши
+    methods = mp.get_all_start_methods()
+    ctx = mp.get_context("fork" if "fork" in methods else "spawn")
+    sink = Sink(args.out)
+    failures: list[tuple[int, str]] = []
+    times: list[float] = []
+    done = ok = written_bytes = 0
+    started = time.perf_counter()
+    report_every = max(1, args.progress)
+
+    with ProcessPoolExecutor(args.workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(args.format,)) as pool:
+        pending = {}
+        specs = read_specs(args.input)
+        exhausted = False
+        # Окно задач ограничено: вход читается потоково, память не растёт с партией
+        while pending or not exhausted:
+            while not exhausted and len(pending) < args.workers * 4:
+                try:
+                    line, spec = next(specs)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if isinstance(spec, str):
+                    failures.append((line, spec))
+                    continue
+                pending[pool.submit(_render_job, line, spec)] = spec
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                spec = pending.pop(future)
+                line, ext, body, seconds, error = future.result()
+                done += 1
+                times.append(seconds)
+                if error is not None:
+                    failures.append((line, error.strip().splitlines()[-1]))
+                    if args.verbose:
+                        print(f"line {line}:\n{error}", file=sys.stderr)
+                    continue
+                sink.write(_file_name(line, spec, ext), body)
+                ok += 1
+                written_bytes += len(body)
+                if done % report_every == 0:
+                    elapsed = time.perf_counter() - started
+                    print(f"  {done} cards, {done / elapsed:.1f}/s, {len(failures)} failed", file=sys.stderr)
+    sink.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"{args.out}: {ok} cards, {len(failures)} failed, {elapsed:.2f} s, "
+          f"{ok / elapsed if elapsed else 0:.1f} cards/s, {written_bytes / 2**20:.1f} MB")
+    print(f"per card (in worker): p50 {_percentile(times, 0.5) * 1000:.1f} ms, "
+          f"p95 {_percentile(times, 0.95) * 1000:.1f} ms")
+    for line, error in failures[:20]:
+        print(f"  line {line}: {error}")
+    if len(failures) > 20:
+        print(f"  ... and {len(failures) - 20} more")
+    return 1 if failures else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетный рендер карточек из JSONL/CSV")
+    parser.add_argument("input", help="JSONL или CSV со спецификациями карточек")
+    parser.add_argument("--out", required=True, help="каталог, .zip, .tar или .tar.gz")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--format", choices=sorted(EXTENSIONS) + ["auto"],
+                        help="формат вывода (по умолчанию RENDER_FORMAT)")
+    parser.add_argument("--progress", type=int, default=100, help="печатать прогресс каждые N карточек")
+    parser.add_argument("--verbose", action="store_true", help="полные трейсбеки ошибок")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
@@ -0,0 +1,74 @@
+# benchmarks/bench_alerts.py
+#
+# Алерты: оценка тика цены на индексе порогов (два бисекта на символ плюс
+# срез сработавших) при 100k активных алертов. Позиции — синтетические,
+# по три уровня (цель, стоп, ликвидация) на позицию, как из TradeForm.
+#
+# Запуск из каталога tg_trade_bot:  python -m benchmarks.bench_alerts --alerts 100000 --symbols 200
+
+import argparse
+import time
+
+import numpy as np
+
+from alerts import AlertEngine
+
+
+class FakeBot:
+    def __init__(self, bot_id: int):
+        self.id = bot_id
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Алерты: оценка тика при большом числе порогов")
+    parser.add_argument("--alerts", type=int, default=100_000)
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--ticks", type=int, default=20_000)
+    parser.add_argument("--step-bp", type=float, default=5.0, help="шаг цены за тик, б.п.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    engine = AlertEngine(None, None, per_chat=args.alerts)
+    bot = FakeBot(1)
+    names = [f"C{s}USDT" for s in range(args.symbols)]
+    prices = rng.uniform(0.5, 50_000, args.symbols)
+    positions = args.alerts // 3
+    sym = rng.integers(0, args.symbols, positions)
+    side = rng.random(positions) < 0.5
+    leverage = rng.integers(2, 100, positions)
+    take = rng.uniform(0.002, 0.2, positions)
+    stop = rng.uniform(0.002, 0.1, positions)
+
+    start = time.perf_counter()
+    for i in range(positions):
+        s = int(sym[i])
+        mark = float(prices[s])
+        sign = 1.0 if side[i] else -1.0
+        data = {"exchange": "bybit", "symbol": names[s]}
+        group = (1, 1, i)
+        engine.add(bot, 1, group, data, "target", mark * (1 + sign * take[i]), mark)
+        engine.add(bot, 1, group, data, "stop", mark * (1 - sign * stop[i]), mark)
+        engine.add(bot, 1, group, data, "liquidation", mark * (1 - sign / leverage[i]), mark)
+    add_us = (time.perf_counter() - start) / (positions * 3) * 1e6
+    total = len(engine)
+
+    steps = rng.normal(0, args.step_bp / 10_000, args.ticks)
+    which = rng.integers(0, args.symbols, args.ticks)
+    timings = np.empty(args.ticks)
+    fired = 0
+    for t in range(args.ticks):
+        s = int(which[t])
+        prices[s] *= 1 + steps[t]
+        begin = time.perf_counter()
+        fired += len(engine.on_price("bybit", names[s], float(prices[s])))
+        timings[t] = time.perf_counter() - begin
+
+    print(f"alerts: {total}, symbols: {args.symbols}, ticks: {args.ticks}")
+    print(f"add: {add_us:.2f} us/alert")
+    print(f"tick: mean {timings.mean() * 1e6:.1f} us, p99 {np.percentile(timings, 99) * 1e6:.1f} us, "
+          f"max {timings.max() * 1e3:.3f} ms")
+    print(f"fired: {fired} positions, alerts left: {len(engine)}, queued notifications: {engine.queued()}")
+
+
+if __name__ == "__main__":
+    main()
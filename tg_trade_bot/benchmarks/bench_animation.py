@@ -0,0 +1,53 @@
+# benchmarks/bench_animation.py
+#
+# Анимации карточек: время кадра, размер файла и общее время на запрос для
+# счётчика PnL и прогона цены — по всем видам карточек. --max-seconds
+# проверяет обрезку бюджетом: последний кадр всё равно итоговый.
+#
+# Запуск из каталога tg_trade_bot:  python -m benchmarks.bench_animation --frames 36 --format gif
+
+import argparse
+
+import numpy as np
+
+import render
+from calc import build_custom_card, build_trade_card
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Анимации карточек: кадр, размер, бюджет")
+    parser.add_argument("--frames", type=int, default=render.ANIMATION_FRAMES)
+    parser.add_argument("--format", default="gif", choices=("gif", "mp4"))
+    parser.add_argument("--max-seconds", type=float, default=render.ANIMATION_MAX_SECONDS)
+    args = parser.parse_args()
+    render.ANIMATION_FRAMES = max(2, args.frames)
+    render.ANIMATION_MAX_SECONDS = args.max_seconds
+
+    rng = np.random.default_rng(0)
+    path = 60000 * np.exp(rng.normal(0, 0.002, 500).cumsum())
+    jobs = []
+    for exchange in ("bybit", "bingx"):
+        trade = {"exchange": exchange, "side": "long", "symbol": "BTCUSDT",
+                 "entry": 60000.0, "mark": float(path[-1]), "amount": 100.0}
+        card, percent, pnl_usdt = build_trade_card(trade, 20)
+        custom = build_custom_card({"username": "BENCH", "symbol": "BTCUSDT", "entry": 60000.0,
+                                    "exit": float(path[-1]), "side": "long", "leverage": "20",
+                                    "exchange": exchange, "referral": "D1BFA4", "datetime_str": "02/14 19:00"})
+        for mode in ("counter", "replay"):
+            jobs.append((f"trade {exchange} {mode}", render.animate_trade_card,
+                         (card, percent, pnl_usdt, mode, path, args.format)))
+            jobs.append((f"custom {exchange} {mode}", render.animate_custom_card,
+                         (custom, exchange, mode, path, args.format)))
+
+    print(f"frames: {render.ANIMATION_FRAMES}, fps: {render.ANIMATION_FPS:g}, "
+          f"budget: {render.ANIMATION_MAX_SECONDS:g} s")
+    for name, func, job_args in jobs:
+        func(*job_args)  # прогрев: шрифты, шаблоны, холсты
+        out, stats = func(*job_args)
+        print(f"{name:<22} {stats['format']} {stats['frames']:>3} frames  "
+              f"{stats['frame_ms']:6.2f} ms/frame  total {stats['total_ms']:7.1f} ms  "
+              f"{stats['bytes'] / 1024:7.0f} KB{'  truncated' if stats['truncated'] else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/bench_bundle.py
+#
+# PNG-декод против mmap-бандла в K процессах-воркерах: время загрузки всех
+# шаблонов и иконок, прирост RSS и PSS (PSS делит общие страницы между
+# процессами — именно тут видна экономия mmap). Только Linux.
+#
+# Запуск из каталога tg_trade_bot (бандл соберётся, если его нет):
+#   python -m benchmarks.bench_bundle --workers 4
+
+import argparse
+import multiprocessing as mp
+import os
+import statistics
+import time
+
+
+def _memory_kb() -> dict[str, int]:
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0][:-1]] = int(parts[1])
+    return values
+
+
+def _worker(mode: str, barrier, results) -> None:
+    import render
+    from utils.bundle import AssetBundle
+
+    before = _memory_kb()
+    start = time.perf_counter()
+    bundle = AssetBundle(render.BUNDLE_PATH) if mode == "bundle" else None
+    keep = []
+    for path in render.template_paths():
+        if bundle is not None:
+            img = bundle.image(render.bundle_key(path), path)
+        else:
+            img = render._decode_template(path)
+        # Читаем все пиксели, как это сделал бы рендер, но без копии в куче
+        img.getextrema()
+        keep.append(img)
+    for path, size in render.icon_specs():
+        img = bundle.image(render.bundle_key(path, size), path) if bundle else render._decode_icon(path, size)
+        keep.append(img)
+    load_ms = (time.perf_counter() - start) * 1000
+    alone = _memory_kb()
+    barrier.wait()
+    together = _memory_kb()
+    barrier.wait()
+    results.put({
+        "load_ms": load_ms,
+        "rss_kb": alone["Rss"] - before["Rss"],
+        "pss_kb": together["Pss"] - before["Pss"],
+    })
+
+
+def run_mode(mode: str, workers: int) -> list[dict]:
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(mode, barrier, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    out = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PNG против mmap-бандла")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    import render
+    if not os.path.exists(render.BUNDLE_PATH):
+        from build_assets import collect_items
+        from utils.bundle import build_bundle
+        build_bundle(render.BUNDLE_PATH, collect_items())
+
+    print(f"{args.workers} workers\n{'mode':<8} {'load ms':>9} {'RSS +MB/worker':>15} "
+          f"{'PSS +MB/worker':>15} {'PSS +MB total':>14}")
+    for mode in ("png", "bundle"):
+        res = run_mode(mode, args.workers)
+        load = statistics.median(r["load_ms"] for r in res)
+        rss = statistics.median(r["rss_kb"] for r in res) / 1024
+        pss = [r["pss_kb"] / 1024 for r in res]
+        print(f"{mode:<8} {load:>9.1f} {rss:>15.1f} {statistics.median(pss):>15.1f} {sum(pss):>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# benchmarks/bench_canvas.py
+#
+# Рендер карточек (без кодирования): холст с восстановлением грязных областей
+# против свежей копии шаблона на каждый рендер. Память считается по всем
+# картинкам, которые PIL создаёт за рендер (копии, тайлы, оверлеи).
+#
+# Запуск из каталога tg_trade_bot:  python -m benchmarks.bench_canvas --repeat 50
+
+import argparse
+import statistics
+import time
+
+from PIL import Image
+
+import render
+from benchmarks.bench_encode import CARDS
+
+_allocated = [0]
+_orig_new = Image.Image._new
+
+
+def _counting_new(self, im):
+    # Все копии/кропы/convert/new в PIL проходят через Image._new
+    out = _orig_new(self, im)
+    _allocated[0] += out.width * out.height * len(out.getbands())
+    return out
+
+
+def measure(draw, repeat: int) -> tuple[float, float]:
+    draw()  # прогрев шрифтов, шаблонов и холста
+    times, allocated = [], []
+    for _ in range(repeat):
+        _allocated[0] = 0
+        start = time.perf_counter()
+        draw()
+        times.append((time.perf_counter() - start) * 1000)
+        allocated.append(_allocated[0])
+    return statistics.median(times), statistics.median(allocated) / 2**20
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Холст против копии шаблона")
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    Image.Image._new = _counting_new
+    print(f"{'card':<14} {'mode':<7} {'median ms':>10} {'alloc MB':>9}")
+    for card, draw in CARDS.items():
+        for reuse in (False, True):
+            render.REUSE_CANVAS = reuse
+            ms, mb = measure(draw, args.repeat)
+            print(f"{card:<14} {'canvas' if reuse else 'copy':<7} {ms:>10.2f} {mb:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
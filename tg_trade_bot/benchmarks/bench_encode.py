@@ -0,0 +1,62 @@
+# benchmarks/bench_encode.py
+#
+# Время кодирования и размер файла для каждого формата utils/encode.py
+# по каждому виду карточки, плюс что выберет auto при заданных бюджетах.
+#
+# Запуск из каталога tg_trade_bot:
+#   python -m benchmarks.bench_encode --repeat 5 --max-bytes 500000
+
+import argparse
+import statistics
+import time
+
+import render
+from utils.encode import EXTENSIONS, Encoder, encode
+
+TRADE = {
+    "symbol": "BTCUSDT", "side": "long", "entry": 42000.0, "mark": 43250.0,
+    "amount": 100.0, "deposit": 50.0, "leverage": 20, "qty": 0.0476,
+    "liquidation": 40110.0, "cost": 2000.0,
+}
+CUSTOM = {
+    "username": "TEST", "symbol": "PYTHUSDT", "pnl": 112.36, "entry": 0.1068,
+    "exit": 0.1092, "side": "long", "leverage": "50x", "referral": "D1BFA4",
+    "datetime_str": "02/14 19:00",
+}
+
+CARDS = {
+    "trade_bybit": lambda: render.draw_trade_image({**TRADE, "exchange": "bybit"}, 59.52, 59.52, 59.5),
+    "trade_bingx": lambda: render.draw_trade_image({**TRADE, "exchange": "bingx"}, 59.52, 59.52, 59.5),
+    "custom_bybit": lambda: render.draw_custom_bybit_image(CUSTOM),
+    "custom_bingx": lambda: render.draw_custom_bingx_image(CUSTOM),
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Форматы вывода карточек: время и размер")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quality", type=int, default=90)
+    parser.add_argument("--max-bytes", type=int, default=0, help="бюджет для auto")
+    parser.add_argument("--max-ms", type=float, default=0, help="бюджет по времени для auto")
+    args = parser.parse_args()
+
+    auto = Encoder("auto", max_bytes=args.max_bytes, max_ms=args.max_ms, quality=args.quality)
+    print(f"{'card':<14} {'format':<12} {'median ms':>10} {'KB':>9}")
+    for card, draw in CARDS.items():
+        img = draw()
+        print(f"{card:<14} {'(size)':<12} {'':>10} {img.width}x{img.height} {img.mode}")
+        for fmt in EXTENSIONS:
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                data = encode(img, fmt, args.quality)
+                times.append((time.perf_counter() - start) * 1000)
+            print(f"{card:<14} {fmt:<12} {statistics.median(times):>10.1f} {len(data) / 1024:>9.1f}")
+        start = time.perf_counter()
+        fmt, data = auto.encode(img, card)
+        print(f"{card:<14} {'auto->' + fmt:<12} {(time.perf_counter() - start) * 1000:>10.1f} "
+              f"{len(data) / 1024:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
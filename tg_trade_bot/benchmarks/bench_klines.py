@@ -0,0 +1,60 @@
+# benchmarks/bench_klines.py
+#
+# Хранилище свечей: дописывание страницами, поиск цены по времени
+# (бинарный поиск по memmap) и проверка покрытия диапазона — на годах
+# минутных свечей. Сеть не участвует, файлы — во временном каталоге.
+#
+# Запуск из каталога tg_trade_bot:  python -m benchmarks.bench_klines --candles 1000000
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from klines import KLINE_DTYPE, KlineStore, interval_ms
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Свечи: запись, поиск по времени, покрытие")
+    parser.add_argument("--candles", type=int, default=1_000_000)
+    parser.add_argument("--page", type=int, default=1000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    step = interval_ms("1m")
+    base = 1_600_000_000_000 - 1_600_000_000_000 % step
+    now = base + (args.candles + 1) * step
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as root:
+        store = KlineStore(root)
+        start = time.perf_counter()
+        for lo in range(0, args.candles, args.page):
+            n = min(args.page, args.candles - lo)
+            page = np.zeros(n, KLINE_DTYPE)
+            page["ts"] = base + (lo + np.arange(n)) * step
+            page["open"] = page["close"] = 100 + rng.standard_normal(n).cumsum()
+            store.merge("bybit", "BTCUSDT", "1m", page, now_ms=now)
+        write_s = time.perf_counter() - start
+
+        reopened = KlineStore(root)
+        moments = base + rng.integers(0, args.candles * step, args.lookups)
+        start = time.perf_counter()
+        for ts in moments.tolist():
+            reopened.price_at("bybit", "BTCUSDT", "1m", ts)
+        lookup_us = (time.perf_counter() - start) / args.lookups * 1e6
+
+        start = time.perf_counter()
+        for ts in moments[:1000].tolist():
+            reopened.missing("bybit", "BTCUSDT", "1m", ts, ts + 3000 * step, now_ms=now)
+        missing_us = (time.perf_counter() - start) / 1000 * 1e6
+
+    size_mb = args.candles * KLINE_DTYPE.itemsize / 1e6
+    print(f"candles: {args.candles} ({size_mb:.0f} MB on disk), pages of {args.page}")
+    print(f"append: {write_s * 1000:.0f} ms total ({write_s / args.candles * 1e6:.2f} us/candle)")
+    print(f"price_at: {lookup_us:.1f} us per lookup")
+    print(f"missing (3000-candle range, covered): {missing_us:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
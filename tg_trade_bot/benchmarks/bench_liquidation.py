@@ -0,0 +1,70 @@
+# benchmarks/bench_liquidation.py
+#
+# Цена ликвидации по тирам MMR: одна позиция (bisect) и пачка позиций
+# (searchsorted на символ) против цикла по скалярной формуле. Таблицы —
+# синтетические, как у Bybit: 10 тиров на символ.
+#
+# Запуск из каталога tg_trade_bot:  python -m benchmarks.bench_liquidation --positions 100000
+
+import argparse
+import time
+
+import numpy as np
+
+from risk_limits import RiskLimits, RiskTable
+
+
+def synthetic_tables(symbols: int, tiers: int = 10) -> dict[str, RiskTable]:
+    tables = {}
+    for s in range(symbols):
+        step = 10 ** (5 + s % 3)
+        rows, deduction = [], 0.0
+        for t in range(tiers):
+            mmr = 0.005 * (t + 1)
+            if t:
+                deduction += step * t * 0.005
+            rows.append((step * (t + 1), mmr, deduction, 100 / (t + 1)))
+        tables[f"C{s}USDT"] = RiskTable(rows)
+    return tables
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ликвидация по тирам: скаляр и пачка")
+    parser.add_argument("--positions", type=int, default=100_000)
+    parser.add_argument("--symbols", type=int, default=300)
+    parser.add_argument("--mode", choices=("isolated", "cross"), default="isolated")
+    args = parser.parse_args()
+
+    limits = RiskLimits("/nonexistent")
+    limits.replace("bybit", synthetic_tables(args.symbols), save=False)
+    rng = np.random.default_rng(0)
+    n = args.positions
+    symbols = rng.choice([f"C{s}USDT" for s in range(args.symbols)], n)
+    sides = rng.choice(["long", "short"], n)
+    entries = rng.uniform(0.1, 50_000, n)
+    qtys = rng.uniform(0.01, 100, n)
+    leverages = rng.integers(1, 100, n).astype(np.float64)
+    balances = rng.uniform(100, 100_000, n)
+
+    start = time.perf_counter()
+    batch = limits.liquidation_batch("bybit", symbols, sides, entries, qtys, leverages, args.mode, balances)
+    batch_ms = (time.perf_counter() - start) * 1000
+
+    sample = min(n, 20_000)
+    start = time.perf_counter()
+    scalar = [
+        limits.liquidation("bybit", str(symbols[i]), str(sides[i]), float(entries[i]),
+                           float(qtys[i]), float(leverages[i]), args.mode, float(balances[i]))
+        for i in range(sample)
+    ]
+    scalar_us = (time.perf_counter() - start) / sample * 1e6
+    diff = np.max(np.abs(batch[:sample] - scalar) / np.maximum(np.abs(scalar), 1.0))
+
+    print(f"positions: {n}, symbols: {args.symbols}, mode: {args.mode}")
+    print(f"batch:  {batch_ms:.1f} ms ({batch_ms * 1000 / n:.2f} us/position)")
+    print(f"scalar: {scalar_us:.2f} us/position (~{scalar_us * n / 1000:.0f} ms for all)")
+    print(f"max relative diff: {diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# benchmarks/bench_live.py
+#
+# Live-карточки: разброс тика цены по подписчикам символа (on_price),
+# доля карточек, у которых видимый PnL не изменился, и соблюдение
+# глобального бюджета правок. Telegram и рендер заменены колбэком с задержкой.
+#
+# Запуск из каталога tg_trade_bot:  python -m benchmarks.bench_live --cards 20000 --symbols 50
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from calc import calculate_pnl_linear
+from live import LiveCards
+
+
+class FakeBot:
+    def __init__(self, bot_id: int):
+        self.id = bot_id
+
+
+def make_cards(live: LiveCards, n: int, symbols: int, rng) -> dict[str, float]:
+    prices = {f"C{s}USDT": float(rng.uniform(0.5, 50_000)) for s in range(symbols)}
+    names = list(prices)
+    bot = FakeBot(1)
+    for i in range(n):
+        symbol = names[i % symbols]
+        entry = prices[symbol] * float(rng.uniform(0.97, 1.03))
+        amount = float(rng.uniform(10, 1000))
+        leverage = int(rng.integers(1, 50))
+        data = {"exchange": "bybit", "symbol": symbol, "side": "long" if i % 2 else "short",
+                "entry": entry, "amount": amount, "leverage": leverage,
+                "qty": amount * leverage / entry}
+        pnl_usdt, _, percent = calculate_pnl_linear(entry, prices[symbol], data["qty"], data["side"], leverage)
+        live.subscribe(bot, i, 1, data, percent, pnl_usdt)
+    return prices
+
+
+async def run(args) -> None:
+    rng = np.random.default_rng(0)
+    edits = []
+
+    async def edit(card, data, percent, pnl_usdt):
+        edits.append(time.perf_counter())
+        await asyncio.sleep(args.edit_ms / 1000)
+        return True
+
+    async def no_price(exchange, symbol):
+        return None
+
+    live = LiveCards(no_price, edit, interval=3600, edits_per_second=args.budget,
+                     ttl=3600, per_chat=1)
+    prices = make_cards(live, args.cards, args.symbols, rng)
+
+    # Тики: случайное блуждание с шагом ~1 бп, как между опросами раз в 10 с
+    fanout, queued_total = [], 0
+    for _ in range(args.ticks):
+        for symbol in prices:
+            prices[symbol] *= 1 + float(rng.normal(0, args.step_bp / 10_000))
+            start = time.perf_counter()
+            queued_total += live.on_price("bybit", symbol, prices[symbol])
+            fanout.append(time.perf_counter() - start)
+    per_card_us = sum(fanout) / (args.ticks * args.cards) * 1e6
+    print(f"cards: {args.cards}, symbols: {args.symbols}, ticks: {args.ticks}")
+    print(f"on_price: {np.mean(fanout) * 1e3:.2f} ms per symbol tick ({per_card_us:.2f} us/card)")
+    print(f"queued after coalescing: {live.pending()} "
+          f"(enqueue events: {queued_total}, card-ticks: {args.ticks * args.cards})")
+
+    live.start()
+    start = time.perf_counter()
+    await asyncio.sleep(args.seconds)
+    await live.stop()
+    elapsed = time.perf_counter() - start
+    window = [t for t in edits if t - start >= 1.0]  # после стартового burst
+    rate = len(window) / max(elapsed - 1.0, 1e-9)
+    print(f"edits: {len(edits)} in {elapsed:.1f} s, steady rate {rate:.1f}/s "
+          f"(budget {args.budget:g}/s), still pending {live.pending()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Live-карточки: fan-out и бюджет правок")
+    parser.add_argument("--cards", type=int, default=20_000)
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--step-bp", type=float, default=1.0, help="шаг цены за тик, б.п.")
+    parser.add_argument("--budget", type=float, default=20.0, help="правок в секунду")
+    parser.add_argument("--edit-ms", type=float, default=5.0, help="задержка одной правки")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# benchmarks/bench_marathon.py
+#
+# Марафон на N сделок: дописывание в историю, статистика (кривая капитала,
+# просадка, винрейт, Sharpe) и рендер карточки кривой капитала.
+#
+# Запуск из каталога tg_trade_bot:  python -m benchmarks.bench_marathon --trades 10000
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+import render
+from marathon import Marathon, trade_stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="История марафона и статистика")
+    parser.add_argument("--trades", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    marathon = Marathon(1000.0)
+    pnl = rng.normal(0.5, 10.0, args.trades)
+    symbols = ("BTCUSDT", "ETHUSDT", "SOLUSDT", "PYTHUSDT")
+    start = time.perf_counter()
+    for i, value in enumerate(pnl.tolist()):
+        marathon.record(1.7e9 + i * 60, symbols[i % 4], "long" if i % 3 else "short",
+                        42000.0, 42100.0, 20, value)
+    append_us = (time.perf_counter() - start) / args.trades * 1e6
+
+    column = marathon.history.column("pnl")
+    trade_stats(marathon.start, column)  # прогрев
+    times = []
+    for _ in range(args.repeat):
+        t = time.perf_counter()
+        stats = trade_stats(marathon.start, column)
+        times.append((time.perf_counter() - t) * 1000)
+
+    render.draw_equity_image(stats)  # прогрев шрифтов и шаблона
+    t = time.perf_counter()
+    render.draw_equity_image(stats)
+    render_ms = (time.perf_counter() - t) * 1000
+
+    print(f"trades: {args.trades}, history: {marathon.history.nbytes() / 1024:.0f} KB")
+    print(f"record: {append_us:.2f} us/trade")
+    print(f"stats:  median {statistics.median(times):.3f} ms, max {max(times):.3f} ms")
+    print(f"card:   {render_ms:.1f} ms (draw only)")
+    print(f"balance {stats['balance']:.2f}, max drawdown {stats['max_drawdown'] * 100:.1f}%, "
+          f"win rate {stats['win_rate'] * 100:.1f}%, sharpe {stats['sharpe']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
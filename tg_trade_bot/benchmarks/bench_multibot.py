@@ -0,0 +1,84 @@
+# benchmarks/bench_multibot.py
+#
+# Сколько памяти стоит ещё один токен в том же процессе.
+# Сначала прогреваем процесс одним ботом (шаблоны, шрифты, пул потоков),
+# затем добавляем ботов по одному, гоняем через каждого сценарии trade + custom
+# и меряем прирост RSS и Python-аллокаций (tracemalloc).
+#
+# Запуск из каталога tg_trade_bot:  python -m benchmarks.bench_multibot --bots 8
+
+import argparse
+import asyncio
+import gc
+import os
+import tracemalloc
+
+from benchmarks.loadtest import SCRIPTS, Stats, StubSession, Synth, run_conversation, seed_market_caches
+
+import main
+
+
+def rss_mb() -> float:
+    # Текущий RSS (Linux); на других ОС — 0
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return 0.0
+
+
+async def drive(bot, users: int) -> None:
+    synth = Synth(bot)
+    stats = Stats()
+    await asyncio.gather(*(
+        run_conversation(main.dp, bot, synth, stats, 20_000 + i, SCRIPTS[name], 0.0)
+        for i in range(users)
+        for name in ("trade", "custom")
+    ))
+
+
+async def run(args) -> None:
+    seed_market_caches()
+    session = StubSession(latency=0.0, jitter=0.0)
+    rss_start = rss_mb()
+
+    tokens = [f"{100000 + i}:multibot" for i in range(args.bots)]
+    bots = main.create_bots(tokens, session=session)
+
+    await drive(bots[0], args.users)
+    gc.collect()
+    rss_warm = rss_mb()
+    print(f"import + first bot warm: {rss_warm:.1f} MB RSS "
+          f"(+{rss_warm - rss_start:.1f} MB) — это цена отдельного процесса на бота")
+
+    tracemalloc.start()
+    prev_rss, prev_py = rss_warm, tracemalloc.get_traced_memory()[0]
+    print(f"\n{'bot':>4} {'RSS MB':>8} {'+RSS MB':>8} {'+py KB':>8}")
+    deltas = []
+    for n, bot in enumerate(bots[1:], start=2):
+        await drive(bot, args.users)
+        gc.collect()
+        rss, py = rss_mb(), tracemalloc.get_traced_memory()[0]
+        deltas.append((rss - prev_rss, (py - prev_py) / 1024))
+        print(f"{n:>4} {rss:>8.1f} {rss - prev_rss:>8.2f} {(py - prev_py) / 1024:>8.1f}")
+        prev_rss, prev_py = rss, py
+    tracemalloc.stop()
+
+    if deltas:
+        avg_rss = sum(d[0] for d in deltas) / len(deltas)
+        avg_py = sum(d[1] for d in deltas) / len(deltas)
+        print(f"\nper extra bot: ~{avg_rss:.2f} MB RSS, ~{avg_py:.1f} KB Python heap "
+              f"({args.users} users × trade+custom each)")
+    await main.MESSAGE_CLEANER.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Память на дополнительный токен в одном процессе")
+    parser.add_argument("--bots", type=int, default=6)
+    parser.add_argument("--users", type=int, default=5, help="пользователей на бота")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,48 @@
+# benchmarks/bench_projection.py
+#
+# Монте-Карло прогноз марафона: время simulate() для пути × сделки в обоих
+# режимах (бутстрап по истории и «тейк или стоп») и рендер веера.
+#
+# Запуск из каталога tg_trade_bot:  python -m benchmarks.bench_projection --paths 10000 --trades 100
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+import render
+from projection import parametric_returns, simulate
+
+
+def measure(func, repeat: int) -> float:
+    func()  # прогрев
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Монте-Карло прогноз марафона")
+    parser.add_argument("--paths", type=int, default=10_000)
+    parser.add_argument("--trades", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    realized = np.random.default_rng(0).normal(0.004, 0.05, 200)
+    parametric = parametric_returns(0.55, 0.02, 0.01, 10, 0.1)
+    for name, source in (("bootstrap", realized), ("parametric", parametric)):
+        ms = measure(lambda: simulate(1000.0, args.trades, source, args.paths), args.repeat)
+        print(f"{name:<11} {args.paths} x {args.trades}: {ms:.1f} ms")
+
+    result = simulate(1000.0, args.trades, parametric, args.paths, seed=1)
+    ms = measure(lambda: render.draw_projection_image(result), args.repeat)
+    print(f"card: {ms:.1f} ms (draw only); median {result['median']:.2f}, "
+          f"ruin {result['ruin_probability'] * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# benchmarks/bench_routing.py
+#
+# Сравнение стоимости роутинга callback-кнопок:
+#   chain — N хендлеров с фильтрами F.data == ..., aiogram проверяет их по очереди;
+#   table — один хендлер + CallbackRouter (dict lookup).
+#
+# Запуск из каталога tg_trade_bot:  python -m benchmarks.bench_routing
+
+import asyncio
+import datetime
+import time
+
+from aiogram import Bot, Dispatcher, F
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from utils.routing import CallbackRouter
+
+HANDLER_COUNTS = (5, 20, 50, 100, 200)
+ROUNDS = 2000
+
+_USER = User(id=1, is_bot=False, first_name="bench")
+_CHAT = Chat(id=1, type="private")
+_MESSAGE = Message(message_id=1, date=datetime.datetime.now(), chat=_CHAT)
+
+
+def make_update(update_id: int, data: str) -> Update:
+    call = CallbackQuery(id=str(update_id), from_user=_USER, chat_instance="1", data=data, message=_MESSAGE)
+    return Update(update_id=update_id, callback_query=call)
+
+
+async def _noop(*args, **kwargs) -> None:
+    return None
+
+
+def build_chain(n: int) -> Dispatcher:
+    dp = Dispatcher(storage=MemoryStorage())
+    for i in range(n):
+        dp.callback_query.register(_noop, F.data == f"btn:{i}:x")
+    return dp
+
+
+def build_table(n: int) -> tuple[Dispatcher, CallbackRouter]:
+    dp = Dispatcher(storage=MemoryStorage())
+    router = CallbackRouter()
+    for i in range(n):
+        router.route(f"btn:{i}")(_noop)
+    dp.callback_query.register(router.dispatch)
+    return dp, router
+
+
+async def time_feed(dp: Dispatcher, bot: Bot, data: str) -> float:
+    updates = [make_update(i, data) for i in range(ROUNDS)]
+    start = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+def time_resolve_chain(n: int, data: str) -> float:
+    filters = [(lambda c, i=i: c == f"btn:{i}:x") for i in range(n)]
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for f in filters:
+            if f(data):
+                break
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+def time_resolve_table(router: CallbackRouter, data: str) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        router.resolve(data, None)
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+async def main() -> None:
+    bot = Bot(token="123456:bench")
+    print(f"{'handlers':>8} | {'chain feed µs':>13} | {'table feed µs':>13} | "
+          f"{'chain match µs':>14} | {'table match µs':>14}")
+    for n in HANDLER_COUNTS:
+        # Худший случай для цепочки — последняя кнопка
+        data = f"btn:{n - 1}:x"
+        chain_feed = await time_feed(build_chain(n), bot, data)
+        table_dp, router = build_table(n)
+        table_feed = await time_feed(table_dp, bot, data)
+        chain_match = time_resolve_chain(n, data)
+        table_match = time_resolve_table(router, data)
+        print(f"{n:>8} | {chain_feed:>13.1f} | {table_feed:>13.1f} | "
+              f"{chain_match:>14.2f} | {table_match:>14.2f}")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
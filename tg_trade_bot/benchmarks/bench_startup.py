@@ -0,0 +1,92 @@
+# benchmarks/bench_startup.py
+#
+# Время импорта и первого рендера в свежем процессе:
+#   import render / import main,
+#   первый рендер «холодный» и после warmup() (параллельный прогрев ассетов).
+#
+# Запуск из каталога tg_trade_bot:  python -m benchmarks.bench_startup --repeat 5
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+_SNIPPETS = {
+    "import render": """
+import time
+t = time.perf_counter()
+import render
+result = {"ms": (time.perf_counter() - t) * 1000}
+""",
+    "import main": """
+import time
+t = time.perf_counter()
+import main
+result = {"ms": (time.perf_counter() - t) * 1000}
+""",
+    "first render (cold)": """
+import time
+import render
+t = time.perf_counter()
+{render_call}
+result = {{"ms": (time.perf_counter() - t) * 1000}}
+""",
+    "first render (after warmup)": """
+import os, time
+from concurrent.futures import ThreadPoolExecutor
+import render
+t = time.perf_counter()
+items = render.warmup(ThreadPoolExecutor(max_workers=os.cpu_count() or 4))
+warm_ms = (time.perf_counter() - t) * 1000
+t = time.perf_counter()
+{render_call}
+result = {{"ms": (time.perf_counter() - t) * 1000, "warmup_ms": warm_ms, "items": items}}
+""",
+}
+
+_RENDER_CALLS = {
+    "trade": (
+        "render.generate_trade_image({'exchange': 'bybit', 'symbol': 'BTCUSDT', 'side': 'long', "
+        "'entry': 42000.0, 'mark': 43250.0, 'amount': 100.0, 'deposit': 50.0, 'leverage': 20, "
+        "'qty': 0.0476, 'liquidation': 40110.0, 'cost': 2000.0}, 59.52, 59.52, 59.5)"
+    ),
+    "custom_bingx": (
+        "render.generate_custom_bingx_image({'username': 'TEST', 'symbol': 'PYTHUSDT', 'pnl': 112.36, "
+        "'entry': 0.1068, 'exit': 0.1092, 'side': 'long', 'leverage': '50x', 'referral': 'D1BFA4', "
+        "'datetime_str': '02/14 19:00'})"
+    ),
+}
+
+
+def run_snippet(code: str) -> dict:
+    code = code + "\nimport json\nprint(json.dumps(result))\n"
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Время импорта и первого рендера")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--card", choices=sorted(_RENDER_CALLS), default="trade")
+    args = parser.parse_args()
+
+    render_call = _RENDER_CALLS[args.card]
+    print(f"{'measure':<30} {'median ms':>10} {'min ms':>8}  extra")
+    for name, template in _SNIPPETS.items():
+        code = template.format(render_call=render_call) if "{render_call}" in template else template
+        runs = [run_snippet(code) for _ in range(args.repeat)]
+        values = [r["ms"] for r in runs]
+        extra = ""
+        if "warmup_ms" in runs[0]:
+            extra = (f"warmup {statistics.median(r['warmup_ms'] for r in runs):.1f} ms "
+                     f"for {runs[0]['items']} items")
+        print(f"{name:<30} {statistics.median(values):>10.1f} {min(values):>8.1f}  {extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+# benchmarks/loadtest.py
+#
+# Нагрузочный прогон бота без Telegram: dp из main.py получает синтетические
+# апдейты через dp.feed_update, а Bot работает поверх StubSession, которая
+# записывает исходящие вызовы API и имитирует задержку сети.
+#
+# Запуск из каталога tg_trade_bot:
+#   python -m benchmarks.loadtest --users 40 --rate 10 --latency 0.05
+#
+# Рендер пишет файлы в output/ и images/ (и чистит там старые) — как и боевой бот.
+
+import argparse
+import asyncio
+import datetime
+import itertools
+import os
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+from typing import Any, AsyncGenerator
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Chat, Message, PhotoSize, Update
+
+import main
+
+TOKEN = os.getenv("BOT_TOKEN", "123456:loadtest")
+
+# Методы, которые в ответ отдают Message
+_MESSAGE_METHODS = {"sendMessage", "sendPhoto", "sendDocument", "editMessageMedia", "editMessageText"}
+
+
+class StubSession(BaseSession):
+    # Сессия-заглушка: вместо HTTP ждёт latency ± jitter и возвращает фейковый ответ
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02):
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.calls: Counter[str] = Counter()
+        self._message_ids = itertools.count(1_000_000)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: int | None = None) -> Any:
+        name = method.__api_method__
+        self.calls[name] += 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        chat_id = getattr(method, "chat_id", None) or 0
+        if name in _MESSAGE_METHODS:
+            return self._message(bot, chat_id, photo=name == "sendPhoto")
+        if name == "sendMediaGroup":
+            return [self._message(bot, chat_id) for _ in method.media]
+        return True
+
+    def _message(self, bot: Bot, chat_id: int, photo: bool = False) -> Message:
+        message_id = next(self._message_ids)
+        # У отправленного фото есть file_id — бот может переслать его без загрузки
+        sizes = [PhotoSize(file_id=f"photo{message_id}", file_unique_id=f"u{message_id}",
+                           width=1200, height=800)] if photo else None
+        return Message(
+            message_id=message_id,
+            date=datetime.datetime.now(),
+            chat=Chat(id=chat_id, type="private"),
+            photo=sizes,
+        ).as_(bot)
+
+    async def stream_content(
+        self, url: str, headers: dict[str, Any] | None = None, timeout: int = 30,
+        chunk_size: int = 65536, raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+# =====================================================
+# Синтетические апдейты
+# =====================================================
+class Synth:
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    def _message(self, user_id: int, text: str | None) -> dict:
+        msg = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+        }
+        if text is not None:
+            msg["text"] = text
+        return msg
+
+    def text(self, user_id: int, text: str) -> Update:
+        return Update.model_validate(
+            {"update_id": next(self._update_ids), "message": self._message(user_id, text)},
+            context={"bot": self.bot},
+        )
+
+    def callback(self, user_id: int, data: str) -> Update:
+        call = {
+            "id": str(next(self._update_ids)),
+            "from": self._user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": self._message(user_id, None),
+        }
+        return Update.model_validate(
+            {"update_id": next(self._update_ids), "callback_query": call},
+            context={"bot": self.bot},
+        )
+
+
+# Сценарий — список шагов (имя шага, "text"|"callback", payload)
+Script = list[tuple[str, str, str]]
+
+TRADE_SCRIPT: Script = [
+    ("trade:/start", "text", "/start"),
+    ("trade:exchange", "callback", "trade:exchange:bybit"),
+    ("trade:symbol", "text", "BTCUSDT"),
+    ("trade:side", "callback", "side:pick:long"),
+    ("trade:entry", "text", "42000"),
+    ("trade:mark", "callback", "trade:mark_price"),
+    ("trade:amount", "text", "100"),
+    ("trade:deposit", "text", "500"),
+    ("trade:leverage", "text", "20"),
+]
+
+CUSTOM_SCRIPT: Script = [
+    ("custom:start", "callback", "custom:start:bingx"),
+    ("custom:username", "text", "Load Test"),
+    ("custom:side", "callback", "side:pick:short"),
+    ("custom:symbol", "text", "PYTHUSDT"),
+    ("custom:entry", "text", "0.1068"),
+    ("custom:exit", "text", "0.1040"),
+    ("custom:leverage", "text", "50"),
+    ("custom:referral", "text", "D1BFA4"),
+    ("custom:datetime", "callback", "custom:skip"),
+]
+
+MARATHON_SCRIPT: Script = [
+    ("marathon:menu", "callback", "marathon:menu"),
+    ("marathon:deposit", "text", "100"),
+    *[
+        step
+        for side in ("long", "short")
+        for step in (
+            ("marathon:exchange", "callback", "trade:exchange:bingx"),
+            ("marathon:symbol", "text", "ETHUSDT"),
+            ("marathon:side", "callback", f"side:pick:{side}"),
+            ("marathon:entry", "text", "3000"),
+            ("marathon:mark", "text", "3050"),
+            ("marathon:amount", "text", "10"),
+            ("marathon:leverage", "text", "10"),
+            ("marathon:round", "callback", "marathon:start"),
+        )
+    ],
+    ("marathon:equity", "callback", "marathon:equity"),
+    ("marathon:top", "callback", "marathon:top"),
+    ("marathon:project", "callback", "marathon:project"),
+    ("marathon:projection", "text", "/projection 100 55 10 5 2 1"),
+    ("marathon:stop", "callback", "marathon:stop"),
+]
+
+TEST_SCRIPT: Script = [
+    (f"test:{cmd}", "text", f"/{cmd}")
+    for cmd in (
+        "test_bybit_long", "test_bybit_short", "test_bingx_long", "test_bingx_short",
+        "test_custom_bybit_long", "test_custom_bybit_short",
+        "test_custom_bingx_long", "test_custom_bingx_short",
+    )
+]
+
+# Те же восемь карточек: параллельный рендер и один sendMediaGroup
+ALBUM_SCRIPT: Script = [("test:test_all_render", "text", "/test_all_render")]
+
+# Сделка и кнопка «Сценарии» под карточкой (callback_data из scenario_kb)
+SCENARIO_SCRIPT: Script = TRADE_SCRIPT + [
+    ("trade:scenario", "callback", "scenario:grid:bybit,long,42000.0,100.0,BTCUSDT"),
+]
+
+SCRIPTS = {
+    "trade": TRADE_SCRIPT,
+    "custom": CUSTOM_SCRIPT,
+    "marathon": MARATHON_SCRIPT,
+    "test": TEST_SCRIPT,
+    "album": ALBUM_SCRIPT,
+    "scenario": SCENARIO_SCRIPT,
+}
+
+
+def seed_market_caches() -> None:
+    # Сеть не трогаем: цены и точность для сценарных монет кладём в кэши заранее
+    for exchange in ("bybit", "bingx"):
+        for symbol, price, precision in (("BTCUSDT", 43000.0, 1), ("ETHUSDT", 3050.0, 2)):
+            main._PRICE_CACHE[f"price:{exchange}:{symbol}"] = price
+            main._PRECISION_CACHE[f"precision:{exchange}:{symbol}"] = precision
+
+
+# =====================================================
+# Прогон
+# =====================================================
+class Stats:
+    def __init__(self):
+        self.step_latency: dict[str, list[float]] = defaultdict(list)
+        self.loop_lag: list[float] = []
+        self.queue_depth: list[int] = []
+        self.errors: Counter[str] = Counter()
+        self.updates = 0
+
+
+async def run_conversation(dp, bot, synth: Synth, stats: Stats, user_id: int, script: Script, think: float):
+    for step, kind, payload in script:
+        update = synth.text(user_id, payload) if kind == "text" else synth.callback(user_id, payload)
+        start = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            stats.errors[f"{step}: {type(e).__name__}"] += 1
+        stats.step_latency[step].append(time.perf_counter() - start)
+        stats.updates += 1
+        if think:
+            await asyncio.sleep(think)
+
+
+async def sample_loop(stats: Stats, interval: float, stop: asyncio.Event):
+    # Лаг event loop — насколько sleep(interval) проснулся позже положенного;
+    # глубина очереди рендера — задачи, ждущие свободного потока в _THREAD_POOL
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        stats.loop_lag.append(max(0.0, loop.time() - start - interval))
+        stats.queue_depth.append(main._THREAD_POOL._work_queue.qsize())
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def report(stats: Stats, session: StubSession, elapsed: float) -> None:
+    ms = 1000
+    print(f"\nupdates: {stats.updates}  elapsed: {elapsed:.2f}s  "
+          f"throughput: {stats.updates / elapsed:.1f} updates/s")
+    print(f"\n{'step':<30} {'n':>5} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for step, values in stats.step_latency.items():
+        print(f"{step:<30} {len(values):>5} {percentile(values, 50) * ms:>8.1f} "
+              f"{percentile(values, 90) * ms:>8.1f} {percentile(values, 99) * ms:>8.1f} "
+              f"{max(values) * ms:>8.1f}")
+    if stats.queue_depth:
+        print(f"\nrender queue depth: avg {statistics.fmean(stats.queue_depth):.1f}  "
+              f"max {max(stats.queue_depth)}")
+    if stats.loop_lag:
+        print(f"event loop lag: p50 {percentile(stats.loop_lag, 50) * ms:.1f} ms  "
+              f"p99 {percentile(stats.loop_lag, 99) * ms:.1f} ms  max {max(stats.loop_lag) * ms:.1f} ms")
+    print("\nBot API calls: " + ", ".join(f"{k}={v}" for k, v in session.calls.most_common()))
+    if stats.errors:
+        print("errors: " + ", ".join(f"{k}={v}" for k, v in stats.errors.most_common()))
+    slowest = main.TRACER.slowest()[:5]
+    if slowest:
+        print("\nslowest traced updates:")
+        for trace in slowest:
+            spans = ", ".join(f"{name}={value:.1f}" for name, value in trace.breakdown().items())
+            print(f"  #{trace.update_id} {trace.state or trace.kind}: {trace.duration * ms:.1f} ms [{spans}]")
+
+
+async def run(args) -> None:
+    session = StubSession(latency=args.latency, jitter=args.jitter)
+    bot = main.create_bots([TOKEN], session=session)[0]
+    main.TRACER.sample_rate = args.trace_sample
+    synth = Synth(bot)
+    stats = Stats()
+    seed_market_caches()
+
+    names = [name.strip() for name in args.scripts.split(",") if name.strip()]
+    scripts = [SCRIPTS[name] for name in names]
+
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_loop(stats, args.sample_interval, stop))
+    tasks = []
+    start = time.perf_counter()
+    for i in range(args.users):
+        user_id = 10_000 + i
+        script = scripts[i % len(scripts)]
+        tasks.append(asyncio.create_task(
+            run_conversation(main.dp, bot, synth, stats, user_id, script, args.think)
+        ))
+        # Новые разговоры стартуют с заданной частотой
+        if args.rate > 0:
+            await asyncio.sleep(1 / args.rate)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await sampler
+    await main.MESSAGE_CLEANER.close()
+    report(stats, session, elapsed)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон dp на синтетических апдейтах")
+    parser.add_argument("--users", type=int, default=40, help="сколько разговоров запустить")
+    parser.add_argument("--rate", type=float, default=10.0, help="новых разговоров в секунду (0 — все сразу)")
+    parser.add_argument("--scripts", default="trade,custom,marathon,test",
+                        help="сценарии через запятую: " + ", ".join(SCRIPTS))
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка Bot API, сек")
+    parser.add_argument("--jitter", type=float, default=0.02, help="разброс задержки, сек")
+    parser.add_argument("--think", type=float, default=0.0, help="пауза пользователя между шагами, сек")
+    parser.add_argument("--trace-sample", type=float, default=1.0,
+                        help="доля апдейтов, которые трейсятся (TRACE_SAMPLE_RATE)")
+    parser.add_argument("--sample-interval", type=float, default=0.01,
+                        help="период замера лага loop и очереди рендера, сек")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,41 @@
+# build_assets.py
+#
+# Собирает assets/bundle.rgba — все шаблоны, иконки (в нужных размерах) и
+# line.png уже в RGBA. Запускать после правки картинок в assets/:
+#   python build_assets.py [--out путь]
+
+import argparse
+import os
+import time
+
+import render
+from utils.bundle import build_bundle
+
+
+def collect_items() -> list[tuple[str, object, str]]:
+    items = []
+    for path in render.template_paths():
+        if os.path.exists(path):
+            items.append((render.bundle_key(path), render._decode_template(path), path))
+    for path, size in render.icon_specs():
+        if os.path.exists(path):
+            items.append((render.bundle_key(path, size), render._decode_icon(path, size), path))
+    return items
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сборка бандла предекодированных ассетов")
+    parser.add_argument("--out", default=render.BUNDLE_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    items = collect_items()
+    size = build_bundle(args.out, items)
+    print(f"{args.out}: {len(items)} images, {size / 2**20:.1f} MB, "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+    for key, img, _ in items:
+        print(f"  {key:<40} {img.width}x{img.height}")
+
+
+if __name__ == "__main__":
+    main()
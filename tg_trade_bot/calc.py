@@ -0,0 +1,83 @@
+# calc.py
+#
+# Торговая математика без зависимостей от aiogram/PIL.
+
+from risk_limits import RISK_LIMITS
+
+def calculate_qty(exchange: str, amount: float, entry: float, leverage: int) -> float:
+    qty = amount * leverage / entry
+    return round(qty, 4 if exchange == "bybit" else 2)
+
+def format_price(value: float, precision: int | None = None) -> str:
+    if precision is not None:
+        return f"{value:,.{precision}f}"
+    if value == 0:
+        return "0"
+    if value >= 1000:
+        return f"{value:,.2f}"
+    elif value >= 1:
+        return f"{value:,.4f}".rstrip("0").rstrip(".")
+    return f"{value:.8f}".rstrip("0").rstrip(".")
+
+def format_pnl(percent: float, pnl_usdt: float) -> str:
+    # Строка PnL на карточке; по ней же live-режим решает, нужна ли перерисовка
+    return f"{pnl_usdt:+.2f}$ ({percent:+.2f}%)"
+
+def calculate_liquidation(entry: float, leverage: int | float, side: str, mm: float = 0.005) -> float:
+    return entry * (1 - 1 / leverage + mm) if side == "long" else entry * (1 + 1 / leverage - mm)
+
+def calculate_cost(exchange: str, amount: float, leverage: int | float) -> float:
+    return round(amount * leverage, 2)
+
+def calculate_pnl_linear(
+    entry: float, mark: float, qty: float, side: str, leverage: float
+) -> tuple[float, float, float]:
+    pnl_usd = qty * (mark - entry) if side == "long" else qty * (entry - mark)
+    margin = entry * qty / leverage if leverage else 0.0
+    pnl_percent = (pnl_usd / margin * 100) if margin > 0 else 0.0
+    return round(pnl_usd, 4), round(margin, 4), round(pnl_percent, 2)
+
+# =====================================================
+# Данные карточек — общие для чат-флоу и пакетного рендера (batch_render.py)
+# =====================================================
+def build_trade_card(data: dict, leverage: int) -> tuple[dict, float, float]:
+    # Как в get_leverage: (данные карточки, PnL %, PnL USDT). Ликвидация — по
+    # тирам поддерживающей маржи символа (risk_limits.py); margin_mode
+    # "cross" считает от всего депозита, по умолчанию "isolated"
+    qty = calculate_qty(data["exchange"], data["amount"], data["entry"], leverage)
+    cost = calculate_cost(data["exchange"], data["amount"], leverage)
+    pnl_usdt, _, percent = calculate_pnl_linear(data["entry"], data["mark"], qty, data["side"], leverage)
+    liquidation = RISK_LIMITS.liquidation(
+        data["exchange"], data.get("symbol", ""), data["side"], data["entry"], qty, leverage,
+        data.get("margin_mode", "isolated"), data.get("deposit"),
+    )
+    card = {**data, "leverage": leverage, "qty": qty, "liquidation": liquidation, "cost": cost}
+    return card, percent, pnl_usdt
+
+def parse_leverage(raw) -> float:
+    raw = str(raw or "1").strip().lower().replace("x", "")
+    try:
+        return float(raw) if raw else 1.0
+    except ValueError:
+        return 1.0
+
+def build_custom_card(data: dict) -> dict:
+    # Как в custom_finish: данные для generate_custom_*_image
+    entry, exit_price, side = data["entry"], data["exit"], data["side"]
+    leverage = parse_leverage(data.get("leverage"))
+    move = (exit_price - entry) if side == "long" else (entry - exit_price)
+    card = {
+        "username": data["username"],
+        "symbol": data["symbol"],
+        "pnl": round(move / entry * 100 * leverage, 2),
+        "entry": entry,
+        "exit": exit_price,
+        "side": side,
+    }
+    if data.get("exchange", "bybit") == "bingx":
+        card["leverage"] = data["leverage"]
+        card["referral"] = data.get("referral", "")
+        card["datetime_str"] = data.get("datetime_str", "")
+    else:
+        card["leverage"] = f"{leverage:.1f}x"
+    return card
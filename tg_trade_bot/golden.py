@@ -0,0 +1,384 @@
+# golden.py
+#
+# Эталонные картинки карточек: каждая разновидность карточки рендерится из
+# фиксированных данных и сверяется с golden/<кейс>.png. Запускать после
+# правок configs/layout.py и configs/fonts.py вместо сверки на глаз
+# (calibrate.py и примеры в output/, images/).
+#
+# Эталон хранится как разница с шаблоном карточки: пиксели, совпадающие с
+# шаблоном, прозрачны — PNG весит десятки КБ, а не мегабайты фотошаблона.
+# У графиков (сценарии, equity, лидерборд, прогноз) шаблона нет — их эталон
+# хранится целиком. Статичный слой анимаций сверяется так же, как карточка:
+# это тот самый слой, поверх которого рисуются кадры.
+#
+# Сравнение векторное: пиксель отличается, если max |разница| по каналам >
+# --tolerance. Картинка режется на клетки TILE×TILE, соседние клетки с
+# отличиями склеиваются в регионы; регион, где отличий больше --max-pixels, —
+# провал. Для него ищется ключ layout, чья точка привязки (или зона clear_*)
+# попала в регион, и сдвиг, при котором эталон совпал бы с новой картинкой.
+# Тепловая карта провала и сам новый рендер пишутся в golden/diff/.
+#
+#   python golden.py                  # проверить всё; код выхода 1 при провале
+#   python golden.py --update         # переписать эталоны после намеренной правки
+#   python golden.py --only custom_   # только кейсы с подстрокой в имени
+#   python golden.py --only anim_     # только статичные слои анимаций
+
+import argparse
+import os
+import sys
+import time
+from typing import NamedTuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import render
+from marathon import trade_stats
+from projection import parametric_returns, simulate
+from utils.coin_icons import CoinIcons
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIR = os.path.join(BASE_DIR, "golden")
+TILE = 16
+# Насколько далеко ищем сдвиг региона, px
+MAX_SHIFT = 24
+
+
+class Case(NamedTuple):
+    name: str
+    kind: str  # trade | custom | scenario | equity | leaderboard | projection
+    exchange: str
+    data: dict
+    percent: float = 0.0
+    pnl_usdt: float = 0.0
+    mode: str = ""  # counter | replay — статичный слой анимации карточки
+
+
+# =====================================================
+# Кейсы: фиксированные данные, без тиров риска и сети (ликвидация задана)
+# =====================================================
+_TRADE = {"symbol": "BTCUSDT", "side": "long", "entry": 42000.0, "mark": 43250.0, "amount": 100.0,
+          "leverage": 20, "qty": 0.0476, "liquidation": 40110.0, "cost": 2000.0}
+_CUSTOM = {"username": "GOLDEN", "symbol": "PYTHUSDT", "entry": 0.1068, "exit": 0.1092, "side": "long",
+           "leverage": "50.0x", "referral": "D1BFA4", "datetime_str": "02/14 19:00"}
+
+# PnL сделок марафона в USDT: серия с просадкой посередине
+_PNL = [12.5, -8.0, 20.25, 5.5, -14.0, -22.75, 9.0, 31.5, -6.25, 18.0,
+        -40.0, -12.5, -9.75, 4.0, 27.0, 15.5, -3.0, 44.25, -18.5, 7.75,
+        11.0, -25.0, 36.5, -7.0, 19.25, 2.5, -11.5, 23.0, -30.25, 8.5,
+        14.0, 6.75, -16.0, 28.5, -4.5, 21.0, -9.0, 33.25, 1.5, 12.0]
+# (место, имя, доходность %, баланс) — как Leaderboard.top()
+_ROWS = [(1, "Алексей К.", 184.32, 2843.2), (2, "trader_2024", 96.5, 1965.0), (3, "GOLDEN", 42.17, 1421.7),
+         (4, "Мария", 12.0, 1120.0), (5, "bybit_whale_with_a_very_long_nickname", 3.25, 1032.5),
+         (6, "Иван", 0.0, 1000.0), (7, "shorty", -4.8, 952.0), (8, "x", -17.33, 826.7),
+         (9, "Пётр П.", -51.9, 481.0), (10, "liquidated", -100.0, 0.0)]
+# Путей Монте-Карло меньше, чем в боте: рисунок тот же, кейс быстрее
+_PROJECTION_PATHS = 2000
+_PROJECTION_SEED = 7
+
+
+def cases() -> list[Case]:
+    out = []
+    for exchange in ("bybit", "bingx"):
+        out += [
+            Case(f"trade_{exchange}_long_profit", "trade", exchange, {**_TRADE, "exchange": exchange}, 59.52, 59.5),
+            Case(f"trade_{exchange}_short_loss", "trade", exchange,
+                 {**_TRADE, "exchange": exchange, "symbol": "ETHUSDT", "side": "short", "entry": 2250.5,
+                  "mark": 2301.25, "leverage": 75, "qty": 3.3326, "liquidation": 2270.11,
+                  "price_precision": 2}, -169.12, -169.13),
+            Case(f"trade_{exchange}_long_small_price", "trade", exchange,
+                 {**_TRADE, "exchange": exchange, "symbol": "1000PEPEUSDT", "entry": 0.01234, "mark": 0.011987,
+                  "leverage": 5, "qty": 40519.0, "liquidation": 0.009934}, -14.38, -14.38),
+        ]
+    out += [
+        Case("custom_bybit_long_profit", "custom", "bybit", {**_CUSTOM, "pnl": 12.5, "leverage": "10.0x"}),
+        Case("custom_bybit_long_mid", "custom", "bybit", {**_CUSTOM, "pnl": 62.5}),
+        Case("custom_bybit_long_big", "custom", "bybit", {**_CUSTOM, "pnl": 112.36}),
+        Case("custom_bybit_short_loss", "custom", "bybit",
+             {**_CUSTOM, "symbol": "ETHUSDT", "side": "short", "pnl": -4.25, "entry": 2250.5, "exit": 2269.6}),
+        Case("custom_bingx_long_profit", "custom", "bingx", {**_CUSTOM, "pnl": 112.36, "leverage": "50x"}),
+        Case("custom_bingx_short_loss", "custom", "bingx",
+             {**_CUSTOM, "symbol": "ETHUSDT", "side": "short", "pnl": -4.25, "entry": 2250.5, "exit": 2269.6,
+              "leverage": "20x"}),
+        Case("custom_bingx_bare", "custom", "bingx",
+             {**_CUSTOM, "pnl": 7.1, "leverage": "3x", "referral": "", "datetime_str": ""}),
+    ]
+    out += [
+        Case("anim_trade_bybit_counter", "trade", "bybit", {**_TRADE, "exchange": "bybit"}, 59.52, 59.5,
+             mode="counter"),
+        Case("anim_trade_bingx_replay", "trade", "bingx", {**_TRADE, "exchange": "bingx"}, 59.52, 59.5,
+             mode="replay"),
+        Case("anim_custom_bybit_replay", "custom", "bybit", {**_CUSTOM, "pnl": 62.5}, mode="replay"),
+        Case("anim_custom_bingx_counter", "custom", "bingx", {**_CUSTOM, "pnl": 112.36, "leverage": "50x"},
+             mode="counter"),
+    ]
+    # Графики: символ без тиров в risk_limits — всегда таблица по умолчанию
+    for exchange in ("bybit", "bingx"):
+        out.append(Case(f"scenario_{exchange}_long", "scenario", exchange,
+                        {"exchange": exchange, "symbol": "GOLDENUSDT", "side": "long",
+                         "entry": 42000.0, "amount": 100.0}))
+    out += [
+        Case("scenario_bybit_short_small_price", "scenario", "bybit",
+             {"exchange": "bybit", "symbol": "GOLDENUSDT", "side": "short", "entry": 0.01234, "amount": 250.0}),
+        Case("equity_bybit", "equity", "bybit", {"start": 1000.0, "pnl": _PNL}),
+        Case("equity_bingx", "equity", "bingx", {"start": 1000.0, "pnl": _PNL}),
+        Case("leaderboard_bybit", "leaderboard", "bybit", {"rows": _ROWS, "total": 37}),
+        Case("leaderboard_bingx_short", "leaderboard", "bingx", {"rows": _ROWS[:3], "total": 3}),
+        Case("projection_bybit_parametric", "projection", "bybit",
+             {"balance": 1000.0, "trades": 50, "source": (0.55, 0.02, 0.01, 20, 0.05),
+              "subtitle": "винрейт 55%, плечо 20x, риск 5%, тейк 2% / стоп 1%"}),
+        Case("projection_bingx_bootstrap", "projection", "bingx",
+             {"balance": 1000.0, "trades": 100, "returns": [p / 1000 for p in _PNL],
+              "subtitle": "по 40 сделкам марафона, баланс 1,000.00 USDT"}),
+    ]
+    return out
+
+
+def _rgb(img: Image.Image) -> np.ndarray:
+    return np.asarray(img.convert("RGB"))
+
+
+def draw(case: Case) -> np.ndarray:
+    if case.mode and case.kind == "trade":
+        return _rgb(render._trade_layer(case.data, case.percent, case.pnl_usdt, case.mode)[0])
+    if case.mode:
+        return _rgb(render._custom_layer(case.data, case.exchange, case.mode)[0])
+    if case.kind == "scenario":
+        return _rgb(render.draw_scenario_image(case.data))
+    if case.kind == "equity":
+        stats = trade_stats(case.data["start"], np.array(case.data["pnl"], np.float64))
+        return _rgb(render.draw_equity_image(stats, case.exchange))
+    if case.kind == "leaderboard":
+        return _rgb(render.draw_leaderboard_image(case.data["rows"], case.data["total"], case.exchange))
+    if case.kind == "projection":
+        d = case.data
+        source = parametric_returns(*d["source"]) if "source" in d else np.array(d["returns"], np.float64)
+        result = simulate(d["balance"], d["trades"], source, paths=_PROJECTION_PATHS, seed=_PROJECTION_SEED)
+        return _rgb(render.draw_projection_image(result, d["subtitle"], case.exchange))
+    if case.kind == "trade":
+        return _rgb(render.draw_trade_image(case.data, case.percent, case.percent, case.pnl_usdt))
+    if case.exchange == "bingx":
+        return _rgb(render.draw_custom_bingx_image(case.data))
+    return _rgb(render.draw_custom_bybit_image(case.data))
+
+
+def template(case: Case) -> np.ndarray | None:
+    # None — шаблона нет, эталон целиком
+    if case.kind == "trade":
+        name = "template.png"
+    elif case.kind == "custom":
+        name = f"screenshot_{'long' if float(case.data['pnl']) >= 0 else 'short'}.png"
+    else:
+        return None
+    return _rgb(render._load_template(os.path.join(BASE_DIR, "assets", case.exchange, name)))
+
+
+def layout(case: Case) -> dict:
+    # У графиков координаты в коде render.py, а не в layout
+    if case.kind == "trade":
+        return render.CONFIG.layout[case.exchange]
+    if case.kind == "custom":
+        return render.CONFIG.custom_layout[case.exchange]
+    return {}
+
+
+# =====================================================
+# Эталоны: разница с шаблоном в RGBA, без шаблона — RGB целиком
+# =====================================================
+def save_reference(path: str, img: np.ndarray, base: np.ndarray | None) -> int:
+    if base is None:
+        Image.fromarray(img).save(path, optimize=True)
+        return os.path.getsize(path)
+    changed = (img != base).any(axis=2)
+    delta = np.zeros((*img.shape[:2], 4), np.uint8)
+    delta[changed, :3] = img[changed]
+    delta[changed, 3] = 255
+    Image.fromarray(delta, "RGBA").save(path, optimize=True)
+    return os.path.getsize(path)
+
+
+def load_reference(path: str, base: np.ndarray | None) -> np.ndarray | None:
+    if base is None:
+        with Image.open(path) as f:
+            return np.asarray(f.convert("RGB"))
+    with Image.open(path) as f:
+        delta = np.asarray(f.convert("RGBA"))
+    if delta.shape[:2] != base.shape[:2]:
+        return None
+    ref = base.copy()
+    changed = delta[:, :, 3] > 0
+    ref[changed] = delta[changed, :3]
+    return ref
+
+
+# =====================================================
+# Сравнение
+# =====================================================
+def regions(bad: np.ndarray) -> list[tuple[int, int, int, int, int]]:
+    # Связные (по 8 соседям) группы клеток с отличиями -> (x0, y0, x1, y1, пикселей)
+    h, w = bad.shape
+    th, tw = -(-h // TILE), -(-w // TILE)
+    padded = np.zeros((th * TILE, tw * TILE), bool)
+    padded[:h, :w] = bad
+    counts = padded.reshape(th, TILE, tw, TILE).sum(axis=(1, 3))
+    seen = np.zeros_like(counts, bool)
+    out = []
+    for ty, tx in zip(*np.nonzero(counts)):
+        if seen[ty, tx]:
+            continue
+        seen[ty, tx] = True
+        stack, tiles = [(ty, tx)], []
+        while stack:
+            y, x = stack.pop()
+            tiles.append((y, x))
+            for ny in range(max(y - 1, 0), min(y + 2, th)):
+                for nx in range(max(x - 1, 0), min(x + 2, tw)):
+                    if counts[ny, nx] and not seen[ny, nx]:
+                        seen[ny, nx] = True
+                        stack.append((ny, nx))
+        ys, xs = zip(*tiles)
+        y0, y1, x0, x1 = min(ys) * TILE, (max(ys) + 1) * TILE, min(xs) * TILE, (max(xs) + 1) * TILE
+        # Точная рамка внутри клеток
+        py, px = np.nonzero(bad[y0:y1, x0:x1])
+        out.append((x0 + int(px.min()), y0 + int(py.min()), x0 + int(px.max()) + 1, y0 + int(py.max()) + 1,
+                    int(sum(counts[t] for t in tiles))))
+    return out
+
+
+def blame(box: tuple, layout_cfg: dict, w: int, h: int, pad: int = 16) -> str:
+    # Ключ layout, чья точка привязки внутри региона; иначе зона clear_*,
+    # которая его задевает; иначе ближайшая точка
+    x0, y0, x1, y1 = box[0] - pad, box[1] - pad, box[2] + pad, box[3] + pad
+    inside, cleared, nearest = [], [], None
+    for key, c in layout_cfg.items():
+        if not isinstance(c, dict) or "x" not in c or "y" not in c:
+            continue
+        if key.startswith("clear_"):
+            cx0, cy0 = int(c["x"] * w), int(c["y"] * h)
+            cx1, cy1 = cx0 + int(c["w"] * w), cy0 + int(c["h"] * h)
+            if cx0 < x1 and x0 < cx1 and cy0 < y1 and y0 < cy1:
+                cleared.append(key)
+            continue
+        x, y = int(c["x"] * w) + c.get("dx", 0), int(c["y"] * h) + c.get("dy", 0)
+        if x0 <= x <= x1 and y0 <= y <= y1:
+            inside.append(key)
+            continue
+        distance = max(x0 - x, x - x1, 0) + max(y0 - y, y - y1, 0)
+        if nearest is None or distance < nearest[0]:
+            nearest = (distance, key)
+    if inside or cleared:
+        return ", ".join(inside or cleared)
+    return f"~{nearest[1]} ({nearest[0]} px)" if nearest else "region"
+
+
+def estimate_shift(ref: np.ndarray, new: np.ndarray, box: tuple) -> tuple[int, int] | None:
+    # Сдвиг (dx, dy), при котором эталон лучше всего совпадает с новой картинкой
+    x0, y0, x1, y1 = box[:4]
+    h, w = new.shape[:2]
+    x0, y0 = max(x0, MAX_SHIFT), max(y0, MAX_SHIFT)
+    x1, y1 = min(x1, w - MAX_SHIFT), min(y1, h - MAX_SHIFT)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    gray_new = new[y0:y1, x0:x1].astype(np.int16).sum(axis=2)
+    gray_ref = ref[y0 - MAX_SHIFT:y1 + MAX_SHIFT, x0 - MAX_SHIFT:x1 + MAX_SHIFT].astype(np.int16).sum(axis=2)
+    bh, bw = gray_new.shape
+    best, best_error = None, None
+    for dy in range(-MAX_SHIFT, MAX_SHIFT + 1):
+        rows = gray_ref[MAX_SHIFT - dy:MAX_SHIFT - dy + bh]
+        for dx in range(-MAX_SHIFT, MAX_SHIFT + 1):
+            error = np.abs(rows[:, MAX_SHIFT - dx:MAX_SHIFT - dx + bw] - gray_new).mean()
+            if best_error is None or error < best_error:
+                best, best_error = (dx, dy), error
+    still = np.abs(gray_ref[MAX_SHIFT:MAX_SHIFT + bh, MAX_SHIFT:MAX_SHIFT + bw] - gray_new).mean()
+    # Сдвиг засчитываем, только если он объясняет почти всё отличие
+    return best if best != (0, 0) and best_error < still * 0.25 else None
+
+
+def pixel_diff(ref: np.ndarray, new: np.ndarray) -> np.ndarray:
+    # max |разница| по каналам без перехода в int16: max - min в uint8
+    d = np.maximum(ref, new) - np.minimum(ref, new)
+    return np.maximum(np.maximum(d[:, :, 0], d[:, :, 1]), d[:, :, 2])
+
+
+def heatmap(ref: np.ndarray, new: np.ndarray, diff: np.ndarray, failed: list[tuple]) -> Image.Image:
+    # Новый рендер приглушённым серым, отличия — красным, провалившиеся регионы в рамке
+    gray = new.astype(np.float32).mean(axis=2, keepdims=True) * 0.35
+    heat = np.clip(diff.astype(np.float32) * 4, 0, 255)[:, :, None]
+    out = np.concatenate([np.maximum(gray, heat), gray, gray], axis=2).astype(np.uint8)
+    img = Image.fromarray(out)
+    d = ImageDraw.Draw(img)
+    for box, label in failed:
+        d.rectangle(box[:4], outline=(255, 220, 0), width=2)
+        d.text((box[0], max(box[1] - 14, 0)), label, fill=(255, 220, 0))
+    return img
+
+
+def check(case: Case, args) -> tuple[bool, list[str]]:
+    new = draw(case)
+    base = template(case)
+    path = os.path.join(GOLDEN_DIR, f"{case.name}.png")
+    if args.update:
+        size = save_reference(path, new, base)
+        return True, [f"written, {size / 1024:.0f} KB"]
+    if not os.path.exists(path):
+        return False, ["no reference (run with --update)"]
+    ref = load_reference(path, base)
+    if ref is None or ref.shape != new.shape:
+        return False, [f"size changed: {new.shape[1]}x{new.shape[0]}"]
+    if np.array_equal(ref, new):
+        return True, []
+    diff = pixel_diff(ref, new)
+    bad = diff > args.tolerance
+    if not bad.any():
+        return True, []
+    h, w = bad.shape
+    failed, notes = [], []
+    for region in regions(bad):
+        if region[4] <= args.max_pixels:
+            continue
+        key = blame(region, layout(case), w, h)
+        shift = estimate_shift(ref, new, region)
+        moved = f", moved {shift[0]:+d},{shift[1]:+d} px" if shift else ""
+        failed.append((region, key))
+        notes.append(f"{key}: {region[4]} px in x {region[0]}..{region[2]}, y {region[1]}..{region[3]}{moved}")
+    if not failed:
+        return True, [f"{int(bad.sum())} px within tolerance"]
+    os.makedirs(args.diff_dir, exist_ok=True)
+    # Отладочные файлы — быстрое сжатие, размер не важен
+    heatmap(ref, new, diff, failed).save(os.path.join(args.diff_dir, f"{case.name}.png"), compress_level=1)
+    Image.fromarray(new).save(os.path.join(args.diff_dir, f"{case.name}.actual.png"), compress_level=1)
+    return False, notes
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Эталонные картинки карточек")
+    parser.add_argument("--update", action="store_true", help="переписать эталоны текущим рендером")
+    parser.add_argument("--only", default="", help="подстрока имени кейса")
+    parser.add_argument("--tolerance", type=int, default=16, help="допуск на канал, 0..255")
+    parser.add_argument("--max-pixels", type=int, default=24, help="допустимо отличий на регион")
+    parser.add_argument("--diff-dir", default=os.path.join(GOLDEN_DIR, "diff"))
+    return parser.parse_args(argv)
+
+
+def run(args) -> int:
+    # Иконки монет — только из репозитория: кэш скачанных иконок не влияет на рендер
+    render.COIN_ICONS = CoinIcons(os.path.join(GOLDEN_DIR, "no_icons"), os.path.join(GOLDEN_DIR, "no_icons"))
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    start = time.perf_counter()
+    failures = 0
+    selected = [case for case in cases() if args.only in case.name]
+    for case in selected:
+        began = time.perf_counter()
+        ok, notes = check(case, args)
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {case.name:<32} {(time.perf_counter() - began) * 1000:5.0f} ms"
+              + (f"  {notes[0]}" if notes else ""))
+        for note in notes[1:]:
+            print(f"     {'':<32}          {note}")
+    print(f"{len(selected)} cases, {failures} failed, {time.perf_counter() - start:.2f} s"
+          + (f"; heatmaps in {args.diff_dir}" if failures and not args.update else ""))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
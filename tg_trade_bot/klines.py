@@ -0,0 +1,313 @@
+# klines.py
+#
+# Локальное хранилище свечей для кастомных карточек: вход и выход по истории
+# биржи за указанное время вместо ручного ввода.
+#
+# Один файл на (биржа, символ, интервал): cache/klines/<exchange>/<SYMBOL>_<interval>.bin —
+# плоский массив записей KLINE_DTYPE, отсортированный по ts (время открытия
+# свечи, мс UTC). Читается через np.memmap: в память попадают только
+# страницы, которых касается бинарный поиск. Новые свечи дописываются в
+# конец файла; более ранние (запрос в прошлое) — слиянием и атомарной
+# перезаписью. Незакрытая свеча не сохраняется.
+#
+# Какие свечи докачать, решает missing(): ожидаемая сетка интервала против
+# того, что уже есть на диске, — повторный запрос того же диапазона в сеть
+# не ходит. Диапазоны, которые биржа уже отдала целиком (даже пустыми — до
+# листинга монеты, простой биржи), пишутся в <SYMBOL>_<interval>.fetched
+# рядом с .bin парами int64 (от, до) и тоже не считаются пропуском. Сетевой обход страниц — в main.py (async_fetch_klines), разбор
+# ответов бирж — здесь.
+
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+log = logging.getLogger("tg_trade_bot.klines")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+KLINE_DTYPE = np.dtype([
+    ("ts", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+])
+
+# Интервал -> длина в секундах; от мелкого к крупному
+INTERVALS = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "4h": 14400, "1d": 86400}
+BYBIT_INTERVALS = {"1m": "1", "5m": "5", "15m": "15", "1h": "60", "4h": "240", "1d": "D"}
+PAGE_LIMIT = {"bybit": 1000, "bingx": 1440}
+# Потолок свечей на один диапазон: интервал берётся самый мелкий, что влезает
+MAX_CANDLES = 5000
+
+
+def interval_ms(interval: str) -> int:
+    return INTERVALS[interval] * 1000
+
+
+def pick_interval(start_ms: int, end_ms: int, max_candles: int = MAX_CANDLES) -> str:
+    span = max(end_ms - start_ms, 0)
+    for interval, seconds in INTERVALS.items():
+        if span // (seconds * 1000) + 1 <= max_candles:
+            return interval
+    return "1d"
+
+
+def _sorted_unique(rows: np.ndarray) -> np.ndarray:
+    _, first = np.unique(rows["ts"], return_index=True)
+    return rows[first]
+
+
+def parse_bybit_klines(rows: list) -> np.ndarray:
+    # /v5/market/kline: [startTime, open, high, low, close, volume, turnover], новые первыми
+    out = np.empty(len(rows), KLINE_DTYPE)
+    for i, row in enumerate(rows):
+        out[i] = (int(row[0]), float(row[1]), float(row[2]), float(row[3]), float(row[4]))
+    return _sorted_unique(out)
+
+
+def parse_bingx_klines(rows: list) -> np.ndarray:
+    # /openApi/swap/v3/quote/klines: {"open", "close", "high", "low", "volume", "time"}
+    out = np.empty(len(rows), KLINE_DTYPE)
+    for i, row in enumerate(rows):
+        out[i] = (int(row["time"]), float(row["open"]), float(row["high"]),
+                  float(row["low"]), float(row["close"]))
+    return _sorted_unique(out)
+
+
+# =====================================================
+# Разбор «14/02 19:00 - 14/02 23:30»
+# =====================================================
+_MOMENT = re.compile(
+    r"^(?:(?:(?P<y>\d{4})-(?P<m1>\d{1,2})-(?P<d1>\d{1,2})|(?P<d2>\d{1,2})[./](?P<m2>\d{1,2}))\s+)?"
+    r"(?P<H>\d{1,2}):(?P<M>\d{2})$"
+)
+
+
+def _moment(text: str, base: datetime | None, now: datetime) -> datetime:
+    match = _MOMENT.match(text.strip())
+    if match is None:
+        raise ValueError(text)
+    g = match.groupdict()
+    if g["d1"]:
+        day = datetime(int(g["y"]), int(g["m1"]), int(g["d1"]), tzinfo=now.tzinfo)
+    elif g["d2"]:
+        day = datetime(now.year, int(g["m2"]), int(g["d2"]), tzinfo=now.tzinfo)
+        if day > now:
+            # «31/12» в январе — это прошлый год
+            day = day.replace(year=now.year - 1)
+    elif base is not None:
+        day = base.replace(hour=0, minute=0)
+    else:
+        # Только время — сегодня, а если оно ещё не наступило, то вчера
+        moment = now.replace(hour=int(g["H"]), minute=int(g["M"]), second=0, microsecond=0)
+        return moment if moment <= now else moment - timedelta(days=1)
+    return day.replace(hour=int(g["H"]), minute=int(g["M"]))
+
+
+def parse_time_range(text: str, utc_offset_hours: float = 0.0,
+                     now: datetime | None = None) -> tuple[int, int]:
+    # «ДД/ММ ЧЧ:ММ - ДД/ММ ЧЧ:ММ», «ДД.ММ ЧЧ:ММ - ЧЧ:ММ» (тот же день),
+    # «ЧЧ:ММ - ЧЧ:ММ» (за последние сутки) или «ГГГГ-ММ-ДД ЧЧ:ММ - ...»
+    # в часовом поясе UTC+offset -> (start, end) в мс UTC
+    tz = timezone(timedelta(hours=utc_offset_hours))
+    now = (now or datetime.now(tz)).astimezone(tz)
+    parts = re.split(r"\s+(?:-|—|–)\s+", text.strip())
+    if len(parts) != 2:
+        raise ValueError(text)
+    start = _moment(parts[0], None, now)
+    end = _moment(parts[1], start, now)
+    if end <= start:
+        if len(parts[1].strip()) <= 5:
+            # «23:30 - 01:15» — выход на следующий день
+            end += timedelta(days=1)
+        else:
+            raise ValueError(text)
+    if end > now:
+        raise ValueError(text)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+# =====================================================
+# Хранилище
+# =====================================================
+class KlineStore:
+    def __init__(self, root: str):
+        self.root = root
+        # (exchange, symbol, interval) -> memmap (или пустой массив)
+        self._maps: dict[tuple[str, str, str], np.ndarray] = {}
+        # (exchange, symbol, interval) -> скачанные диапазоны, N×2 по возрастанию
+        self._fetched: dict[tuple[str, str, str], np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "KlineStore":
+        return cls(os.getenv("KLINES_DIR", os.path.join(BASE_DIR, "cache", "klines")))
+
+    def path(self, exchange: str, symbol: str, interval: str) -> str:
+        return os.path.join(self.root, exchange, f"{symbol.upper()}_{interval}.bin")
+
+    def _open(self, key: tuple[str, str, str]) -> np.ndarray:
+        path = self.path(*key)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        # Хвост от оборванной записи (не кратный записи) отбрасываем
+        count = size // KLINE_DTYPE.itemsize
+        if not count:
+            return np.empty(0, KLINE_DTYPE)
+        return np.memmap(path, dtype=KLINE_DTYPE, mode="r", shape=(count,))
+
+    def candles(self, exchange: str, symbol: str, interval: str) -> np.ndarray:
+        key = (exchange, symbol.upper(), interval)
+        candles = self._maps.get(key)
+        if candles is None:
+            with self._lock:
+                candles = self._maps.get(key)
+                if candles is None:
+                    candles = self._maps[key] = self._open(key)
+        return candles
+
+    def window(self, exchange: str, symbol: str, interval: str, start_ms: int, end_ms: int) -> np.ndarray:
+        # Свечи, открытые в [start, end]: два бинарных поиска по memmap, без копии
+        candles = self.candles(exchange, symbol, interval)
+        ts = candles["ts"]
+        lo = int(np.searchsorted(ts, start_ms - start_ms % interval_ms(interval), "left"))
+        hi = int(np.searchsorted(ts, end_ms, "right"))
+        return candles[lo:hi]
+
+    def _open_fetched(self, key: tuple[str, str, str]) -> np.ndarray:
+        try:
+            ranges = np.fromfile(self.path(*key) + ".fetched", dtype="<i8")
+        except OSError:
+            return np.empty((0, 2), np.int64)
+        return ranges[:len(ranges) // 2 * 2].reshape(-1, 2)
+
+    def fetched(self, exchange: str, symbol: str, interval: str) -> np.ndarray:
+        key = (exchange, symbol.upper(), interval)
+        ranges = self._fetched.get(key)
+        if ranges is None:
+            with self._lock:
+                ranges = self._fetched.get(key)
+                if ranges is None:
+                    ranges = self._fetched[key] = self._open_fetched(key)
+        return ranges
+
+    def mark_fetched(self, exchange: str, symbol: str, interval: str, start_ms: int, end_ms: int,
+                     now_ms: int | None = None) -> None:
+        # Биржа отдала диапазон открытий [start, end] целиком: чего в нём нет на
+        # диске, того нет и у биржи. Последние свечи не помечаем — биржа может
+        # опубликовать только что закрытую свечу с задержкой
+        step = interval_ms(interval)
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        start_ms -= start_ms % step
+        end_ms = min(end_ms - end_ms % step, now_ms - now_ms % step - 3 * step)
+        if end_ms < start_ms:
+            return
+        key = (exchange, symbol.upper(), interval)
+        path = self.path(*key) + ".fetched"
+        with self._lock:
+            ranges = self._fetched.get(key)
+            if ranges is None:
+                ranges = self._open_fetched(key)
+            ranges = np.vstack((ranges, [[start_ms, end_ms]]))
+            ranges = ranges[np.argsort(ranges[:, 0], kind="stable")]
+            # Склеиваем перекрывающиеся и соседние (через одну свечу) диапазоны
+            merged = [list(ranges[0])]
+            for lo, hi in ranges[1:].tolist():
+                if lo <= merged[-1][1] + step:
+                    merged[-1][1] = max(merged[-1][1], hi)
+                else:
+                    merged.append([lo, hi])
+            ranges = np.array(merged, dtype=np.int64).reshape(-1, 2)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                ranges.astype("<i8").tofile(path + ".tmp")
+                os.replace(path + ".tmp", path)
+            except OSError:
+                log.warning("kline store write failed", exc_info=True, extra={"fields": {"path": path}})
+            self._fetched[key] = ranges
+
+    def missing(self, exchange: str, symbol: str, interval: str, start_ms: int,
+                end_ms: int, now_ms: int | None = None) -> list[tuple[int, int]]:
+        # Диапазоны открытий свечей, которых нет на диске (только закрытые свечи)
+        step = interval_ms(interval)
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        first = start_ms - start_ms % step
+        last = min(end_ms - end_ms % step, now_ms - now_ms % step - step)
+        if last < first:
+            return []
+        have = self.window(exchange, symbol, interval, first, last)["ts"]
+        expected = (last - first) // step + 1
+        if len(have) == expected:
+            return []
+        grid = np.arange(first, last + step, step, dtype=np.int64)
+        absent = grid[~np.isin(grid, have)]
+        ranges = self.fetched(exchange, symbol, interval)
+        if len(ranges):
+            # Уже скачанное, но пустое у биржи — не пропуск
+            i = np.searchsorted(ranges[:, 0], absent, "right") - 1
+            covered = (i >= 0) & (absent <= ranges[np.maximum(i, 0), 1])
+            absent = absent[~covered]
+            if not len(absent):
+                return []
+        # Склеиваем подряд идущие пропуски в диапазоны
+        breaks = np.flatnonzero(np.diff(absent) != step)
+        starts = np.concatenate(([0], breaks + 1))
+        ends = np.concatenate((breaks, [len(absent) - 1]))
+        return [(int(absent[s]), int(absent[e])) for s, e in zip(starts, ends)]
+
+    def merge(self, exchange: str, symbol: str, interval: str, rows: np.ndarray,
+              now_ms: int | None = None) -> int:
+        # Дописать свечи; возвращает, сколько новых легло на диск
+        step = interval_ms(interval)
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        rows = _sorted_unique(rows[rows["ts"] + step <= now_ms].astype(KLINE_DTYPE))
+        if not len(rows):
+            return 0
+        key = (exchange, symbol.upper(), interval)
+        path = self.path(*key)
+        with self._lock:
+            current = self._maps.get(key)
+            if current is None:
+                current = self._open(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if not len(current) or rows["ts"][0] > current["ts"][-1]:
+                    # Обычный случай — только новее хвоста: дописываем в конец
+                    added = len(rows)
+                    with open(path, "r+b" if len(current) else "wb") as f:
+                        f.seek(len(current) * KLINE_DTYPE.itemsize)
+                        f.truncate()
+                        f.write(rows.tobytes())
+                else:
+                    merged = _sorted_unique(np.concatenate((np.asarray(current), rows)))
+                    added = len(merged) - len(current)
+                    if not added:
+                        return 0
+                    with open(path + ".tmp", "wb") as f:
+                        f.write(merged.tobytes())
+                    os.replace(path + ".tmp", path)
+            except OSError:
+                log.warning("kline store write failed", exc_info=True, extra={"fields": {"path": path}})
+                return 0
+            # Старый memmap остаётся валидным для тех, кто его уже держит
+            self._maps[key] = self._open(key)
+        return added
+
+    def price_at(self, exchange: str, symbol: str, interval: str, ts_ms: int) -> float | None:
+        # Открытие свечи, в которую попадает момент; если свечи нет (пропуск
+        # у биржи) — закрытие последней свечи до него
+        candles = self.candles(exchange, symbol, interval)
+        i = int(np.searchsorted(candles["ts"], ts_ms, "right")) - 1
+        if i < 0:
+            return None
+        candle = candles[i]
+        if ts_ms < candle["ts"] + interval_ms(interval):
+            return float(candle["open"])
+        return float(candle["close"])
+
+
+KLINES = KlineStore.from_env()
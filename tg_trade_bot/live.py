@@ -0,0 +1,230 @@
+# live.py
+#
+# Живые карточки позиции: карточка из get_leverage остаётся «открытой» и
+# перерисовывается с текущей марк-ценой через editMessageMedia.
+#
+#   - цена опрашивается один раз на (биржа, символ) за тик, и этот тик
+#     расходится по всем подписанным карточкам символа;
+#   - карточка ставится в очередь, только если меняется строка PnL в том виде,
+#     в каком она нарисована (format_pnl: центы и сотые процента);
+#   - очередь коалесцирует: пока карточка ждёт своей правки, новая цена
+#     заменяет старую на месте, второй правки не появляется;
+#   - правки идут через общий token bucket — глобальный бюджет в секунду на
+#     все боты; RetryAfter от Telegram ставит bucket на паузу.
+#
+# aiogram здесь не нужен: рендер и editMessageMedia делает колбэк edit из
+# main.py. Он возвращает True (готово), False (сообщения больше нет —
+# отписать) или число секунд RetryAfter (повторить после паузы).
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from calc import calculate_pnl_linear, format_pnl
+
+log = logging.getLogger("tg_trade_bot.live")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._paused_until = 0.0
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        # Flood control: весь бюджет ждёт, накопленные токены сгорают
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+
+class LiveCard:
+    __slots__ = ("key", "bot", "data", "shown", "expires")
+
+    def __init__(self, key: tuple[int, int, int], bot, data: dict, shown: str, expires: float):
+        self.key = key  # (bot_id, chat_id, message_id)
+        self.bot = bot
+        self.data = data  # карточка из build_trade_card: qty и leverage уже посчитаны
+        self.shown = shown  # строка PnL, которая сейчас на картинке
+        self.expires = expires
+
+    @property
+    def symbol_key(self) -> tuple[str, str]:
+        return self.data["exchange"], self.data["symbol"]
+
+    def snapshot(self, mark: float) -> tuple[dict, float, float]:
+        # (данные карточки, PnL %, PnL USDT) — как build_trade_card, но с новым марком
+        d = self.data
+        pnl_usdt, _, percent = calculate_pnl_linear(d["entry"], mark, d["qty"], d["side"], d["leverage"])
+        return {**d, "mark": mark}, percent, pnl_usdt
+
+    def text(self, mark: float) -> str:
+        # Горячий путь on_price: без копии data, только строка PnL
+        d = self.data
+        pnl_usdt, _, percent = calculate_pnl_linear(d["entry"], mark, d["qty"], d["side"], d["leverage"])
+        return format_pnl(percent, pnl_usdt)
+
+
+class LiveCards:
+    def __init__(self, fetch_price, edit, interval: float = 10.0, edits_per_second: float = 20.0,
+                 ttl: float = 1800.0, per_chat: int = 3):
+        self.fetch_price = fetch_price  # async (exchange, symbol) -> float | None
+        self.edit = edit  # async (card, data, percent, pnl_usdt) -> True | False | retry_after
+        self.interval = interval
+        self.ttl = ttl
+        self.per_chat = per_chat
+        self.bucket = TokenBucket(edits_per_second)
+        self._cards: dict[tuple[int, int, int], LiveCard] = {}
+        self._by_symbol: dict[tuple[str, str], dict[tuple[int, int, int], None]] = {}
+        self._per_chat: dict[tuple[int, int], int] = {}
+        # key -> последняя марк-цена; порядок — порядок постановки в очередь
+        self._pending: OrderedDict[tuple[int, int, int], float] = OrderedDict()
+        self._wakeup: asyncio.Event | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    def __len__(self) -> int:
+        return len(self._cards)
+
+    def __contains__(self, key) -> bool:
+        return key in self._cards
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def symbols(self) -> int:
+        return len(self._by_symbol)
+
+    def subscribe(self, bot, chat_id: int, message_id: int, data: dict, percent: float,
+                  pnl_usdt: float) -> bool:
+        key = (bot.id, chat_id, message_id)
+        if key in self._cards:
+            self._cards[key].expires = time.monotonic() + self.ttl
+            return True
+        chat = key[:2]
+        if self._per_chat.get(chat, 0) >= self.per_chat:
+            return False
+        card = LiveCard(key, bot, data, format_pnl(percent, pnl_usdt), time.monotonic() + self.ttl)
+        self._cards[key] = card
+        self._by_symbol.setdefault(card.symbol_key, {})[key] = None
+        self._per_chat[chat] = self._per_chat.get(chat, 0) + 1
+        return True
+
+    def unsubscribe(self, key: tuple[int, int, int]) -> LiveCard | None:
+        card = self._cards.pop(key, None)
+        if card is None:
+            return None
+        self._pending.pop(key, None)
+        cards = self._by_symbol.get(card.symbol_key)
+        if cards is not None:
+            cards.pop(key, None)
+            if not cards:
+                del self._by_symbol[card.symbol_key]
+        chat = key[:2]
+        left = self._per_chat.get(chat, 1) - 1
+        if left:
+            self._per_chat[chat] = left
+        else:
+            self._per_chat.pop(chat, None)
+        return card
+
+    def on_price(self, exchange: str, symbol: str, mark: float) -> int:
+        # Один тик цены -> все карточки символа; возвращает, сколько в очереди на правку
+        queued = 0
+        for key in self._by_symbol.get((exchange, symbol), ()):
+            card = self._cards[key]
+            if card.text(mark) == card.shown:
+                # Цена вернулась к нарисованному PnL — ждущая правка больше не нужна
+                self._pending.pop(key, None)
+                continue
+            self._pending[key] = mark
+            queued += 1
+        if queued and self._wakeup is not None:
+            self._wakeup.set()
+        return queued
+
+    def expire(self) -> int:
+        now = time.monotonic()
+        stale = [key for key, card in self._cards.items() if card.expires <= now]
+        for key in stale:
+            self.unsubscribe(key)
+        return len(stale)
+
+    async def poll(self) -> None:
+        # Один запрос цены на символ, сколько бы карточек на нём ни висело
+        symbols = list(self._by_symbol)
+        prices = await asyncio.gather(*(self.fetch_price(ex, sym) for ex, sym in symbols))
+        for (exchange, symbol), price in zip(symbols, prices):
+            if price is not None:
+                self.on_price(exchange, symbol, price)
+
+    async def _poll_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.expire()
+                if self._by_symbol:
+                    await self.poll()
+            except Exception:
+                log.warning("live price poll failed", exc_info=True)
+
+    async def _edit_loop(self) -> None:
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self.bucket.acquire()
+            if not self._pending:
+                continue
+            key, mark = self._pending.popitem(last=False)
+            card = self._cards.get(key)
+            if card is None:
+                continue
+            data, percent, pnl_usdt = card.snapshot(mark)
+            shown = card.shown
+            # Сразу считаем новую строку нарисованной: тик во время правки
+            # с тем же PnL не поставит карточку в очередь второй раз
+            card.shown = format_pnl(percent, pnl_usdt)
+            try:
+                result = await self.edit(card, data, percent, pnl_usdt)
+            except Exception:
+                log.warning("live card edit failed", exc_info=True)
+                result = True
+                card.shown = shown
+            if result is False:
+                self.unsubscribe(key)
+            elif result is not True:
+                card.shown = shown
+                self.bucket.pause(float(result))
+                if key in self._cards and key not in self._pending:
+                    # Назад в голову очереди: эта карточка ждала дольше остальных
+                    self._pending[key] = mark
+                    self._pending.move_to_end(key, last=False)
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._poll_loop()),
+            asyncio.create_task(self._edit_loop()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -1,65 +1,223 @@
 import asyncio
+import logging
 import os
 import time
-import uuid
-import functools
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from cachetools import TTLCache
 import aiohttp
+from aiohttp import web
 
 from aiogram import Bot, Dispatcher, F
-from aiogram.filters import Command
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.filters import Command, CommandObject
 from aiogram.types import (
     Message,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
     CallbackQuery,
     FSInputFile,
+    BufferedInputFile,
+    InputMediaPhoto,
 )
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from PIL import Image, ImageDraw, ImageFont
 
-from configs.fonts import FONTS
-from configs.layout import LAYOUT, BYBIT_CUSTOM_LAYOUT
-from utils.draw_text import draw_text
+from alerts import KINDS as ALERT_KINDS, AlertEngine
+from calc import (
+    build_custom_card,
+    build_trade_card,
+    calculate_cost,
+    calculate_liquidation,
+    calculate_pnl_linear,
+    calculate_qty,
+    format_pnl,
+    format_price,
+)
+from klines import (
+    BYBIT_INTERVALS,
+    KLINES,
+    PAGE_LIMIT,
+    interval_ms,
+    parse_bingx_klines,
+    parse_bybit_klines,
+    parse_time_range,
+    pick_interval,
+)
+from live import LiveCards
+from marathon import Leaderboard, Marathon
+from projection import (
+    DEFAULT_TRADES,
+    MAX_TRADES,
+    MIN_REALIZED,
+    parametric_returns,
+    realized_returns,
+    simulate,
+)
+from risk_limits import MARGIN_MODES, RISK_LIMITS, parse_bybit
+from render import (
+    COIN_ICONS,
+    _load_font,
+    _load_icon,
+    _load_template,
+    animate_custom_card,
+    animate_trade_card,
+    apply_changes,
+    encode_trade_image,
+    generate_custom_bingx_image,
+    generate_custom_bybit_image,
+    generate_equity_image,
+    generate_leaderboard_image,
+    generate_projection_image,
+    generate_scenario_image,
+    generate_trade_image,
+    make_watcher,
+    warmup_jobs,
+)
+from utils.cleanup import MessageCleaner
+from utils.coin_icons import base_asset
+from utils.logs import setup_logging
+from utils.metrics import Registry, UpdateMetricsMiddleware, start_metrics_server
+from utils.profiling import Profiler
+from utils.routing import CallbackRouter
+from utils.tracing import (
+    Tracer,
+    TracedStorage,
+    TracingMiddleware,
+    TracingRequestMiddleware,
+    record_span,
+    span,
+)
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+log = logging.getLogger("tg_trade_bot")
 
 # =====================================================
 # ThreadPool для CPU-heavy задач (PIL рендеринг)
 # =====================================================
 _THREAD_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
 
+PROFILER = Profiler()
+
+def _timed_call(func, args):
+    started = time.perf_counter()
+    result = PROFILER.call(func, args) if PROFILER.active else func(*args)
+    return started, time.perf_counter(), result
+
+# Задачи, отправленные в пул и ещё не вернувшиеся (в очереди + в работе)
+_RENDER_INFLIGHT = 0
+
+async def run_render(func, *args):
+    # Рендер в пуле потоков; время ожидания свободного потока и самого
+    # рендера пишутся в трейс апдейта и в метрики отдельно
+    global _RENDER_INFLIGHT
+    submitted = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    _RENDER_INFLIGHT += 1
+    try:
+        started, finished, result = await loop.run_in_executor(_THREAD_POOL, _timed_call, func, args)
+    finally:
+        _RENDER_INFLIGHT -= 1
+    record_span("render_queue", submitted, started - submitted)
+    record_span("render", started, finished - started)
+    RENDER_QUEUE_SECONDS.observe(started - submitted, func.__name__)
+    RENDER_SECONDS.observe(finished - started, func.__name__)
+    return result
+
 # =====================================================
 # Кэш для цен и точности (TTL 10 сек для цены, 1 час для precision)
 # =====================================================
 _PRICE_CACHE: TTLCache = TTLCache(maxsize=512, ttl=10)
 _PRECISION_CACHE: TTLCache = TTLCache(maxsize=512, ttl=3600)
+# cache -> [hits, misses]
+_CACHE_STATS: dict[str, list[int]] = {"price": [0, 0], "precision": [0, 0], "klines": [0, 0]}
 
 # =====================================================
-# Кэш шрифтов — шрифты грузятся один раз
+# МЕТРИКИ (/metrics в формате Prometheus на METRICS_HOST, по умолчанию
+# 127.0.0.1; METRICS_PORT=0 — выключить)
 # =====================================================
-@functools.lru_cache(maxsize=64)
-def _load_font(path: str, size: int) -> ImageFont.FreeTypeFont:
-    return ImageFont.truetype(path, size)
+METRICS = Registry()
+RENDER_SECONDS = METRICS.histogram(
+    "render_duration_seconds", "Render time per card generator", ("generator",)
+)
+RENDER_QUEUE_SECONDS = METRICS.histogram(
+    "render_queue_wait_seconds", "Wait for a free render thread", ("generator",)
+)
+HTTP_SECONDS = METRICS.histogram(
+    "exchange_http_duration_seconds", "Exchange API request latency", ("exchange", "endpoint")
+)
+HTTP_ERRORS = METRICS.counter(
+    "exchange_http_errors_total", "Failed exchange API lookups", ("exchange", "endpoint")
+)
+UPDATE_SECONDS = METRICS.histogram(
+    "update_duration_seconds", "Update handling time per FSM state", ("type", "state")
+)
+ASSET_RELOADS = METRICS.counter(
+    "asset_reloads_total", "Hot-reloaded assets and configs", ("kind",)
+)
+ANIMATIONS = METRICS.counter(
+    "card_animations_total", "Animated cards rendered", ("format", "truncated")
+)
+ALERTS_FIRED = METRICS.counter(
+    "price_alerts_fired_total", "Price alerts triggered by mark price", ("kind",)
+)
+LIVE_EDITS = METRICS.counter(
+    "live_card_edits_total", "Live card re-renders sent via editMessageMedia", ("result",)
+)
 
-# =====================================================
-# Кэш шаблонов — изображения грузятся один раз
-# =====================================================
-@functools.lru_cache(maxsize=16)
-def _load_template(path: str) -> Image.Image:
-    return Image.open(path).convert("RGBA")
+_LRU_CACHES = {
+    "font": _load_font, "template": _load_template, "icon": _load_icon, "coin_icon": COIN_ICONS,
+}
+_TTL_CACHES = {"price": _PRICE_CACHE, "precision": _PRECISION_CACHE}
+
+def _cache_requests():
+    for name, (hits, misses) in _CACHE_STATS.items():
+        yield (name, "hit"), hits
+        yield (name, "miss"), misses
+    for name, loader in _LRU_CACHES.items():
+        info = loader.cache_info()
+        yield (name, "hit"), info.hits
+        yield (name, "miss"), info.misses
+
+def _cache_sizes():
+    for name, cache in _TTL_CACHES.items():
+        yield (name,), len(cache)
+    for name, loader in _LRU_CACHES.items():
+        yield (name,), loader.cache_info().currsize
+
+def _cache_hit_ratio():
+    totals: dict[str, list[int]] = {}
+    for (name, result), value in _cache_requests():
+        totals.setdefault(name, [0, 0])[result == "miss"] += value
+    for name, (hits, misses) in totals.items():
+        yield (name,), hits / (hits + misses) if hits + misses else 0.0
+
+METRICS.counter("cache_requests_total", "Cache lookups", ("cache", "result"), collect=_cache_requests)
+METRICS.gauge("cache_size", "Entries currently cached", ("cache",), collect=_cache_sizes)
+METRICS.gauge("cache_hit_ratio", "Hits / lookups since start", ("cache",), collect=_cache_hit_ratio)
+METRICS.gauge(
+    "render_pool_queue_depth", "Render tasks waiting for a thread",
+    collect=lambda: [((), _THREAD_POOL._work_queue.qsize())],
+)
+METRICS.gauge(
+    "render_pool_active_workers", "Render threads busy right now",
+    collect=lambda: [((), max(0, _RENDER_INFLIGHT - _THREAD_POOL._work_queue.qsize()))],
+)
+METRICS.gauge(
+    "render_pool_threads", "Render threads started",
+    collect=lambda: [((), len(_THREAD_POOL._threads))],
+)
 
-# =====================================================
-# Кэш иконок
-# =====================================================
-@functools.lru_cache(maxsize=32)
-def _load_icon(path: str, size: int) -> Image.Image:
-    icon = Image.open(path).convert("RGBA")
-    return icon.resize((size, size), Image.LANCZOS)
+@contextmanager
+def exchange_request(exchange: str, endpoint: str):
+    start = time.perf_counter()
+    with span(f"http:{exchange}"):
+        try:
+            yield
+        finally:
+            HTTP_SECONDS.observe(time.perf_counter() - start, exchange, endpoint)
 
 # =====================================================
 # FSM
@@ -73,6 +231,7 @@ class CustomExchange(StatesGroup):
     leverage = State()
     referral = State()
     datetime_str = State()
+    history = State()
 
 class TradeForm(StatesGroup):
     exchange = State()
@@ -87,27 +246,85 @@ class TradeForm(StatesGroup):
 class MarathonStatesGroup(StatesGroup):
     start_deposit = State()
 
-BASE_H = 467
+class AlertForm(StatesGroup):
+    levels = State()
 
-def scale_font(size: int, img_h: int) -> int:
-    return max(10, int(size * img_h / BASE_H))
-
-def px(val: float, size: int) -> int:
-    return int(val * size)
+# =====================================================
+# BOT: один процесс может обслуживать несколько токенов (white-label).
+# Все боты делят dp, пул рендера, кэши шаблонов/шрифтов и рыночных данных;
+# FSM-ключи в storage уже содержат bot_id, так что состояния не пересекаются.
+# =====================================================
+def get_bot_tokens() -> list[str]:
+    raw = os.getenv("BOT_TOKENS") or os.getenv("BOT_TOKEN") or ""
+    tokens = [token.strip() for token in raw.split(",") if token.strip()]
+    if not tokens:
+        raise RuntimeError("BOT_TOKEN is not set")
+    return tokens
+
+def create_bots(tokens: list[str], session: AiohttpSession | None = None) -> list[Bot]:
+    # Одна HTTP-сессия к Bot API на все токены — общий пул соединений
+    session = session or AiohttpSession()
+    session.middleware(TracingRequestMiddleware())
+    return [Bot(token=token, session=session) for token in tokens]
 
 # =====================================================
-# BOT (использует Redis для FSM — надёжно при рестарте)
+# ТРЕЙСИНГ: спаны fsm / http / render_queue / render / api:* на каждый апдейт
 # =====================================================
-TOKEN = os.getenv("BOT_TOKEN")
-if not TOKEN:
-    raise RuntimeError("BOT_TOKEN is not set")
+TRACER = Tracer(
+    sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0.1")),
+    slow_ms=float(os.getenv("TRACE_SLOW_MS", "1500")),
+    keep=int(os.getenv("TRACE_KEEP", "20")),
+)
+
+dp = Dispatcher(storage=TracedStorage(MemoryStorage()))
+dp.update.outer_middleware(TracingMiddleware(TRACER))
+dp.update.outer_middleware(UpdateMetricsMiddleware(UPDATE_SECONDS))
 
-bot = Bot(token=TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+# =====================================================
+# CALLBACK-РОУТИНГ: "prefix:action[:arg]" -> хендлер за один lookup
+# =====================================================
+# Кнопки со старыми callback_data ещё висят в чатах — переводим их в новый формат
+_LEGACY_CALLBACKS = {
+    "restart": "nav:restart",
+    "back": "nav:back",
+    "exchange_bybit": "trade:exchange:bybit",
+    "exchange_bingx": "trade:exchange:bingx",
+    "side_long": "side:pick:long",
+    "side_short": "side:pick:short",
+    "get_mark_price": "trade:mark_price",
+    "skip_field": "custom:skip",
+    "custom_bybit": "custom:start:bybit",
+    "custom_bingx": "custom:start:bingx",
+}
+CALLBACKS = CallbackRouter(aliases=_LEGACY_CALLBACKS)
+dp.callback_query.register(CALLBACKS.dispatch)
 # =====================================================
 # МАРАФОН (в памяти — при необходимости перенести в Redis)
 # =====================================================
-MARATHON: dict[int, dict[str, float]] = {}
+# Ключ — (bot_id, user_id): у каждого бота свои марафоны; история сделок
+# и статистика — в marathon.py
+MARATHON: dict[tuple[int, int], Marathon] = {}
+
+def marathon_key(bot: Bot, user_id: int) -> tuple[int, int]:
+    return bot.id, user_id
+
+# Рейтинг — тоже свой у каждого бота. Карточка топа кэшируется по
+# (Leaderboard.version, число участников) — на карточке есть и то, и другое:
+# bot_id -> ((version, участников), путь к файлу, file_id в Telegram)
+LEADERBOARD_TOP = int(os.getenv("LEADERBOARD_TOP", "10"))
+LEADERBOARDS: dict[int, Leaderboard] = {}
+_LEADERBOARD_CARDS: dict[int, tuple[tuple[int, int], str, str | None]] = {}
+
+def leaderboard(bot: Bot) -> Leaderboard:
+    board = LEADERBOARDS.get(bot.id)
+    if board is None:
+        board = LEADERBOARDS[bot.id] = Leaderboard(LEADERBOARD_TOP)
+    return board
+
+def update_leaderboard(bot: Bot, user, marathon: Marathon) -> int:
+    pnl_pct = (marathon.balance - marathon.start) / marathon.start * 100
+    name = f"@{user.username}" if user.username else user.full_name
+    return leaderboard(bot).update(user.id, pnl_pct, marathon.balance, name)
 
 # =====================================================
 # aiohttp сессия (переиспользуется)
@@ -122,28 +339,37 @@ async def get_http_session() -> aiohttp.ClientSession:
         _HTTP_SESSION = aiohttp.ClientSession(connector=connector, timeout=timeout)
     return _HTTP_SESSION
 
+# Иконка монеты качается в фоне, пока пользователь вводит цены, —
+# к рендеру она уже лежит в дисковом кэше
+_ICON_TASKS: set[asyncio.Task] = set()
+
+async def _run_blocking(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+async def _fetch_coin_icon(asset: str) -> None:
+    with exchange_request("icons", "coin_icon"):
+        await COIN_ICONS.prefetch(asset, await get_http_session(), _run_blocking)
+
+def prefetch_coin_icon(symbol: str) -> None:
+    asset = base_asset(symbol)
+    if not COIN_ICONS.needs_fetch(asset):
+        return
+    task = asyncio.create_task(_fetch_coin_icon(asset))
+    _ICON_TASKS.add(task)
+    task.add_done_callback(_ICON_TASKS.discard)
+
 # =====================================================
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
 # =====================================================
-async def safe_delete_message(message: Message) -> None:
-    try:
-        await message.delete()
-    except Exception:
-        pass
+# Удаление не ждём: id уходят в фоновую очередь и удаляются пачкой
+# через deleteMessages, поэтому хендлер отвечает сразу после отправки шага.
+MESSAGE_CLEANER = MessageCleaner()
 
-def _cleanup_old_files(directory: str, prefix: str, max_age_seconds: int = 3600) -> None:
-    try:
-        now = time.time()
-        for fname in os.listdir(directory):
-            if fname.startswith(prefix):
-                fpath = os.path.join(directory, fname)
-                try:
-                    if now - os.path.getmtime(fpath) > max_age_seconds:
-                        os.remove(fpath)
-                except OSError:
-                    pass
-    except Exception:
-        pass
+def delete_later(bot: Bot, chat_id: int, message_id: int | None) -> None:
+    MESSAGE_CLEANER.schedule(bot, chat_id, message_id)
+
+def safe_delete_message(message: Message) -> None:
+    delete_later(message.bot, message.chat.id, message.message_id)
 
 async def parse_float(message: Message) -> float | None:
     try:
@@ -156,31 +382,34 @@ async def parse_float(message: Message) -> float | None:
 # КЛАВИАТУРЫ (предсозданные — не пересоздавать каждый раз)
 # =====================================================
 restart_kb = InlineKeyboardMarkup(
-    inline_keyboard=[[InlineKeyboardButton(text="🔁 В начало", callback_data="restart")]]
+    inline_keyboard=[[InlineKeyboardButton(text="🔁 В начало", callback_data="nav:restart")]]
 )
 exchange_kb = InlineKeyboardMarkup(
     inline_keyboard=[[
-        InlineKeyboardButton(text="⚫ Bybit", callback_data="exchange_bybit"),
-        InlineKeyboardButton(text="🔵 BingX", callback_data="exchange_bingx"),
+        InlineKeyboardButton(text="⚫ Bybit", callback_data="trade:exchange:bybit"),
+        InlineKeyboardButton(text="🔵 BingX", callback_data="trade:exchange:bingx"),
     ]]
 )
 side_kb = InlineKeyboardMarkup(
     inline_keyboard=[[
-        InlineKeyboardButton(text="📈 Long", callback_data="side_long"),
-        InlineKeyboardButton(text="📉 Short", callback_data="side_short"),
+        InlineKeyboardButton(text="📈 Long", callback_data="side:pick:long"),
+        InlineKeyboardButton(text="📉 Short", callback_data="side:pick:short"),
     ]]
 )
 back_kb = InlineKeyboardMarkup(
-    inline_keyboard=[[InlineKeyboardButton(text="⬅️ Назад", callback_data="back")]]
+    inline_keyboard=[[InlineKeyboardButton(text="⬅️ Назад", callback_data="nav:back")]]
 )
 mark_price_kb = InlineKeyboardMarkup(
     inline_keyboard=[
-        [InlineKeyboardButton(text="📡 Взять цену с биржи", callback_data="get_mark_price")],
-        [InlineKeyboardButton(text="⬅️ Назад", callback_data="back")],
+        [InlineKeyboardButton(text="📡 Взять цену с биржи", callback_data="trade:mark_price")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="nav:back")],
     ]
 )
 skip_kb = InlineKeyboardMarkup(
-    inline_keyboard=[[InlineKeyboardButton(text="⏭ Пропустить", callback_data="skip_field")]]
+    inline_keyboard=[[InlineKeyboardButton(text="⏭ Пропустить", callback_data="custom:skip")]]
+)
+history_kb = InlineKeyboardMarkup(
+    inline_keyboard=[[InlineKeyboardButton(text="📡 Вход и выход по истории биржи", callback_data="custom:history")]]
 )
 
 _MAIN_KB_MARKUP: InlineKeyboardMarkup | None = None
@@ -189,15 +418,41 @@ def get_main_kb() -> InlineKeyboardMarkup:
     global _MAIN_KB_MARKUP
     if _MAIN_KB_MARKUP is None:
         kb = InlineKeyboardBuilder()
-        kb.button(text="📊 Bybit", callback_data="exchange_bybit")
-        kb.button(text="📊 BingX", callback_data="exchange_bingx")
-        kb.button(text="🎨 Кастом Bybit", callback_data="custom_bybit")
-        kb.button(text="🎨 Кастом BingX", callback_data="custom_bingx")
+        kb.button(text="📊 Bybit", callback_data="trade:exchange:bybit")
+        kb.button(text="📊 BingX", callback_data="trade:exchange:bingx")
+        kb.button(text="🎨 Кастом Bybit", callback_data="custom:start:bybit")
+        kb.button(text="🎨 Кастом BingX", callback_data="custom:start:bingx")
         kb.button(text="🏁 Марафон", callback_data="marathon:menu")
         kb.adjust(1)
         _MAIN_KB_MARKUP = kb.as_markup()
     return _MAIN_KB_MARKUP
 
+# =====================================================
+# НЕСКОЛЬКО КАРТОЧЕК: рендер параллельно в пуле, доставка альбомами
+# sendMediaGroup (до 10 фото за вызов) вместо отдельного answer_photo на каждую
+# =====================================================
+ALBUM_SIZE = 10
+
+async def render_cards(renders) -> list[str]:
+    # renders — корутины, возвращающие путь к карточке (обычно run_render(...)).
+    # Упавшие пропускаем: остальные карточки всё равно уйдут
+    paths = []
+    for result in await asyncio.gather(*renders, return_exceptions=True):
+        if isinstance(result, BaseException):
+            log.warning("card render failed", exc_info=result)
+        else:
+            paths.append(result)
+    return paths
+
+async def send_album(message: Message, paths: list[str]) -> None:
+    for i in range(0, len(paths), ALBUM_SIZE):
+        chunk = paths[i:i + ALBUM_SIZE]
+        if len(chunk) == 1:
+            # В альбоме должно быть от 2 до 10 элементов
+            await message.answer_photo(FSInputFile(chunk[0]))
+        else:
+            await message.answer_media_group([InputMediaPhoto(media=FSInputFile(path)) for path in chunk])
+
 # =====================================================
 # START / TEST
 # =====================================================
@@ -216,7 +471,8 @@ async def test_all(message: Message):
         "/test_custom_bybit_long\n"
         "/test_custom_bybit_short\n"
         "/test_custom_bingx_long\n"
-        "/test_custom_bingx_short"
+        "/test_custom_bingx_short\n"
+        "/test_all_render — все восемь одним альбомом"
     )
     await message.answer(text)
 
@@ -241,6 +497,10 @@ async def test_bingx_short(message: Message):
     await _run_spot_test(message, exchange="bingx", side="short")
 
 async def _run_spot_test(message: Message, exchange: str, side: str):
+    path = await _render_spot_test(exchange, side)
+    await message.answer_photo(FSInputFile(path))
+
+async def _render_spot_test(exchange: str, side: str) -> str:
     amount = 100
     entry = 42000
     mark = 43250 if side == "long" else 41000
@@ -266,18 +526,13 @@ async def _run_spot_test(message: Message, exchange: str, side: str):
         "cost": cost,
     }
 
-    loop = asyncio.get_event_loop()
-    path = await loop.run_in_executor(
-        _THREAD_POOL,
-        generate_trade_image,
-        data,
-        percent,
-        pnl,
-        pnl_usdt,
-    )
-    await message.answer_photo(FSInputFile(path))
+    return await run_render(generate_trade_image, data, percent, pnl, pnl_usdt)
 
 async def _run_custom_test(message: Message, exchange: str, side: str):
+    path = await _render_custom_test(exchange, side)
+    await message.answer_photo(FSInputFile(path))
+
+async def _render_custom_test(exchange: str, side: str) -> str:
     entry = 0.1068
     exit_price = 0.1092 if side == "long" else 0.1040
     leverage_str = "50x"
@@ -300,13 +555,9 @@ async def _run_custom_test(message: Message, exchange: str, side: str):
         "datetime_str": "02/14 19:00",
     }
 
-    loop = asyncio.get_event_loop()
     if exchange == "bingx":
-        path = await loop.run_in_executor(_THREAD_POOL, generate_custom_bingx_image, image_data)
-    else:
-        path = await loop.run_in_executor(_THREAD_POOL, generate_custom_bybit_image, image_data)
-
-    await message.answer_photo(FSInputFile(path))
+        return await run_render(generate_custom_bingx_image, image_data)
+    return await run_render(generate_custom_bybit_image, image_data)
 
 
 @dp.message(Command("test_custom_bybit_long"))
@@ -329,32 +580,94 @@ async def test_custom_bingx_short(message: Message):
     await _run_custom_test(message, exchange="bingx", side="short")
 
 
+@dp.message(Command("test_all_render"))
+async def test_all_render(message: Message):
+    renders = [
+        make(exchange, side)
+        for make in (_render_spot_test, _render_custom_test)
+        for exchange in ("bybit", "bingx")
+        for side in ("long", "short")
+    ]
+    paths = await render_cards(renders)
+    if not paths:
+        await message.answer("Не удалось отрисовать ни одной карточки")
+        return
+    await send_album(message, paths)
+
+
+# =====================================================
+# АДМИН: профилирование по запросу (ADMIN_IDS=1,2,3)
+# =====================================================
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x}
+_admin_only = F.from_user.id.in_(ADMIN_IDS)
+
+def _profile_seconds(command: CommandObject, default: float = 10.0) -> float:
+    try:
+        seconds = float(command.args) if command.args else default
+    except ValueError:
+        seconds = default
+    return min(max(seconds, 1.0), 120.0)
+
+@dp.message(Command("profile"), _admin_only)
+async def admin_profile(message: Message, command: CommandObject):
+    if PROFILER.busy:
+        await message.answer("Профилирование уже идёт")
+        return
+    seconds = _profile_seconds(command)
+    await message.answer(f"⏱ cProfile на {seconds:g} с (event loop + потоки рендера)…")
+    report = await PROFILER.profile(seconds)
+    await message.answer_document(BufferedInputFile(report.encode(), filename="profile.txt"))
+
+@dp.message(Command("memsnap"), _admin_only)
+async def admin_memsnap(message: Message, command: CommandObject):
+    if PROFILER.busy:
+        await message.answer("Профилирование уже идёт")
+        return
+    seconds = _profile_seconds(command)
+    await message.answer(f"🧠 tracemalloc: разница снимков через {seconds:g} с…")
+    report = await PROFILER.memory_diff(seconds)
+    await message.answer_document(BufferedInputFile(report.encode(), filename="memsnap.txt"))
+
 
 # =====================================================
 # МАРАФОН
 # =====================================================
-@dp.callback_query(F.data == "marathon:menu")
-async def marathon_menu(call: CallbackQuery, state: FSMContext):
-    user_id = call.from_user.id
-    marathon = MARATHON.get(user_id)
+def marathon_text(marathon: Marathon, rank: int | None = None, total: int = 0) -> str:
+    stats = marathon.stats()
+    text = (
+        f"🏁 Марафон\nСтарт: {marathon.start:.2f} USDT\n"
+        f"Текущий баланс: {marathon.balance:.2f} USDT\n"
+        f"Итог: {stats['pnl']:+.2f} USDT ({stats['pnl_pct']:+.2f}%)"
+    )
+    if rank is not None:
+        text += f"\n🏆 Место в рейтинге: {rank} из {total}"
+    if stats["trades"]:
+        text += (
+            f"\nСделок: {stats['trades']} · винрейт {stats['win_rate'] * 100:.0f}%\n"
+            f"Макс. просадка: {stats['max_drawdown'] * 100:.1f}% · Sharpe/сделка {stats['sharpe']:.2f}"
+        )
+    return text
+
+@CALLBACKS.route("marathon:menu")
+async def marathon_menu(call: CallbackQuery, state: FSMContext, arg: str):
+    marathon = MARATHON.get(marathon_key(call.bot, call.from_user.id))
     if marathon is None:
         await call.message.answer(
             "Марафон ещё не запущен.\n\nОтправь стартовый депозит (например, 100)."
         )
         await state.set_state(MarathonStatesGroup.start_deposit)
     else:
-        start_val = marathon["start"]
-        balance = marathon["balance"]
-        pnl_total = balance - start_val
-        pnl_pct = (pnl_total / start_val * 100) if start_val else 0.0
         kb = InlineKeyboardBuilder()
         kb.button(text="🚀 Сделка в марафоне", callback_data="marathon:start")
+        if len(marathon.history):
+            kb.button(text="📈 Кривая капитала", callback_data="marathon:equity")
+        kb.button(text="🏆 Рейтинг", callback_data="marathon:top")
+        kb.button(text="🔮 Прогноз", callback_data="marathon:project")
         kb.button(text="🛑 Выключить марафон", callback_data="marathon:stop")
         kb.adjust(1)
+        board = leaderboard(call.bot)
         await call.message.answer(
-            f"🏁 Марафон\nСтарт: {start_val:.2f} USDT\n"
-            f"Текущий баланс: {balance:.2f} USDT\n"
-            f"Итог: {pnl_total:+.2f} USDT ({pnl_pct:+.2f}%)",
+            marathon_text(marathon, board.rank(call.from_user.id), len(board)),
             reply_markup=kb.as_markup(),
         )
     await call.answer()
@@ -368,51 +681,169 @@ async def marathon_set_start(message: Message, state: FSMContext):
     except ValueError:
         await message.answer("Введи положительное число, например: 100")
         return
-    user_id = message.from_user.id
-    MARATHON[user_id] = {"start": start_val, "balance": start_val}
+    marathon = MARATHON[marathon_key(message.bot, message.from_user.id)] = Marathon(start_val)
+    update_leaderboard(message.bot, message.from_user, marathon)
     await state.clear()
     kb = InlineKeyboardBuilder()
-    kb.button(text="📊 Bybit", callback_data="exchange_bybit")
-    kb.button(text="📊 BingX", callback_data="exchange_bingx")
+    kb.button(text="📊 Bybit", callback_data="trade:exchange:bybit")
+    kb.button(text="📊 BingX", callback_data="trade:exchange:bingx")
     kb.adjust(1)
     await message.answer(
         f"Марафон запущен! Стартовый депозит: {start_val:.2f} USDT."
     )
     await message.answer("Выбери биржу для сделки в марафоне:", reply_markup=kb.as_markup())
 
-@dp.callback_query(F.data == "marathon:start")
-async def marathon_start(call: CallbackQuery, state: FSMContext):
-    user_id = call.from_user.id
-    if user_id not in MARATHON:
+@CALLBACKS.route("marathon:start")
+async def marathon_start(call: CallbackQuery, state: FSMContext, arg: str):
+    if marathon_key(call.bot, call.from_user.id) not in MARATHON:
         await call.message.answer("Сначала запусти марафон через 🏁 Марафон.")
         await call.answer()
         return
     await state.clear()
     kb = InlineKeyboardBuilder()
-    kb.button(text="📊 Bybit", callback_data="exchange_bybit")
-    kb.button(text="📊 BingX", callback_data="exchange_bingx")
+    kb.button(text="📊 Bybit", callback_data="trade:exchange:bybit")
+    kb.button(text="📊 BingX", callback_data="trade:exchange:bingx")
     kb.adjust(1)
     await call.message.answer("Выбери биржу для сделки в марафоне:", reply_markup=kb.as_markup())
     await call.answer()
 
-@dp.callback_query(F.data == "marathon:stop")
-async def marathon_stop(call: CallbackQuery, state: FSMContext):
-    MARATHON.pop(call.from_user.id, None)
+@CALLBACKS.route("marathon:equity")
+async def marathon_equity(call: CallbackQuery, state: FSMContext, arg: str):
+    marathon = MARATHON.get(marathon_key(call.bot, call.from_user.id))
+    if marathon is None or not len(marathon.history):
+        await call.answer("В марафоне ещё нет сделок", show_alert=True)
+        return
+    await call.answer()
+    path = await run_render(generate_equity_image, marathon.stats())
+    await call.message.answer_photo(FSInputFile(path), reply_markup=restart_kb)
+
+@CALLBACKS.route("marathon:top")
+async def marathon_top(call: CallbackQuery, state: FSMContext, arg: str):
+    await call.answer()
+    board = leaderboard(call.bot)
+    rank = board.rank(call.from_user.id)
+    caption = f"Твоё место: {rank} из {len(board)}" if rank else f"Участников: {len(board)}"
+    # Карточка перерисовывается, только если сменился топ или число участников
+    # (version растёт лишь при смене топа); иначе — тот же file_id без повторной
+    # загрузки (или файл, пока его не убрала очистка)
+    key = (board.version, len(board))
+    cached_key, path, file_id = _LEADERBOARD_CARDS.get(call.bot.id, ((-1, -1), "", None))
+    if cached_key == key and file_id:
+        await call.message.answer_photo(file_id, caption=caption, reply_markup=restart_kb)
+        return
+    if cached_key != key or not os.path.exists(path):
+        path = await run_render(generate_leaderboard_image, board.top(), len(board))
+    sent = await call.message.answer_photo(FSInputFile(path), caption=caption, reply_markup=restart_kb)
+    file_id = sent.photo[-1].file_id if sent.photo else None
+    _LEADERBOARD_CARDS[call.bot.id] = (key, path, file_id)
+
+# Прогноз: бутстрап по своим сделкам (от MIN_REALIZED штук) или параметры
+# /projection N винрейт% плечо риск% тейк% стоп%
+PROJECTION_DEFAULTS = (50.0, 10.0, 10.0, 2.0, 1.0)
+_PROJECTION_USAGE = (
+    "/projection [сделок] [винрейт% плечо риск% тейк% стоп%]\n"
+    "Например: /projection 100 55 10 5 2 1 — риск — доля баланса в марже, "
+    "тейк/стоп — ход цены"
+)
+
+async def send_projection(message: Message, marathon: Marathon | None, trades: int, params=None):
+    balance = marathon.balance if marathon is not None else 100.0
+    source = None
+    if params is None and marathon is not None:
+        source = realized_returns(marathon.history, marathon.stats()["equity"])
+        subtitle = f"по {len(marathon.history)} сделкам марафона, баланс {balance:,.2f} USDT"
+    if source is None:
+        win_rate, leverage, risk, take, stop = params or PROJECTION_DEFAULTS
+        source = parametric_returns(win_rate / 100, take / 100, stop / 100, leverage, risk / 100)
+        subtitle = (f"винрейт {win_rate:g}%, плечо {leverage:g}x, риск {risk:g}%, "
+                    f"тейк {take:g}% / стоп {stop:g}%")
+    result = await run_render(simulate, balance, trades, source)
+    path = await run_render(generate_projection_image, result, subtitle)
+    await message.answer_photo(
+        FSInputFile(path),
+        caption=(f"Медиана через {trades} сделок: {result['median']:,.2f} USDT\n"
+                 f"Вероятность слива: {result['ruin_probability'] * 100:.1f}%"),
+        reply_markup=restart_kb,
+    )
+
+@CALLBACKS.route("marathon:project")
+async def marathon_project(call: CallbackQuery, state: FSMContext, arg: str):
+    await call.answer()
+    marathon = MARATHON.get(marathon_key(call.bot, call.from_user.id))
+    await send_projection(call.message, marathon, DEFAULT_TRADES)
+    if marathon is None or len(marathon.history) < MIN_REALIZED:
+        await call.message.answer("Своих сделок пока мало — взяты параметры по умолчанию.\n" + _PROJECTION_USAGE)
+
+@dp.message(Command("projection"))
+async def projection_command(message: Message, command: CommandObject):
+    args = (command.args or "").replace(",", ".").replace("%", "").replace("x", "").split()
+    try:
+        trades = int(args[0]) if args else DEFAULT_TRADES
+        params = tuple(float(a) for a in args[1:6]) if len(args) > 1 else None
+        if not 1 <= trades <= MAX_TRADES or (params is not None and (
+            len(params) != 5 or not 0 <= params[0] <= 100 or params[1] <= 0
+            or not 0 < params[2] <= 100 or min(params[3:]) < 0
+        )):
+            raise ValueError
+    except ValueError:
+        await message.answer(_PROJECTION_USAGE)
+        return
+    marathon = MARATHON.get(marathon_key(message.bot, message.from_user.id))
+    await send_projection(message, marathon, trades, params)
+
+@CALLBACKS.route("marathon:stop")
+async def marathon_stop(call: CallbackQuery, state: FSMContext, arg: str):
+    MARATHON.pop(marathon_key(call.bot, call.from_user.id), None)
+    leaderboard(call.bot).remove(call.from_user.id)
     await state.clear()
     await call.message.answer("Марафон выключен.")
     await call.answer()
 
+# =====================================================
+# СЦЕНАРИИ: та же позиция по сетке цен и плеч одной картинкой,
+# без повторного прохода TradeForm. Параметры сделки — прямо в callback_data.
+# =====================================================
+def scenario_kb(data: dict, live: bool = False) -> InlineKeyboardMarkup:
+    callback = (
+        f"scenario:grid:{data['exchange']},{data['side']},{data['entry']!r},"
+        f"{data['amount']!r},{data['symbol']}"
+    )
+    rows = [[InlineKeyboardButton(text="🔁 В начало", callback_data="nav:restart")]]
+    # Telegram ограничивает callback_data 64 байтами
+    if len(callback.encode()) <= 64:
+        rows.insert(0, [InlineKeyboardButton(text="📊 Сценарии: цена × плечо", callback_data=callback)])
+    rows.insert(0, [InlineKeyboardButton(text="🎞 Анимация PnL", callback_data="anim:card")])
+    if ALERT_INTERVAL > 0:
+        rows.insert(0, [InlineKeyboardButton(text="🔔 Алерты: цель / стоп / ликвидация", callback_data="alert:set")])
+    if live:
+        rows.insert(0, [InlineKeyboardButton(text="⏹ Остановить live", callback_data="live:off")])
+    elif LIVE_INTERVAL > 0:
+        rows.insert(0, [InlineKeyboardButton(text="🔴 Live: обновлять PnL", callback_data="live:on")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+@CALLBACKS.route("scenario:grid")
+async def scenario_card(call: CallbackQuery, state: FSMContext, arg: str):
+    await call.answer()
+    try:
+        exchange, side, entry, amount, symbol = arg.split(",", 4)
+        data = {"exchange": exchange, "side": side, "entry": float(entry),
+                "amount": float(amount), "symbol": symbol}
+    except ValueError:
+        return
+    path = await run_render(generate_scenario_image, data)
+    await call.message.answer_photo(FSInputFile(path), reply_markup=restart_kb)
+
 # =====================================================
 # НАВИГАЦИЯ TRADEFORM
 # =====================================================
-@dp.callback_query(lambda c: c.data == "restart")
-async def restart(call: CallbackQuery, state: FSMContext):
+@CALLBACKS.route("nav:restart")
+async def restart(call: CallbackQuery, state: FSMContext, arg: str):
     await state.clear()
     await call.message.answer("Выбери режим:", reply_markup=get_main_kb())
     await call.answer()
 
-@dp.callback_query(lambda c: c.data == "back")
-async def go_back(call: CallbackQuery, state: FSMContext):
+@CALLBACKS.route("nav:back")
+async def go_back(call: CallbackQuery, state: FSMContext, arg: str):
     data = await state.get_data()
     prev = data.get("prev_state")
     steps = {
@@ -433,9 +864,9 @@ async def go_back(call: CallbackQuery, state: FSMContext):
         await call.message.answer("Выбери режим:", reply_markup=get_main_kb())
     await call.answer()
 
-@dp.callback_query(lambda c: c.data.startswith("exchange_"))
-async def exchange_selected(call: CallbackQuery, state: FSMContext):
-    await state.update_data(exchange=call.data.split("_")[1], prev_state=TradeForm.exchange)
+@CALLBACKS.route("trade:exchange")
+async def exchange_selected(call: CallbackQuery, state: FSMContext, arg: str):
+    await state.update_data(exchange=arg, prev_state=TradeForm.exchange)
     await show_step(call.message, state, "Введи монету (например BTCUSDT)")
     await state.set_state(TradeForm.symbol)
     await call.answer()
@@ -448,13 +879,13 @@ async def get_symbol(message: Message, state: FSMContext):
     # Получаем точность асинхронно
     precision = await async_get_price_precision(exchange, symbol)
     await state.update_data(symbol=symbol, price_precision=precision, prev_state=TradeForm.symbol)
-    await safe_delete_message(message)
+    safe_delete_message(message)
     await show_step(message, state, "Выбери направление 👇", side_kb)
     await state.set_state(TradeForm.side)
 
-@dp.callback_query(TradeForm.side, lambda c: c.data in ("side_long", "side_short"))
-async def side_selected(call: CallbackQuery, state: FSMContext):
-    side = "long" if call.data == "side_long" else "short"
+@CALLBACKS.route("side:pick", TradeForm.side)
+async def side_selected(call: CallbackQuery, state: FSMContext, arg: str):
+    side = "long" if arg == "long" else "short"
     await state.update_data(side=side, prev_state=TradeForm.side)
     await show_step(call.message, state, "Введите цену входа:", back_kb)
     await state.set_state(TradeForm.entry)
@@ -466,7 +897,7 @@ async def get_entry(message: Message, state: FSMContext):
     if value is None:
         return
     await state.update_data(entry=value, prev_state=TradeForm.entry)
-    await safe_delete_message(message)
+    safe_delete_message(message)
     await show_step(message, state, "Введите цену маркировки:", mark_price_kb)
     await state.set_state(TradeForm.mark)
 
@@ -476,7 +907,7 @@ async def get_mark(message: Message, state: FSMContext):
     if value is None:
         return
     await state.update_data(mark=value, prev_state=TradeForm.mark)
-    await safe_delete_message(message)
+    safe_delete_message(message)
     await show_step(message, state, "На какую сумму заходишь? (USDT)", back_kb)
     await state.set_state(TradeForm.amount)
 
@@ -486,11 +917,10 @@ async def get_amount(message: Message, state: FSMContext):
     if value is None:
         return
     await state.update_data(amount=value, prev_state=TradeForm.amount)
-    await safe_delete_message(message)
-    user_id = message.from_user.id
-    marathon = MARATHON.get(user_id)
+    safe_delete_message(message)
+    marathon = MARATHON.get(marathon_key(message.bot, message.from_user.id))
     if marathon is not None:
-        await state.update_data(deposit=marathon["balance"], prev_state=TradeForm.deposit)
+        await state.update_data(deposit=marathon.balance, prev_state=TradeForm.deposit)
         await show_step(message, state, "Введите плечо (например 10)", back_kb)
         await state.set_state(TradeForm.leverage)
         return
@@ -503,7 +933,7 @@ async def get_deposit(message: Message, state: FSMContext):
     if value is None:
         return
     await state.update_data(deposit=value, prev_state=TradeForm.deposit)
-    await safe_delete_message(message)
+    safe_delete_message(message)
     await show_step(message, state, "Введите плечо (например 10)", back_kb)
     await state.set_state(TradeForm.leverage)
 
@@ -516,39 +946,25 @@ async def get_leverage(message: Message, state: FSMContext):
     except ValueError:
         await message.answer("Введите число от 1 до 125")
         return
-    await safe_delete_message(message)
+    safe_delete_message(message)
     data = await state.get_data()
-    user_id = message.from_user.id
-    marathon = MARATHON.get(user_id)
+    marathon = MARATHON.get(marathon_key(message.bot, message.from_user.id))
     if marathon is not None:
-        data["deposit"] = marathon["balance"]
+        data["deposit"] = marathon.balance
+    data.setdefault("margin_mode", MARGIN_MODE)
 
-    qty = calculate_qty(data["exchange"], data["amount"], data["entry"], leverage)
-    cost = calculate_cost(data["exchange"], data["amount"], leverage)
-    pnl_usdt, margin_pos, percent = calculate_pnl_linear(
-        data["entry"], data["mark"], qty, data["side"], leverage
-    )
-    liquidation = calculate_liquidation(data["entry"], leverage, data["side"])
-    data.update(leverage=leverage, qty=qty, liquidation=liquidation, cost=cost)
+    data, percent, pnl_usdt = build_trade_card(data, leverage)
 
     # PIL-рендеринг в пуле потоков
-    loop = asyncio.get_event_loop()
-    path = await loop.run_in_executor(
-        _THREAD_POOL, generate_trade_image, data, percent, percent, pnl_usdt
-    )
-    await message.answer_photo(FSInputFile(path), reply_markup=restart_kb)
+    path = await run_render(generate_trade_image, data, percent, percent, pnl_usdt)
+    sent = await message.answer_photo(FSInputFile(path), reply_markup=scenario_kb(data))
+    _CARD_DATA[(message.bot.id, message.chat.id, sent.message_id)] = (data, percent, pnl_usdt)
 
     if marathon is not None:
-        marathon["balance"] += pnl_usdt
-        start_val = marathon["start"]
-        balance = marathon["balance"]
-        pnl_total = balance - start_val
-        pnl_pct = (pnl_total / start_val * 100) if start_val else 0.0
-        await message.answer(
-            f"🏁 Марафон\nСтарт: {start_val:.2f} USDT\n"
-            f"Текущий баланс: {balance:.2f} USDT\n"
-            f"Итог: {pnl_total:+.2f} USDT ({pnl_pct:+.2f}%)"
-        )
+        marathon.record(time.time(), data["symbol"], data["side"], data["entry"], data["mark"],
+                        leverage, pnl_usdt)
+        rank = update_leaderboard(message.bot, message.from_user, marathon)
+        await message.answer(marathon_text(marathon, rank, len(leaderboard(message.bot))))
     await state.clear()
 
 # =====================================================
@@ -557,46 +973,56 @@ async def get_leverage(message: Message, state: FSMContext):
 async def async_get_mark_price(exchange: str, symbol: str) -> float | None:
     cache_key = f"price:{exchange}:{symbol}"
     if cache_key in _PRICE_CACHE:
+        _CACHE_STATS["price"][0] += 1
         return _PRICE_CACHE[cache_key]
+    _CACHE_STATS["price"][1] += 1
     try:
         session = await get_http_session()
         if exchange == "bybit":
             url = "https://api.bybit.com/v5/market/tickers"
             params = {"category": "linear", "symbol": symbol}
-            async with session.get(url, params=params) as r:
-                data = await r.json()
+            with exchange_request("bybit", "mark_price"):
+                async with session.get(url, params=params) as r:
+                    data = await r.json()
             price = float(data["result"]["list"][0]["markPrice"])
         elif exchange == "bingx":
             if "-" not in symbol:
                 symbol = symbol.replace("USDT", "-USDT")
             url = "https://open-api.bingx.com/openApi/swap/v2/quote/price"
-            async with session.get(url, params={"symbol": symbol}) as r:
-                data = await r.json()
+            with exchange_request("bingx", "mark_price"):
+                async with session.get(url, params={"symbol": symbol}) as r:
+                    data = await r.json()
             price = float(data["data"]["price"])
         else:
             return None
         _PRICE_CACHE[cache_key] = price
         return price
-    except Exception as e:
-        print("MARK PRICE ERROR:", e)
+    except Exception:
+        HTTP_ERRORS.inc(exchange, "mark_price")
+        log.warning("mark price request failed", exc_info=True,
+                    extra={"fields": {"exchange": exchange, "symbol": symbol}})
         return None
 
 async def async_get_price_precision(exchange: str, symbol: str) -> int | None:
     cache_key = f"precision:{exchange}:{symbol}"
     if cache_key in _PRECISION_CACHE:
+        _CACHE_STATS["precision"][0] += 1
         return _PRECISION_CACHE[cache_key]
+    _CACHE_STATS["precision"][1] += 1
     try:
         session = await get_http_session()
         if exchange == "bybit":
             url = "https://api.bybit.com/v5/market/instruments-info"
-            async with session.get(url, params={"category": "linear", "symbol": symbol}) as r:
-                data = await r.json()
+            with exchange_request("bybit", "precision"):
+                async with session.get(url, params={"category": "linear", "symbol": symbol}) as r:
+                    data = await r.json()
             tick = data["result"]["list"][0]["priceFilter"]["tickSize"]
             precision = len(tick.split(".")[1].rstrip("0")) if "." in tick else 0
         elif exchange == "bingx":
             url = "https://open-api.bingx.com/openApi/swap/v2/quote/contracts"
-            async with session.get(url) as r:
-                data = await r.json()
+            with exchange_request("bingx", "precision"):
+                async with session.get(url) as r:
+                    data = await r.json()
             precision = next(
                 (int(item["pricePrecision"]) for item in data["data"] if item["symbol"] == symbol),
                 2,
@@ -605,15 +1031,381 @@ async def async_get_price_precision(exchange: str, symbol: str) -> int | None:
             return None
         _PRECISION_CACHE[cache_key] = precision
         return precision
-    except Exception as e:
-        print("PRECISION ERROR:", e)
+    except Exception:
+        HTTP_ERRORS.inc(exchange, "precision")
+        log.warning("price precision request failed", exc_info=True,
+                    extra={"fields": {"exchange": exchange, "symbol": symbol}})
+        return None
+
+# =====================================================
+# LIVE-КАРТОЧКИ: позиция остаётся открытой, карточка перерисовывается с
+# текущим марком (live.py). Цена — раз в тик на символ, правки — через общий
+# бюджет LIVE_EDITS_PER_SEC на все боты.
+# =====================================================
+LIVE_INTERVAL = float(os.getenv("LIVE_INTERVAL", "10"))
+# Данные отправленных карточек — чтобы кнопка Live не гоняла TradeForm заново.
+# (bot_id, chat_id, message_id) -> (card, percent, pnl_usdt)
+_CARD_DATA: TTLCache = TTLCache(maxsize=4096, ttl=float(os.getenv("LIVE_TTL", "1800")))
+
+async def edit_live_card(card, data: dict, percent: float, pnl_usdt: float):
+    # Кодируем в память: на диске правки копили бы тысячи файлов для _cleanup_old_files
+    filename, body = await run_render(encode_trade_image, data, percent, percent, pnl_usdt)
+    _, chat_id, message_id = card.key
+    try:
+        await card.bot.edit_message_media(
+            media=InputMediaPhoto(media=BufferedInputFile(body, filename=filename)),
+            chat_id=chat_id,
+            message_id=message_id,
+            reply_markup=scenario_kb(data, live=True),
+        )
+    except TelegramRetryAfter as e:
+        LIVE_EDITS.inc("retry_after")
+        return float(e.retry_after)
+    except TelegramBadRequest as e:
+        if "not modified" in e.message:
+            LIVE_EDITS.inc("not_modified")
+            return True
+        # Сообщение удалено или слишком старое — карточку больше не трогаем
+        LIVE_EDITS.inc("gone")
+        return False
+    LIVE_EDITS.inc("ok")
+    return True
+
+LIVE = LiveCards(
+    async_get_mark_price,
+    edit_live_card,
+    interval=LIVE_INTERVAL,
+    edits_per_second=float(os.getenv("LIVE_EDITS_PER_SEC", "20")),
+    ttl=_CARD_DATA.ttl,
+    per_chat=int(os.getenv("LIVE_PER_CHAT", "3")),
+)
+METRICS.gauge("live_cards", "Cards in live mode", collect=lambda: [((), len(LIVE))])
+METRICS.gauge("live_symbols", "Symbols polled for live cards", collect=lambda: [((), LIVE.symbols())])
+METRICS.gauge("live_pending_edits", "Live cards waiting for an edit", collect=lambda: [((), LIVE.pending())])
+
+@CALLBACKS.route("live:on")
+async def live_on(call: CallbackQuery, state: FSMContext, arg: str):
+    key = (call.bot.id, call.message.chat.id, call.message.message_id)
+    card = _CARD_DATA.get(key)
+    if card is None:
+        await call.answer("Карточка устарела — посчитай сделку заново", show_alert=True)
+        return
+    data, percent, pnl_usdt = card
+    if not LIVE.subscribe(call.bot, key[1], key[2], data, percent, pnl_usdt):
+        await call.answer(f"Не больше {LIVE.per_chat} live-карточек в чате", show_alert=True)
+        return
+    await call.message.edit_reply_markup(reply_markup=scenario_kb(data, live=True))
+    await call.answer(f"Live включён: PnL обновляется раз в {LIVE_INTERVAL:g} с")
+
+@CALLBACKS.route("live:off")
+async def live_off(call: CallbackQuery, state: FSMContext, arg: str):
+    key = (call.bot.id, call.message.chat.id, call.message.message_id)
+    card = LIVE.unsubscribe(key)
+    if card is not None:
+        data = card.data
+    else:
+        # Live уже снят по LIVE_TTL — данные могли остаться в кэше карточек
+        cached = _CARD_DATA.get(key)
+        data = cached[0] if cached else None
+    await call.message.edit_reply_markup(reply_markup=scenario_kb(data) if data else restart_kb)
+    await call.answer("Live выключен")
+
+# =====================================================
+# АЛЕРТЫ: цель, стоп и ликвидация позиции с карточки (alerts.py).
+# Цена — раз в ALERT_INTERVAL на символ, срабатывания ищутся бисекцией по
+# отсортированным порогам; уведомление — свежая карточка по цене срабатывания.
+# =====================================================
+ALERT_INTERVAL = float(os.getenv("ALERT_INTERVAL", "10"))
+
+async def notify_alert(alert, price: float):
+    data = alert.data
+    pnl_usdt, _, percent = calculate_pnl_linear(data["entry"], price, data["qty"], data["side"], data["leverage"])
+    card = {**data, "mark": price}
+    path = await run_render(generate_trade_image, card, percent, percent, pnl_usdt)
+    precision = data.get("price_precision")
+    caption = (
+        f"🔔 {alert.symbol}: {ALERT_KINDS[alert.kind]} {format_price(alert.level, precision)}\n"
+        f"Марк: {format_price(price, precision)} · PnL {format_pnl(percent, pnl_usdt)}"
+    )
+    # Позиция закрыта — live-карточка этой сделки больше не обновляется
+    LIVE.unsubscribe(alert.group)
+    try:
+        await alert.bot.send_photo(alert.chat_id, FSInputFile(path), caption=caption, reply_markup=restart_kb)
+    except TelegramRetryAfter as e:
+        return e.retry_after
+    except TelegramBadRequest:
+        log.warning("alert notification rejected", exc_info=True)
+    ALERTS_FIRED.inc(alert.kind)
+    return None
+
+ALERTS = AlertEngine(
+    async_get_mark_price,
+    notify_alert,
+    interval=ALERT_INTERVAL,
+    sends_per_second=float(os.getenv("ALERT_SENDS_PER_SEC", "20")),
+    per_chat=int(os.getenv("ALERTS_PER_CHAT", "30")),
+)
+METRICS.gauge("price_alerts_active", "Armed price alerts", collect=lambda: [((), len(ALERTS))])
+METRICS.gauge("price_alerts_symbols", "Symbols polled for price alerts", collect=lambda: [((), ALERTS.symbols())])
+
+def alerts_text(alerts, precision: int | None = None) -> str:
+    return "\n".join(
+        f"{ALERT_KINDS[a.kind]} {a.symbol} {'↑' if a.up else '↓'} {format_price(a.level, precision)}"
+        for a in alerts
+    )
+
+@CALLBACKS.route("alert:set")
+async def alert_set(call: CallbackQuery, state: FSMContext, arg: str):
+    key = (call.bot.id, call.message.chat.id, call.message.message_id)
+    card = _CARD_DATA.get(key)
+    if card is None:
+        await call.answer("Карточка устарела — посчитай сделку заново", show_alert=True)
+        return
+    data = card[0]
+    await state.set_state(AlertForm.levels)
+    await state.update_data(alert_message_id=key[2])
+    await call.message.answer(
+        "🔔 Введи цель и стоп через пробел (например: 45000 40000).\n"
+        f"0 — без уровня. Ликвидация {format_price(data['liquidation'], data.get('price_precision'))} "
+        "добавится сама."
+    )
+    await call.answer()
+
+@dp.message(AlertForm.levels)
+async def alert_levels(message: Message, state: FSMContext):
+    try:
+        levels = [float(x) for x in (message.text or "").replace(",", ".").split()]
+        if not 1 <= len(levels) <= 2 or min(levels) < 0:
+            raise ValueError
+    except ValueError:
+        await message.answer("Введи одно или два числа, например: 45000 40000")
+        return
+    safe_delete_message(message)
+    message_id = (await state.get_data()).get("alert_message_id")
+    await state.clear()
+    group = (message.bot.id, message.chat.id, message_id)
+    card = _CARD_DATA.get(group)
+    if card is None:
+        await message.answer("Карточка устарела — посчитай сделку заново", reply_markup=restart_kb)
+        return
+    data = card[0]
+    mark = await async_get_mark_price(data["exchange"], data["symbol"]) or data["mark"]
+    # Повторная настройка заменяет прежние уровни позиции
+    ALERTS.cancel_group(group)
+    wanted = [("target", levels[0]), ("stop", levels[1] if len(levels) > 1 else 0.0),
+              ("liquidation", data["liquidation"])]
+    added = [
+        alert for alert in (
+            ALERTS.add(message.bot, message.chat.id, group, data, kind, level, mark)
+            for kind, level in wanted if level > 0
+        ) if alert is not None
+    ]
+    precision = data.get("price_precision")
+    if not added:
+        await message.answer(
+            f"Алерты не поставлены: уровень совпадает с ценой или в чате уже {ALERTS.per_chat} алертов"
+        )
+        return
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔕 Снять", callback_data=f"alert:clear:{message_id}")],
+    ])
+    await message.answer(
+        f"🔔 Алерты поставлены (марк {format_price(mark, precision)}):\n{alerts_text(added, precision)}\n\n"
+        "Сработает первый — остальные снимутся.",
+        reply_markup=kb,
+    )
+
+@dp.message(Command("alerts"))
+async def alerts_command(message: Message):
+    alerts = ALERTS.chat_alerts(message.bot.id, message.chat.id)
+    if not alerts:
+        await message.answer("Активных алертов нет. Поставить — кнопкой 🔔 под карточкой сделки.")
+        return
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔕 Снять все", callback_data="alert:clear")],
+    ])
+    await message.answer(f"🔔 Активные алерты ({len(alerts)}):\n{alerts_text(alerts)}", reply_markup=kb)
+
+@CALLBACKS.route("alert:clear")
+async def alert_clear(call: CallbackQuery, state: FSMContext, arg: str):
+    if arg.isdigit():
+        removed = len(ALERTS.cancel_group((call.bot.id, call.message.chat.id, int(arg))))
+    else:
+        removed = ALERTS.cancel_chat(call.bot.id, call.message.chat.id)
+    await call.message.edit_reply_markup(reply_markup=None)
+    await call.answer(f"Снято алертов: {removed}")
+
+# =====================================================
+# АНИМАЦИИ: та же карточка короткой GIF/MP4 (render.animate_*): счётчик
+# PnL, а для кастомной карточки по истории биржи — прогон цены по свечам.
+# =====================================================
+# (bot_id, chat_id, message_id) -> (exchange, image_data, [start_ms, end_ms] | None)
+_CUSTOM_CARDS: TTLCache = TTLCache(maxsize=4096, ttl=_CARD_DATA.ttl)
+
+custom_card_kb = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="🎞 Анимация PnL", callback_data="anim:custom")],
+        [InlineKeyboardButton(text="🔁 В начало", callback_data="nav:restart")],
+    ]
+)
+
+def animation_caption(stats: dict) -> str:
+    caption = (
+        f"🎞 {stats['frames']} кадров · {stats['frame_ms']:.1f} мс/кадр · "
+        f"{stats['bytes'] / 1024:.0f} КБ"
+    )
+    return caption + " · обрезано по времени" if stats["truncated"] else caption
+
+async def answer_animation(call: CallbackQuery, path: str, stats: dict) -> None:
+    ANIMATIONS.inc(stats["format"], str(stats["truncated"]).lower())
+    await call.message.answer_animation(FSInputFile(path), caption=animation_caption(stats),
+                                        reply_markup=restart_kb)
+
+@CALLBACKS.route("anim:card")
+async def anim_card(call: CallbackQuery, state: FSMContext, arg: str):
+    card = _CARD_DATA.get((call.bot.id, call.message.chat.id, call.message.message_id))
+    if card is None:
+        await call.answer("Карточка устарела — посчитай сделку заново", show_alert=True)
+        return
+    await call.answer("Рисую анимацию…")
+    data, percent, pnl_usdt = card
+    path, stats = await run_render(animate_trade_card, data, percent, pnl_usdt)
+    await answer_animation(call, path, stats)
+
+@CALLBACKS.route("anim:custom")
+async def anim_custom(call: CallbackQuery, state: FSMContext, arg: str):
+    card = _CUSTOM_CARDS.get((call.bot.id, call.message.chat.id, call.message.message_id))
+    if card is None:
+        await call.answer("Карточка устарела — собери её заново", show_alert=True)
+        return
+    await call.answer("Рисую анимацию…")
+    exchange, image_data, history = card
+    if history:
+        # Свечи этого диапазона уже на диске — их закрытия и есть путь цены
+        symbol = image_data["symbol"].upper().replace("-", "")
+        interval = pick_interval(*history)
+        closes = KLINES.window(exchange, symbol, interval, *history)["close"]
+        path, stats = await run_render(animate_custom_card, image_data, exchange, "replay", closes)
+    else:
+        path, stats = await run_render(animate_custom_card, image_data, exchange)
+    await answer_animation(call, path, stats)
+
+# =====================================================
+# API: исторические свечи — страницами в локальное хранилище (klines.py);
+# повторный запрос того же времени читает только memmap с диска
+# =====================================================
+KLINE_MAX_PAGES = 10
+
+async def async_fetch_klines(exchange: str, symbol: str, interval: str, start_ms: int, end_ms: int):
+    # (страницы, пройден ли диапазон целиком — не упёрлись в KLINE_MAX_PAGES)
+    session = await get_http_session()
+    step = interval_ms(interval)
+    limit = PAGE_LIMIT[exchange]
+    pages = []
+    lo, hi = start_ms, end_ms
+    for _ in range(KLINE_MAX_PAGES):
+        if exchange == "bybit":
+            params = {"category": "linear", "symbol": symbol, "interval": BYBIT_INTERVALS[interval],
+                      "start": lo, "end": hi, "limit": limit}
+            with exchange_request("bybit", "klines"):
+                async with session.get("https://api.bybit.com/v5/market/kline", params=params) as r:
+                    data = await r.json()
+            page = parse_bybit_klines(data["result"]["list"])
+        else:
+            params = {"symbol": symbol if "-" in symbol else symbol.replace("USDT", "-USDT"),
+                      "interval": interval, "startTime": lo, "endTime": hi, "limit": limit}
+            with exchange_request("bingx", "klines"):
+                async with session.get("https://open-api.bingx.com/openApi/swap/v3/quote/klines",
+                                       params=params) as r:
+                    data = await r.json()
+            page = parse_bingx_klines(data["data"])
+        if not len(page):
+            break
+        pages.append(page)
+        # Биржа отдаёт страницу с одного из концов диапазона — двигаем другой
+        first, last = int(page["ts"][0]), int(page["ts"][-1])
+        if first > lo:
+            hi = first - 1
+        elif last + step <= hi:
+            lo = last + step
+        else:
+            break
+        if lo > hi:
+            break
+    else:
+        return pages, False
+    return pages, True
+
+async def async_history_prices(exchange: str, symbol: str, start_ms: int,
+                               end_ms: int) -> tuple[float, float] | None:
+    # (вход, выход): открытие свечи на момент входа и на момент выхода
+    symbol = symbol.upper().replace("-", "")
+    interval = pick_interval(start_ms, end_ms)
+    try:
+        gaps = await _run_blocking(KLINES.missing, exchange, symbol, interval, start_ms, end_ms)
+        _CACHE_STATS["klines"][0 if not gaps else 1] += 1
+        for lo, hi in gaps:
+            pages, complete = await async_fetch_klines(exchange, symbol, interval, lo, hi)
+            for page in pages:
+                await _run_blocking(KLINES.merge, exchange, symbol, interval, page)
+            if complete:
+                # Пустые у биржи места диапазона больше не запрашиваем
+                await _run_blocking(KLINES.mark_fetched, exchange, symbol, interval, lo, hi)
+        entry = KLINES.price_at(exchange, symbol, interval, start_ms)
+        exit_price = KLINES.price_at(exchange, symbol, interval, end_ms)
+    except Exception:
+        HTTP_ERRORS.inc(exchange, "klines")
+        log.warning("kline lookup failed", exc_info=True,
+                    extra={"fields": {"exchange": exchange, "symbol": symbol}})
         return None
+    if entry is None or exit_price is None:
+        return None
+    return entry, exit_price
+
+# =====================================================
+# API: тиры поддерживающей маржи — пачкой на всю биржу
+# (BingX — только из снапшота cache/risk_limits/bingx.json)
+# =====================================================
+MARGIN_MODE = os.getenv("MARGIN_MODE", "isolated")
+if MARGIN_MODE not in MARGIN_MODES:
+    MARGIN_MODE = "isolated"
+
+async def async_load_bybit_risk_limits() -> int:
+    session = await get_http_session()
+    url = "https://api.bybit.com/v5/market/risk-limit"
+    rows, cursor = [], ""
+    for _ in range(100):  # страховка от зацикленного курсора
+        params = {"category": "linear"}
+        if cursor:
+            params["cursor"] = cursor
+        with exchange_request("bybit", "risk_limit"):
+            async with session.get(url, params=params) as r:
+                data = await r.json()
+        rows.extend(data["result"]["list"])
+        cursor = data["result"].get("nextPageCursor") or ""
+        if not cursor:
+            break
+    tables = parse_bybit(rows)
+    if not tables:
+        raise ValueError("empty risk limit response")
+    return await _run_blocking(RISK_LIMITS.replace, "bybit", tables)
+
+async def refresh_risk_limits(interval: float) -> None:
+    # Тиры меняются редко: до первой удачной загрузки работает снапшот с диска
+    while True:
+        try:
+            count = await async_load_bybit_risk_limits()
+            log.info("risk limits loaded", extra={"fields": {"exchange": "bybit", "symbols": count}})
+        except Exception:
+            HTTP_ERRORS.inc("bybit", "risk_limit")
+            log.warning("risk limit request failed", exc_info=True)
+        await asyncio.sleep(interval)
 
 # =====================================================
 # КНОПКА: взять цену с биржи
 # =====================================================
-@dp.callback_query(lambda c: c.data == "get_mark_price")
-async def get_mark_from_exchange(call: CallbackQuery, state: FSMContext):
+@CALLBACKS.route("trade:mark_price")
+async def get_mark_from_exchange(call: CallbackQuery, state: FSMContext, arg: str):
     data = await state.get_data()
     exchange = data.get("exchange")
     symbol = data.get("symbol")
@@ -625,46 +1417,11 @@ async def get_mark_from_exchange(call: CallbackQuery, state: FSMContext):
         await call.answer("Не удалось получить цену", show_alert=True)
         return
     await state.update_data(mark=price, prev_state=TradeForm.mark)
-    try:
-        await call.message.delete()
-    except Exception:
-        pass
+    safe_delete_message(call.message)
     await show_step(call.message, state, "На какую сумму заходишь? (USDT)", back_kb)
     await state.set_state(TradeForm.amount)
     await call.answer("Цена получена ✅")
 
-# =====================================================
-# РАСЧЁТЫ
-# =====================================================
-def calculate_qty(exchange: str, amount: float, entry: float, leverage: int) -> float:
-    qty = amount * leverage / entry
-    return round(qty, 4 if exchange == "bybit" else 2)
-
-def format_price(value: float, precision: int | None = None) -> str:
-    if precision is not None:
-        return f"{value:,.{precision}f}"
-    if value == 0:
-        return "0"
-    if value >= 1000:
-        return f"{value:,.2f}"
-    elif value >= 1:
-        return f"{value:,.4f}".rstrip("0").rstrip(".")
-    return f"{value:.8f}".rstrip("0").rstrip(".")
-
-def calculate_liquidation(entry: float, leverage: int | float, side: str, mm: float = 0.005) -> float:
-    return entry * (1 - 1 / leverage + mm) if side == "long" else entry * (1 + 1 / leverage - mm)
-
-def calculate_cost(exchange: str, amount: float, leverage: int | float) -> float:
-    return round(amount * leverage, 2)
-
-def calculate_pnl_linear(
-    entry: float, mark: float, qty: float, side: str, leverage: float
-) -> tuple[float, float, float]:
-    pnl_usd = qty * (mark - entry) if side == "long" else qty * (entry - mark)
-    margin = entry * qty / leverage if leverage else 0.0
-    pnl_percent = (pnl_usd / margin * 100) if margin > 0 else 0.0
-    return round(pnl_usd, 4), round(margin, 4), round(pnl_percent, 2)
-
 # =====================================================
 # SUMMARY / show_step
 # =====================================================
@@ -730,461 +1487,48 @@ async def show_step(
     )
     question_text = _PRETTY_QUESTIONS.get(question, f"❓ {question}")
     last_msg_id = data.get("last_bot_msg_id") or data.get("custom_last_msg_id")
-    if last_msg_id:
-        try:
-            await message.bot.delete_message(message.chat.id, last_msg_id)
-        except Exception:
-            pass
+    delete_later(message.bot, message.chat.id, last_msg_id)
     msg = await message.answer(
         f"{summary}\n{question_text}", parse_mode="HTML", reply_markup=keyboard
     )
     await state.update_data(last_bot_msg_id=msg.message_id, custom_last_msg_id=msg.message_id)
 
-# =====================================================
-# РЕНДЕР ОБЫЧНОЙ КАРТИНКИ
-# =====================================================
-def draw_gray_box(draw, x, y, text, font, cfg):
-    padding_x = cfg.get("pad_x", 16)
-    padding_y = cfg.get("pad_y", 10)
-    radius = cfg.get("radius", 14)
-    bbox = draw.textbbox((0, 0), text, font=font)
-    w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
-    draw.rounded_rectangle(
-        (x - w // 2 - padding_x, y - h // 2 - padding_y,
-         x + w // 2 + padding_x, y + h // 2 + padding_y),
-        radius=radius, fill=(80, 80, 80),
-    )
-    draw.text((x, y), text, fill=(255, 255, 255), font=font, anchor="mm")
-
-def draw_side_badge(draw, x, y, text, color, exchange, fonts_cfg, cfg=None):
-    img_h = draw.im.size[1]
-    font = _load_font(
-        os.path.join(BASE_DIR, fonts_cfg["files"]["regular"]),
-        scale_font(fonts_cfg["sizes"]["badge"], img_h),
-    )
-    if exchange == "bingx" and cfg is not None:
-        box_w = cfg.get("w", 140)
-        box_h = cfg.get("h", 48)
-        radius = cfg.get("radius", 18)
-    else:
-        padding_x, padding_y = 16, 18
-        radius = cfg.get("radius", 20) if cfg is not None else 20
-        bbox = draw.textbbox((0, 0), text, font=font)
-        box_w = bbox[2] - bbox[0] + padding_x * 2
-        box_h = bbox[3] - bbox[1] + padding_y * 1.5
-    x1, y1 = x - box_w // 2, y - box_h // 2
-    x2, y2 = x1 + box_w, y1 + box_h
-    badge_style = fonts_cfg.get("badge_style", "outline")
-    fill_color = color if badge_style == "filled" else (30, 30, 30)
-    text_color = (255, 255, 255) if badge_style == "filled" else color
-    draw.rounded_rectangle((x1, y1, x2, y2), radius=radius, fill=fill_color)
-    draw.text(((x1 + x2) / 2, (y1 + y2) / 2), text, fill=text_color, font=font, anchor="mm")
-
-def clear_by_layout(img, draw, layout, key):
-    cfg = layout.get(key)
-    if cfg is None:
-        return
-    iw, ih = img.size
-    x, y = px(cfg["x"], iw), px(cfg["y"], ih)
-    cw, ch = px(cfg["w"], iw), px(cfg["h"], ih)
-    bgx = px(cfg["bg_x"], iw) if "bg_x" in cfg else x + 2
-    bgy = px(cfg["bg_y"], ih) if "bg_y" in cfg else y + 2
-    bg = img.getpixel((bgx, bgy))
-    draw.rectangle((x, y, x + cw, y + ch), fill=bg)
-
-def generate_trade_image(data: dict, percent: float, pnl: float, pnl_usdt: float) -> str:
-    exchange = data["exchange"]
-    template_path = os.path.join(BASE_DIR, "assets", exchange, "template.png")
-    output_dir = os.path.join(BASE_DIR, "output")
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, f"result_{uuid.uuid4().hex[:8]}.png")
-
-    cfg = FONTS[exchange]
-    layout = LAYOUT[exchange]
-    font_regular = os.path.join(BASE_DIR, cfg["files"]["regular"])
-    font_bold = os.path.join(BASE_DIR, cfg["files"]["bold"])
-    sizes = cfg["sizes"]
-
-    # Копируем шаблон из кэша
-    img = _load_template(template_path).copy()
-    draw = ImageDraw.Draw(img)
-
-    clear_keys = [
-        "clear_symbol", "clear_leverage", "clear_side_badge", "clear_entry",
-        "clear_mark", "clear_pnl", "clear_qty", "clear_liq", "clear_margin", "clear_risk",
-    ]
-    for key in clear_keys:
-        if exchange == "bybit" and key == "clear_margin":
-            continue
-        clear_by_layout(img, draw, layout, key)
-
-    WHITE, GREEN, RED, ORANGE = (255,255,255), (0,200,120), (230,60,60), (245,166,89)
-    side_color = GREEN if data["side"] == "long" else RED
-    pnl_color = GREEN if pnl >= 0 else RED
-
-    symbol_font = _load_font(font_bold, sizes["symbol"])
-    pnl_font = _load_font(font_bold, sizes["pnl"])
-    lev_font = _load_font(font_regular, sizes["leverage"])
-
-    w, h = img.size
-
-    def pos(c):
-        return int(c["x"] * w) + c.get("dx", 0), int(c["y"] * h) + c.get("dy", 0)
-
-    symbol_text = data["symbol"]
-    badge_text = "Лонг" if data["side"] == "long" else "Шорт"
-    pnl_text = f"{pnl_usdt:+.2f}$ ({pnl:+.2f}%)"
-    lev_text = f"Кросс {data['leverage']}x" if exchange == "bybit" else ""
-
-    sx, sy = pos(layout["symbol"])
-    draw.text((sx, sy), symbol_text, fill=WHITE, font=symbol_font, anchor=layout["symbol"]["anchor"])
-
-    bx, by = pos(layout["side_badge"])
-    if exchange == "bybit":
-        sym_bbox = draw.textbbox((0, 0), symbol_text, font=symbol_font)
-        bx = sx + (sym_bbox[2] - sym_bbox[0]) + 75 + layout["side_badge"].get("dx", 0)
-    draw_side_badge(draw, bx, by, badge_text, side_color, exchange, cfg, layout.get("side_badge"))
-
-    px_val, py_val = pos(layout["pnl"])
-    draw.text((px_val, py_val), pnl_text, fill=pnl_color, font=pnl_font, anchor=layout["pnl"]["anchor"])
-
-    lx, ly = pos(layout["leverage"])
-    draw.text((lx, ly), lev_text, fill=WHITE, font=lev_font, anchor=layout["leverage"]["anchor"])
-
-    if exchange == "bingx":
-        badge_font = _load_font(font_regular, sizes["leverage"])
-        mx, my = pos(layout["margin_mode"])
-        lbx, lby = pos(layout["leverage_bingx"])
-        draw_gray_box(draw, mx, my, "Кросс", badge_font, layout["margin_mode"])
-        draw_gray_box(draw, lbx, lby, f"{data['leverage']}x", badge_font, layout["leverage_bingx"])
-
-        # ----- Позиция / qty -----
-    if exchange == "bybit":
-        # Bybit: количество монет
-        qty_value = float(data.get("qty") or 0)
-        qty_text = f"{qty_value:.4f}"
-    else:  # bingx
-        # BingX: маржа * плечо (позиция в USDT)
-        margin = float(data.get("amount") or 0)
-        lev = float(data.get("leverage") or 0)
-        qty_value = margin * lev
-        qty_text = f"{qty_value:.2f}"
-
-    # рисуем qty для ОБЕИХ бирж
-    draw_text(
-        draw,
-        layout,
-        "qty",
-        qty_text,
-        font_regular,
-        sizes["qty"],
-        WHITE,
-        w,
-        h,
-    )
-
-    precision = data.get("price_precision")
-
-    # дальше — ОБЩИЙ вывод цен для обеих бирж
-    draw_text(
-        draw,
-        layout,
-        "entry",
-        format_price(data["entry"], precision),
-        font_regular,
-        sizes["entry"],
-        WHITE,
-        w,
-        h,
-    )
-    draw_text(
-        draw,
-        layout,
-        "mark",
-        format_price(data["mark"], precision),
-        font_regular,
-        sizes["mark"],
-        WHITE,
-        w,
-        h,
-    )
-    draw_text(
-        draw,
-        layout,
-        "liq",
-        format_price(data["liquidation"], precision),
-        font_regular,
-        sizes["liq"],
-        ORANGE,
-        w,
-        h,
-    )
-
-
-    precision = data.get("price_precision")
-
-    if exchange == "bingx":
-        margin_usdt = float(data.get("amount") or 0) * float(data.get("leverage") or 0)
-        draw_text(draw, layout, "margin", f"{data['amount']:.2f}", font_regular, sizes["qty"], WHITE, w, h)
-        draw_text(draw, layout, "entry", format_price(data["entry"], precision), font_regular, sizes["entry"], WHITE, w, h)
-        draw_text(draw, layout, "mark", format_price(data["mark"], precision), font_regular, sizes["mark"], WHITE, w, h)
-        draw_text(draw, layout, "liq", format_price(data["liquidation"], precision), font_regular, sizes["liq"], ORANGE, w, h)
-
-    if exchange == "bingx" and "risk" in layout:
-        entry_v = float(data.get("entry") or 0)
-        qty_v = float(data.get("qty") or 0)
-        margin_v = float(data.get("amount") or 0)
-        pos_margin = entry_v * qty_v
-        if pos_margin and margin_v:
-            risk = margin_v / pos_margin * 100.0
-            risk_text = f"{risk:.2f}%" if round(risk, 2) != 0 else "--"
-            risk_color = GREEN if risk <= 40 else (ORANGE if risk <= 70 else RED)
-        else:
-            risk_text, risk_color = "--", ORANGE
-        rx, ry = pos(layout["risk"])
-        draw.text((rx, ry), risk_text, fill=risk_color,
-                  font=_load_font(font_regular, sizes["leverage"]),
-                  anchor=layout["risk"]["anchor"])
-
-    img.save(output_path)
-    # Синхронная очистка старых файлов — здесь мы уже в пуле потоков
-    _cleanup_old_files(os.path.dirname(output_path), "result_")
-    return output_path
-
-
-# =====================================================
-# КАСТОМНЫЕ КАРТИНКИ
-# =====================================================
-def generate_custom_bybit_image(data: dict) -> str:
-    try:
-        pnl = float(str(data["pnl"]).replace("%", "").replace(",", "."))
-    except ValueError:
-        pnl = 0.0
-    template_side = "long" if pnl >= 0 else "short"
-    template_path = os.path.join(BASE_DIR, "assets", "bybit", f"screenshot_{template_side}.png")
-    output_dir = os.path.join(BASE_DIR, "images")
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, f"custom_bybit_{uuid.uuid4().hex[:8]}.png")
-
-    img = _load_template(template_path).copy()
-    w, h = img.size
-    draw = ImageDraw.Draw(img)
-    cfg = FONTS["custom_bybit"]
-    layout = BYBIT_CUSTOM_LAYOUT["bybit"]
-
-    icon_path = os.path.join(BASE_DIR, "assets", "bybit", "icon.png")
-    cfg_icon = layout.get("symbol_icon")
-    if os.path.exists(icon_path) and cfg_icon:
-        size = cfg_icon.get("size", 60)
-        icon = _load_icon(icon_path, size)
-        img.paste(icon, (int(cfg_icon["x"] * w) + cfg_icon.get("dx", 0),
-                         int(cfg_icon["y"] * h) + cfg_icon.get("dy", 0)), icon)
-        draw = ImageDraw.Draw(img)
-
-    fp = lambda name, bold=False: os.path.join(BASE_DIR, cfg["files"]["bold" if bold else "regular"])
-    username_font = _load_font(fp("regular"), cfg["sizes"]["username"])
-    symbol_font = _load_font(fp("bold", True), cfg["sizes"]["symbol"])
-    pnl_abs = abs(pnl)
-    pnl_size = 80 if pnl_abs > 99 else (100 if pnl_abs > 49 else cfg["sizes"]["pnl"])
-    pnl_font = _load_font(fp("bold", True), pnl_size)
-    entry_font = _load_font(fp("bold", True), cfg["sizes"]["entry"])
-    exit_font = _load_font(fp("bold", True), cfg["sizes"]["exit"])
-    lev_font = _load_font(fp("regular"), cfg["sizes"]["leverage_text"])
-
-    WHITE, GREEN, RED = (255,255,255), (0,200,120), (230,60,60)
-
-    def pos(c):
-        return int(c["x"] * w) + c.get("dx", 0), int(c["y"] * h) + c.get("dy", 0)
-
-    if "username" in data and "username" in layout:
-        draw.text(pos(layout["username"]), data["username"], fill=WHITE, font=username_font, anchor="lm")
-    if "symbol" in layout:
-        draw.text(pos(layout["symbol"]), data["symbol"], fill=WHITE, font=symbol_font, anchor="lm")
-    if "pnl" in layout:
-        pnl_color = GREEN if pnl >= 0 else RED
-        draw.text(pos(layout["pnl"]), f"{pnl:+.2f}%", fill=pnl_color, font=pnl_font, anchor="lm")
-    if "entry" in layout:
-        draw.text(pos(layout["entry"]), format_price(data["entry"]), fill=WHITE, font=entry_font, anchor="lm")
-    if "exit" in layout:
-        draw.text(pos(layout["exit"]), format_price(data["exit"]), fill=WHITE, font=exit_font, anchor="lm")
-    if "cross_leverage" in layout:
-        direction_text = "Лонг" if data["side"] == "long" else "Шорт"
-        leverage_num = float(str(data["leverage"]).replace("x", ""))
-        lev_text = f"{direction_text} {leverage_num:.1f}X"
-        base_x = layout["cross_leverage"]["x"] * w
-        shift_x = len(data["symbol"]) * 10 + 100
-        lev_pos = (base_x + shift_x, layout["cross_leverage"]["y"] * h)
-        padding_x, padding_y = 16, 10
-        bbox = draw.textbbox((0, 0), lev_text, font=lev_font)
-        box_w = bbox[2] - bbox[0] + padding_x * 2
-        box_h = bbox[3] - bbox[1] + padding_y * 2
-        x1, y1 = lev_pos[0] - box_w // 2, lev_pos[1] - box_h // 2
-        x2, y2 = x1 + box_w, y1 + box_h
-        overlay = Image.new("RGBA", img.size, (0, 0, 0, 0))
-        ImageDraw.Draw(overlay).rounded_rectangle([x1, y1, x2, y2], radius=65, fill=(35, 35, 35, 100))
-        img = Image.alpha_composite(img, overlay)
-        draw = ImageDraw.Draw(img)
-        text_color = GREEN if data["side"] == "long" else RED
-        draw.text(lev_pos, lev_text, fill=text_color, font=lev_font, anchor="mm")
-
-    img.save(output_path)
-
-    # Синхронная очистка старых файлов — здесь мы уже в пуле потоков
-    _cleanup_old_files(os.path.dirname(output_path), "custom_bybit_")
-
-    return output_path
-
-
-def generate_custom_bingx_image(data: dict) -> str:
-    try:
-        pnl = float(str(data["pnl"]).replace("%", "").replace(",", "."))
-    except ValueError:
-        pnl = 0.0
-    template_side = "long" if pnl >= 0 else "short"
-    template_path = os.path.join(BASE_DIR, "assets", "bingx", f"screenshot_{template_side}.png")
-    output_dir = os.path.join(BASE_DIR, "images")
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, f"custom_bingx_{uuid.uuid4().hex[:8]}.png")
-
-    if not os.path.exists(template_path):
-        raise FileNotFoundError(f"Создай {template_path}")
-
-    img = _load_template(template_path).copy()
-    draw = ImageDraw.Draw(img)
-    w, h = img.size
-    cfg = FONTS["custom_bingx"]
-    layout = BYBIT_CUSTOM_LAYOUT["bingx"]
-
-    fp_r = os.path.join(BASE_DIR, cfg["files"]["regular"])
-    fp_b = os.path.join(BASE_DIR, cfg["files"]["bold"])
-    username_font = _load_font(fp_r, cfg["sizes"]["username"])
-    symbol_font = _load_font(fp_b, cfg["sizes"]["symbol"])
-    pnl_font = _load_font(fp_b, cfg["sizes"]["pnl"])
-    entry_font = _load_font(fp_b, cfg["sizes"]["entry"])
-    exit_font = _load_font(fp_b, cfg["sizes"]["exit"])
-    lev_font = _load_font(fp_r, cfg["sizes"]["leverage_text"])
-    small_font = _load_font(fp_r, cfg["sizes"].get("leverage_text", 36))
-
-    draw_custom_bingx_lines(img, data, layout, small_font, symbol_font, w, h)
-
-    WHITE, GREEN, RED, GRAY = (255,255,255), (0,200,120), (230,60,60), (150,150,150)
-
-    def pos(c):
-        return int(c["x"] * w), int(c["y"] * h)
-
-    if "username" in data and "username" in layout:
-        draw.text(pos(layout["username"]), data["username"], fill=WHITE, font=username_font)
-    if "symbol" in layout:
-        draw.text(pos(layout["symbol"]), data["symbol"], fill=WHITE, font=symbol_font)
-    if "pnl" in layout:
-        pnl_color = GREEN if pnl >= 0 else RED
-        draw.text(pos(layout["pnl"]), f"{pnl:+.2f}%", fill=pnl_color, font=pnl_font)
-    if "entry" in layout:
-        draw.text(pos(layout["entry"]), format_price(data["entry"]), fill=WHITE, font=entry_font)
-    if "exit" in layout:
-        draw.text(pos(layout["exit"]), format_price(data["exit"]), fill=WHITE, font=exit_font)
-    datetime_text = data.get("datetime_str", "").strip()
-    referral_code = data.get("referral", "").strip()
-    if datetime_text and "datetime" in layout:
-        draw.text(pos(layout["datetime"]), datetime_text, fill=GRAY, font=small_font)
-    if referral_code and "referral" in layout:
-        draw.text(pos(layout["referral"]), referral_code, fill=WHITE, font=small_font)
-
-    img.save(output_path)
-
-    # Синхронная очистка старых файлов — здесь мы уже в пуле потоков
-    _cleanup_old_files(os.path.dirname(output_path), "custom_bybit_")
-
-    return output_path
-
-
-def draw_custom_bingx_lines(img, data, layout, font_side, font_symbol, w, h):
-    symbol = data["symbol"]
-    cfg = layout.get("lines")
-    if not cfg:
-        return
-    line_path = os.path.join(BASE_DIR, "assets", "bingx", "line.png")
-    if not os.path.exists(line_path):
-        return
-    size = int(cfg.get("size", 80))
-    line = _load_icon(line_path, size)
-    base_x = int(cfg["x"] * w + cfg.get("dx", 0))
-    base_y = int(cfg["y"] * h + cfg.get("dy", 0))
-    dummy = Image.new("RGBA", (10, 10))
-    bbox_sym = ImageDraw.Draw(dummy).textbbox((0, 0), symbol, font=font_symbol)
-    sym_width = bbox_sym[2] - bbox_sym[0]
-    gap = cfg.get("gap", 10)
-    spacing = cfg.get("spacing", 221)
-    x1, y1 = base_x + sym_width + gap, base_y
-    x2, y2 = x1 + size + spacing, base_y
-    img.paste(line, (x1, y1), line)
-    img.paste(line, (x2, y2), line)
-    draw = ImageDraw.Draw(img)
-    side_cfg = layout.get("side_position", {})
-    side_x = int(side_cfg.get("x", 0.5) * w)
-    side_y = int(side_cfg.get("y", 0.335) * h)
-    side_text = "Лонг" if data.get("side") == "long" else "Шорт"
-    side_color = (0, 200, 120) if data.get("side") == "long" else (230, 60, 60)
-    draw.text((side_x, side_y), side_text, fill=side_color, font=font_side, anchor=side_cfg.get("anchor", "lm"))
-    lev_cfg = layout.get("leverage_position", {})
-    lev_x = int(lev_cfg.get("x", 0.15) * w)
-    lev_y = int(lev_cfg.get("y", 0.335) * h)
-    lev_raw = str(data.get("leverage", "")).replace("x", "").upper()
-    if lev_raw:
-        draw.text((lev_x, lev_y), f"{lev_raw}X", fill=(255, 255, 255), font=font_side,
-                  anchor=lev_cfg.get("anchor", "lm"))
-
 # =====================================================
 # CUSTOM EXCHANGE (FSM)
 # =====================================================
-@dp.callback_query(F.data == "custom_bybit")
-async def start_custom_bybit(cb: CallbackQuery, state: FSMContext):
+@CALLBACKS.route("custom:start")
+async def start_custom(call: CallbackQuery, state: FSMContext, arg: str):
     await state.clear()
-    await state.update_data(exchange="bybit")
-    msg = await cb.message.answer("👤 Введите имя пользователя:")
-    await state.update_data(custom_last_msg_id=msg.message_id)
-    await state.set_state(CustomExchange.username)
-
-@dp.callback_query(F.data == "custom_bingx")
-async def start_custom_bingx(cb: CallbackQuery, state: FSMContext):
-    await state.clear()
-    await state.update_data(exchange="bingx")
-    msg = await cb.message.answer("👤 Введите имя пользователя:")
+    await state.update_data(exchange="bingx" if arg == "bingx" else "bybit")
+    msg = await call.message.answer("👤 Введите имя пользователя:")
     await state.update_data(custom_last_msg_id=msg.message_id)
     await state.set_state(CustomExchange.username)
+    await call.answer()
 
 @dp.message(CustomExchange.username)
 async def custom_username(msg: Message, state: FSMContext):
     await state.update_data(username=msg.text.strip())
-    await safe_delete_message(msg)
+    safe_delete_message(msg)
     data = await state.get_data()
-    last_id = data.get("custom_last_msg_id")
-    if last_id:
-        try:
-            await msg.bot.delete_message(msg.chat.id, last_id)
-        except Exception:
-            pass
+    delete_later(msg.bot, msg.chat.id, data.get("custom_last_msg_id"))
     new = await msg.answer(
         f"{build_custom_summary(data)}\n📈 Выбери направление сделки:", reply_markup=side_kb
     )
     await state.update_data(custom_last_msg_id=new.message_id)
     await state.set_state(CustomExchange.side)
 
-@dp.callback_query(CustomExchange.side)
-async def custom_side(call: CallbackQuery, state: FSMContext):
-    if call.data == "side_long":
+@CALLBACKS.route("side:pick", CustomExchange.side)
+async def custom_side(call: CallbackQuery, state: FSMContext, arg: str):
+    if arg == "long":
         side = "long"
-    elif call.data == "side_short":
+    elif arg == "short":
         side = "short"
     else:
         await call.answer("❌ Ошибка кнопки")
         return
     await state.update_data(side=side)
     await call.answer()
-    try:
-        await call.message.delete()
-    except Exception:
-        pass
+    safe_delete_message(call.message)
     data = await state.get_data()
     new = await call.message.answer(f"{build_custom_summary(data)}\n🪙 Торговая пара (например BTCUSDT):")
     await state.update_data(custom_last_msg_id=new.message_id)
@@ -1193,32 +1537,61 @@ async def custom_side(call: CallbackQuery, state: FSMContext):
 @dp.message(CustomExchange.symbol)
 async def custom_symbol(msg: Message, state: FSMContext):
     await state.update_data(symbol=msg.text.upper())
-    await safe_delete_message(msg)
+    prefetch_coin_icon(msg.text)
+    safe_delete_message(msg)
     data = await state.get_data()
-    last_id = data.get("custom_last_msg_id")
-    if last_id:
-        try:
-            await msg.bot.delete_message(msg.chat.id, last_id)
-        except Exception:
-            pass
-    new = await msg.answer(f"{build_custom_summary(data)}\nЦена входа (например 123456.12):")
+    delete_later(msg.bot, msg.chat.id, data.get("custom_last_msg_id"))
+    new = await msg.answer(
+        f"{build_custom_summary(data)}\nЦена входа (например 123456.12):", reply_markup=history_kb
+    )
     await state.update_data(custom_last_msg_id=new.message_id)
     await state.set_state(CustomExchange.entry)
 
+HISTORY_UTC_OFFSET = float(os.getenv("HISTORY_UTC_OFFSET", "3"))
+
+@CALLBACKS.route("custom:history", CustomExchange.entry)
+async def custom_history(call: CallbackQuery, state: FSMContext, arg: str):
+    await call.answer()
+    data = await state.get_data()
+    delete_later(call.bot, call.message.chat.id, data.get("custom_last_msg_id"))
+    new = await call.message.answer(
+        f"{build_custom_summary(data)}\n🕒 Время входа и выхода (UTC{HISTORY_UTC_OFFSET:+g}), например:\n"
+        "14/02 19:00 - 14/02 23:30 или 19:00 - 23:30"
+    )
+    await state.update_data(custom_last_msg_id=new.message_id)
+    await state.set_state(CustomExchange.history)
+
+@dp.message(CustomExchange.history)
+async def custom_history_range(msg: Message, state: FSMContext):
+    try:
+        start_ms, end_ms = parse_time_range(msg.text or "", HISTORY_UTC_OFFSET)
+    except ValueError:
+        await msg.answer("Не понял время 🙏 Пример: 14/02 19:00 - 14/02 23:30 (выход — в прошлом)")
+        return
+    safe_delete_message(msg)
+    data = await state.get_data()
+    prices = await async_history_prices(data.get("exchange", "bybit"), data["symbol"], start_ms, end_ms)
+    if prices is None:
+        await msg.answer("Не удалось получить свечи за это время — введи цену входа вручную:")
+        await state.set_state(CustomExchange.entry)
+        return
+    # Диапазон — для анимации карточки по свечам (anim:custom)
+    await state.update_data(entry=prices[0], exit=prices[1], history_ms=[start_ms, end_ms])
+    data = await state.get_data()
+    delete_later(msg.bot, msg.chat.id, data.get("custom_last_msg_id"))
+    new = await msg.answer(f"{build_custom_summary(data)}\nПлечо (например 20):")
+    await state.update_data(custom_last_msg_id=new.message_id)
+    await state.set_state(CustomExchange.leverage)
+
 @dp.message(CustomExchange.entry)
 async def custom_entry(msg: Message, state: FSMContext):
     value = await parse_float(msg)
     if value is None:
         return
     await state.update_data(entry=value)
-    await safe_delete_message(msg)
+    safe_delete_message(msg)
     data = await state.get_data()
-    last_id = data.get("custom_last_msg_id")
-    if last_id:
-        try:
-            await msg.bot.delete_message(msg.chat.id, last_id)
-        except Exception:
-            pass
+    delete_later(msg.bot, msg.chat.id, data.get("custom_last_msg_id"))
     new = await msg.answer(f"{build_custom_summary(data)}\nЦена выхода (например 123456.12):")
     await state.update_data(custom_last_msg_id=new.message_id)
     await state.set_state(CustomExchange.exit_price)
@@ -1229,14 +1602,9 @@ async def custom_exit(msg: Message, state: FSMContext):
     if value is None:
         return
     await state.update_data(exit=value)
-    await safe_delete_message(msg)
+    safe_delete_message(msg)
     data = await state.get_data()
-    last_id = data.get("custom_last_msg_id")
-    if last_id:
-        try:
-            await msg.bot.delete_message(msg.chat.id, last_id)
-        except Exception:
-            pass
+    delete_later(msg.bot, msg.chat.id, data.get("custom_last_msg_id"))
     new = await msg.answer(f"{build_custom_summary(data)}\nПлечо (например 20):")
     await state.update_data(custom_last_msg_id=new.message_id)
     await state.set_state(CustomExchange.leverage)
@@ -1244,14 +1612,9 @@ async def custom_exit(msg: Message, state: FSMContext):
 @dp.message(CustomExchange.leverage)
 async def custom_leverage(msg: Message, state: FSMContext):
     await state.update_data(leverage=msg.text.strip())
-    await safe_delete_message(msg)
+    safe_delete_message(msg)
     data = await state.get_data()
-    last_id = data.get("custom_last_msg_id")
-    if last_id:
-        try:
-            await msg.bot.delete_message(msg.chat.id, last_id)
-        except Exception:
-            pass
+    delete_later(msg.bot, msg.chat.id, data.get("custom_last_msg_id"))
     new = await msg.answer(
         f"{build_custom_summary(data)}\nВведите реферальный код (например D1BFA4):",
         reply_markup=skip_kb,
@@ -1259,14 +1622,11 @@ async def custom_leverage(msg: Message, state: FSMContext):
     await state.update_data(custom_last_msg_id=new.message_id)
     await state.set_state(CustomExchange.referral)
 
-@dp.callback_query(CustomExchange.referral, F.data == "skip_field")
-async def skip_referral(call: CallbackQuery, state: FSMContext):
+@CALLBACKS.route("custom:skip", CustomExchange.referral)
+async def skip_referral(call: CallbackQuery, state: FSMContext, arg: str):
     await state.update_data(referral="")
     await call.answer()
-    try:
-        await call.message.delete()
-    except Exception:
-        pass
+    safe_delete_message(call.message)
     new = await call.message.answer("Введите дату и время (например 14/02 19:00):", reply_markup=skip_kb)
     await state.update_data(custom_last_msg_id=new.message_id)
     await state.set_state(CustomExchange.datetime_str)
@@ -1274,26 +1634,18 @@ async def skip_referral(call: CallbackQuery, state: FSMContext):
 @dp.message(CustomExchange.referral)
 async def custom_referral(msg: Message, state: FSMContext):
     await state.update_data(referral=msg.text.strip())
-    await safe_delete_message(msg)
+    safe_delete_message(msg)
     data = await state.get_data()
-    last_id = data.get("custom_last_msg_id")
-    if last_id:
-        try:
-            await msg.bot.delete_message(msg.chat.id, last_id)
-        except Exception:
-            pass
+    delete_later(msg.bot, msg.chat.id, data.get("custom_last_msg_id"))
     new = await msg.answer("Введите дату и время (например 02/14 19:00):", reply_markup=skip_kb)
     await state.update_data(custom_last_msg_id=new.message_id)
     await state.set_state(CustomExchange.datetime_str)
 
-@dp.callback_query(CustomExchange.datetime_str, F.data == "skip_field")
-async def skip_datetime(call: CallbackQuery, state: FSMContext):
+@CALLBACKS.route("custom:skip", CustomExchange.datetime_str)
+async def skip_datetime(call: CallbackQuery, state: FSMContext, arg: str):
     await state.update_data(datetime_str="")
     await call.answer()
-    try:
-        await call.message.delete()
-    except Exception:
-        pass
+    safe_delete_message(call.message)
     await custom_finish(call.message, state)
 
 @dp.message(CustomExchange.datetime_str)
@@ -1301,64 +1653,112 @@ async def custom_finish(msg: Message, state: FSMContext):
     text_input = getattr(msg, "text", None)
     if text_input:
         await state.update_data(datetime_str=text_input.strip())
-        await safe_delete_message(msg)
+        safe_delete_message(msg)
     data = await state.get_data()
-    exchange = data.get("exchange", "bybit")
-    entry = data["entry"]
-    exit_price = data["exit"]
-    side = data["side"]
-    leverage_raw = str(data.get("leverage") or "1").strip().lower().replace("x", "")
-    try:
-        leverage = float(leverage_raw) if leverage_raw else 1.0
-    except ValueError:
-        leverage = 1.0
-    pnl_percent = (
-        ((exit_price - entry) / entry * 100) * leverage
-        if side == "long"
-        else ((entry - exit_price) / entry * 100) * leverage
-    )
-    image_data = {
-        "username": data["username"],
-        "symbol": data["symbol"],
-        "pnl": round(pnl_percent, 2),
-        "entry": entry,
-        "exit": exit_price,
-        "side": side,
-    }
-    loop = asyncio.get_event_loop()
-    if exchange == "bingx":
-        image_data["leverage"] = data["leverage"]
-        image_data["referral"] = data.get("referral", "")
-        image_data["datetime_str"] = data.get("datetime_str", "")
-        path = await loop.run_in_executor(_THREAD_POOL, generate_custom_bingx_image, image_data)
+    image_data = build_custom_card(data)
+    if data.get("exchange", "bybit") == "bingx":
+        path = await run_render(generate_custom_bingx_image, image_data)
     else:
-        image_data["leverage"] = f"{leverage:.1f}x"
-        path = await loop.run_in_executor(_THREAD_POOL, generate_custom_bybit_image, image_data)
+        path = await run_render(generate_custom_bybit_image, image_data)
 
-    last_id = data.get("custom_last_msg_id")
-    if last_id:
-        try:
-            await msg.bot.delete_message(msg.chat.id, last_id)
-        except Exception:
-            pass
-    await msg.answer_photo(FSInputFile(path), reply_markup=restart_kb)
+    delete_later(msg.bot, msg.chat.id, data.get("custom_last_msg_id"))
+    sent = await msg.answer_photo(FSInputFile(path), reply_markup=custom_card_kb)
+    _CUSTOM_CARDS[(msg.bot.id, msg.chat.id, sent.message_id)] = (
+        data.get("exchange", "bybit"), image_data, data.get("history_ms"),
+    )
     await state.clear()
 
 # =====================================================
 # ЗАПУСК
 # =====================================================
+_METRICS_RUNNER: web.AppRunner | None = None
+_RELOAD_TASK: asyncio.Task | None = None
+_RISK_TASK: asyncio.Task | None = None
+
+async def warmup_assets() -> None:
+    # Шаблоны, шрифты и иконки — параллельно в пуле рендера
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    jobs = warmup_jobs()
+    await asyncio.gather(*(loop.run_in_executor(_THREAD_POOL, func, *args) for func, *args in jobs))
+    log.info("assets warmed up", extra={"fields": {
+        "items": len(jobs), "ms": round((time.perf_counter() - start) * 1000, 1),
+    }})
+
+async def watch_assets(interval: float) -> None:
+    # Горячая перезагрузка шаблонов, шрифтов и конфигов (правки после
+    # calibrate.py) без рестарта и без потери FSM-сессий
+    loop = asyncio.get_running_loop()
+    watcher = await loop.run_in_executor(None, make_watcher)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            changed = await loop.run_in_executor(None, watcher.poll)
+            if not changed:
+                continue
+            kinds = apply_changes(changed)
+            for kind in kinds:
+                ASSET_RELOADS.inc(kind)
+            log.info("assets reloaded", extra={"fields": {
+                "files": [os.path.relpath(path) for path in changed], "kinds": kinds,
+            }})
+            if kinds:
+                # Новые размеры шрифтов и новые шаблоны — прогреваем заранее
+                await warmup_assets()
+        except Exception:
+            log.warning("asset reload failed", exc_info=True)
+
 async def on_startup():
-    await get_http_session()
+    global _METRICS_RUNNER, _RELOAD_TASK, _RISK_TASK
+    await asyncio.gather(get_http_session(), warmup_assets())
+    interval = float(os.getenv("ASSET_RELOAD_INTERVAL", "2"))
+    if interval > 0:
+        _RELOAD_TASK = asyncio.create_task(watch_assets(interval))
+    # Снапшоты тиров читаем вне loop, до первой сделки
+    for exchange in ("bybit", "bingx"):
+        await _run_blocking(RISK_LIMITS.symbols, exchange)
+    risk_interval = float(os.getenv("RISK_LIMITS_REFRESH", "21600"))
+    if risk_interval > 0:
+        _RISK_TASK = asyncio.create_task(refresh_risk_limits(risk_interval))
+    if LIVE_INTERVAL > 0:
+        LIVE.start()
+    if ALERT_INTERVAL > 0:
+        ALERTS.start()
+    port = int(os.getenv("METRICS_PORT", "9108"))
+    if port:
+        # По умолчанию только localhost; наружу — METRICS_HOST=0.0.0.0 явно
+        host = os.getenv("METRICS_HOST", "127.0.0.1")
+        try:
+            _METRICS_RUNNER = await start_metrics_server(METRICS, host, port)
+        except OSError:
+            # Порт занят (второй процесс бота на хосте) — бот работает без /metrics
+            log.warning("metrics server not started", exc_info=True,
+                        extra={"fields": {"host": host, "port": port}})
 
 async def on_shutdown():
+    if _RELOAD_TASK is not None:
+        _RELOAD_TASK.cancel()
+    if _RISK_TASK is not None:
+        _RISK_TASK.cancel()
+    await LIVE.stop()
+    await ALERTS.stop()
+    await MESSAGE_CLEANER.close()
+    TRACER.dump()
+    if _METRICS_RUNNER is not None:
+        await _METRICS_RUNNER.cleanup()
     if _HTTP_SESSION and not _HTTP_SESSION.closed:
         await _HTTP_SESSION.close()
     _THREAD_POOL.shutdown(wait=False)
 
 async def main():
-    dp.startup.register(on_startup)
-    dp.shutdown.register(on_shutdown)
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    listener = setup_logging(os.getenv("LOG_LEVEL", "INFO"))
+    try:
+        bots = create_bots(get_bot_tokens())
+        dp.startup.register(on_startup)
+        dp.shutdown.register(on_shutdown)
+        await dp.start_polling(*bots, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        listener.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
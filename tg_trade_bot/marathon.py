@@ -0,0 +1,209 @@
+# marathon.py
+#
+# Марафон пользователя: стартовый депозит и история сделок из get_leverage.
+# История — набор типизированных массивов (struct of arrays) с удвоением
+# ёмкости: ~40 байт на сделку вместо dict на каждую. Символы интернируются
+# в общий словарь, в истории — только int32-код.
+# Статистика (кривая капитала, просадка, винрейт, Sharpe на сделку) — один
+# векторный проход NumPy по срезу [:n] и кэшируется до следующей сделки.
+# Leaderboard — рейтинг участников по доходности марафона на RankIndex
+# (utils/ranking.py): обновление, место и топ-N без сортировки всех.
+
+import numpy as np
+
+from utils.ranking import RankIndex
+
+_SYMBOLS: list[str] = []
+_SYMBOL_CODES: dict[str, int] = {}
+
+
+def symbol_code(symbol: str) -> int:
+    code = _SYMBOL_CODES.get(symbol)
+    if code is None:
+        code = _SYMBOL_CODES[symbol] = len(_SYMBOLS)
+        _SYMBOLS.append(symbol)
+    return code
+
+
+def symbol_name(code: int) -> str:
+    return _SYMBOLS[code]
+
+
+class TradeHistory:
+    FIELDS = (
+        ("ts", np.float64),
+        ("symbol", np.int32),
+        ("side", np.int8),  # +1 лонг, -1 шорт
+        ("entry", np.float64),
+        ("mark", np.float64),
+        ("leverage", np.float32),
+        ("pnl", np.float64),
+    )
+
+    def __init__(self, capacity: int = 16):
+        self.n = 0
+        self._arrays = {name: np.empty(capacity, dtype) for name, dtype in self.FIELDS}
+
+    def __len__(self) -> int:
+        return self.n
+
+    def append(self, ts: float, symbol: str, side: str, entry: float, mark: float,
+               leverage: float, pnl: float) -> None:
+        if self.n == len(self._arrays["ts"]):
+            # Старые массивы не трогаем: срезы, уже отданные в рендер, остаются валидными
+            self._arrays = {
+                name: np.concatenate((arr, np.empty(len(arr), arr.dtype)))
+                for name, arr in self._arrays.items()
+            }
+        i = self.n
+        a = self._arrays
+        a["ts"][i] = ts
+        a["symbol"][i] = symbol_code(symbol)
+        a["side"][i] = 1 if side == "long" else -1
+        a["entry"][i] = entry
+        a["mark"][i] = mark
+        a["leverage"][i] = leverage
+        a["pnl"][i] = pnl
+        self.n = i + 1
+
+    def column(self, name: str) -> np.ndarray:
+        # Срез без копии; дописывание идёт только за его пределы
+        return self._arrays[name][:self.n]
+
+    def nbytes(self) -> int:
+        return sum(arr.nbytes for arr in self._arrays.values())
+
+
+def equity_curve(start: float, pnl: np.ndarray) -> np.ndarray:
+    # Баланс до первой сделки и после каждой: n + 1 точек
+    equity = np.empty(len(pnl) + 1)
+    equity[0] = start
+    np.cumsum(pnl, out=equity[1:])
+    equity[1:] += start
+    return equity
+
+
+def drawdown(equity: np.ndarray) -> tuple[float, int, int]:
+    # Максимальная просадка в долях от пика и индексы (пик, дно) на кривой.
+    # Пик не ниже стартового депозита, а он > 0 — делим без проверок
+    peaks = np.maximum.accumulate(equity)
+    dd = equity / peaks
+    trough = int(dd.argmin())
+    if dd[trough] >= 1.0:
+        return 0.0, 0, 0
+    peak = int(equity[:trough + 1].argmax())
+    return float(1.0 - dd[trough]), peak, trough
+
+
+def trade_stats(start: float, pnl: np.ndarray) -> dict:
+    equity = equity_curve(start, pnl)
+    max_dd, dd_peak, dd_trough = drawdown(equity)
+    n = len(pnl)
+    stats = {
+        "trades": n,
+        "start": start,
+        "balance": float(equity[-1]),
+        "pnl": float(equity[-1] - start),
+        "pnl_pct": float((equity[-1] - start) / start * 100) if start else 0.0,
+        "max_drawdown": max_dd,
+        "dd_peak": dd_peak,
+        "dd_trough": dd_trough,
+        "win_rate": 0.0,
+        "profit_factor": 0.0,
+        "sharpe": 0.0,
+        "best": 0.0,
+        "worst": 0.0,
+        "equity": equity,
+    }
+    if not n:
+        return stats
+    # Без булевых выборок: сумма прибылей через maximum, убытки — остаток
+    gross_win = float(np.maximum(pnl, 0.0).sum())
+    gross_loss = gross_win - float(equity[-1] - start)
+    # Доходность сделки — от баланса перед ней (после слива — 0)
+    before = equity[:-1]
+    returns = np.divide(pnl, before, out=np.zeros(n), where=before > 0)
+    mean = float(returns.sum()) / n
+    var = max(float(returns @ returns) / n - mean * mean, 0.0)
+    if gross_loss > 1e-12:
+        profit_factor = gross_win / gross_loss
+    else:
+        profit_factor = float("inf") if gross_win else 0.0
+    stats.update(
+        win_rate=float(np.count_nonzero(pnl > 0)) / n,
+        profit_factor=profit_factor,
+        sharpe=mean / var ** 0.5 if var > 0 else 0.0,
+        best=float(pnl.max()),
+        worst=float(pnl.min()),
+    )
+    return stats
+
+
+class Marathon:
+    __slots__ = ("start", "balance", "history", "_stats")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.balance = start
+        self.history = TradeHistory()
+        self._stats: dict | None = None
+
+    def record(self, ts: float, symbol: str, side: str, entry: float, mark: float,
+               leverage: float, pnl: float) -> None:
+        self.history.append(ts, symbol, side, entry, mark, leverage, pnl)
+        self.balance += pnl
+        self._stats = None
+
+    def stats(self) -> dict:
+        if self._stats is None:
+            self._stats = trade_stats(self.start, self.history.column("pnl"))
+        return self._stats
+
+
+class Leaderboard:
+    # Ключ в индексе — (-доходность %, user): больший результат — выше.
+    # version растёт, только когда меняется то, что видно в топ-N
+    # (состав, порядок, цифры или имена) — по ней кэшируется карточка.
+    def __init__(self, top_n: int = 10):
+        self.top_n = top_n
+        self.version = 0
+        self._index = RankIndex()
+        self._keys: dict = {}
+        self._names: dict = {}
+        self._balances: dict = {}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def update(self, user, return_pct: float, balance: float, name: str) -> int:
+        # Возвращает место пользователя с единицы
+        old = self._keys.get(user)
+        was_top = old is not None and self._index.remove(old) < self.top_n
+        key = (-return_pct, user)
+        rank = self._index.insert(key)
+        self._keys[user] = key
+        self._names[user] = name
+        self._balances[user] = balance
+        if was_top or rank < self.top_n:
+            self.version += 1
+        return rank + 1
+
+    def remove(self, user) -> None:
+        key = self._keys.pop(user, None)
+        if key is None:
+            return
+        if self._index.remove(key) < self.top_n:
+            self.version += 1
+        self._names.pop(user, None)
+        self._balances.pop(user, None)
+
+    def rank(self, user) -> int | None:
+        key = self._keys.get(user)
+        return None if key is None else self._index.rank(key) + 1
+
+    def top(self, n: int | None = None) -> list[tuple[int, str, float, float]]:
+        # (место, имя, доходность %, баланс)
+        return [
+            (place, self._names[user], -neg_return, self._balances[user])
+            for place, (neg_return, user) in enumerate(self._index.first(n or self.top_n), start=1)
+        ]
@@ -0,0 +1,99 @@
+# projection.py
+#
+# Монте-Карло прогноз марафона: «где будет депозит через N сделок».
+# Все пути считаются одной матрицей (пути × сделки) в NumPy.
+#
+# Сделка в терминах calculate_pnl_linear: ROI на маржу = плечо × ход цены
+# в сторону позиции; маржа — доля баланса (риск на сделку), поэтому
+# доходность на баланс = доля × ROI. Изолированная маржа: убыток сделки не
+# больше маржи (ликвидация), ROI >= -100%.
+#
+# Источники сделок:
+#   realized   — бутстрап по истории марафона (ход цены, плечо и доля маржи
+#                каждой сделки восстанавливаются из entry/mark/pnl)
+#   parametric — винрейт, тейк/стоп в % цены, плечо и риск из параметров
+
+import numpy as np
+
+DEFAULT_PATHS = 10_000
+DEFAULT_TRADES = 50
+MAX_TRADES = 500
+MIN_REALIZED = 5
+# Слив — баланс упал ниже этой доли от стартового; дальше путь не торгует
+RUIN_LEVEL = 0.1
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def realized_returns(history, equity: np.ndarray) -> np.ndarray | None:
+    # Доходность каждой прошлой сделки на баланс: доля × max(плечо × ход, -1).
+    # equity — кривая капитала марафона (n + 1 точек, marathon.equity_curve)
+    n = len(history)
+    if n < MIN_REALIZED:
+        return None
+    entry = history.column("entry")
+    move = history.column("side") * (history.column("mark") - entry) / entry
+    leverage = history.column("leverage").astype(np.float64)
+    pnl = history.column("pnl")
+    before = equity[:-1]
+    roi = leverage * move
+    # Маржа = pnl / ROI; у сделок без движения цены её не восстановить —
+    # берём медианную долю остальных
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.where((roi != 0) & (before > 0), pnl / roi / before, np.nan)
+    known = fraction[np.isfinite(fraction) & (fraction > 0)]
+    fill = float(np.median(known)) if known.size else 0.1
+    fraction = np.clip(np.where(np.isfinite(fraction) & (fraction > 0), fraction, fill), 0.0, 1.0)
+    return fraction * np.maximum(roi, -1.0)
+
+
+def parametric_returns(
+    win_rate: float, take: float, stop: float, leverage: float, risk: float,
+) -> tuple[float, float, float]:
+    # (вероятность выигрыша, доходность выигрыша, доходность проигрыша) на баланс;
+    # take/stop — ход цены в долях, risk — доля баланса в марже
+    win = risk * leverage * take
+    loss = -risk * min(leverage * stop, 1.0)
+    return win_rate, win, loss
+
+
+def simulate(
+    balance: float, trades: int, source, paths: int = DEFAULT_PATHS,
+    seed: int | None = None, ruin_level: float = RUIN_LEVEL,
+) -> dict:
+    # source — массив доходностей (бутстрап) или тройка parametric_returns
+    rng = np.random.default_rng(seed)
+    # Матрица доходностей (пути × сделки); дальше всё на месте, без копий
+    if isinstance(source, np.ndarray):
+        growth = source[rng.integers(0, len(source), size=(paths, trades))]
+    else:
+        win_rate, win, loss = source
+        growth = np.where(rng.random((paths, trades)) < win_rate, win, loss)
+    growth += 1.0
+    equity = np.cumprod(growth, axis=1, out=growth)
+    equity *= balance
+
+    # Слив поглощающий: после первого касания уровня путь замирает
+    ruined_at = equity <= balance * ruin_level
+    ruined = ruined_at.any(axis=1)
+    if ruined.any():
+        first = ruined_at.argmax(axis=1)
+        rows = np.flatnonzero(ruined)
+        frozen = equity[rows, first[rows]]
+        after = np.arange(trades)[None, :] > first[rows, None]
+        equity[rows] = np.where(after, frozen[:, None], equity[rows])
+
+    bands = np.empty((len(PERCENTILES), trades + 1))
+    bands[:, 0] = balance
+    bands[:, 1:] = np.percentile(equity, PERCENTILES, axis=0)
+    final = equity[:, -1]
+    return {
+        "balance": balance,
+        "trades": trades,
+        "paths": paths,
+        "percentiles": PERCENTILES,
+        "bands": bands,
+        "ruin_probability": float(ruined.mean()),
+        "profit_probability": float((final > balance).mean()),
+        "median": float(bands[PERCENTILES.index(50), -1]),
+        "mean": float(final.mean()),
+    }
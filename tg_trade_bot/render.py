@@ -0,0 +1,1146 @@
+# render.py
+#
+# Рендер карточек. Импортируется без aiogram и без BOT_TOKEN —
+# годится для пакетного рендера, тестов и отдельных воркеров.
+
+import collections
+import contextlib
+import functools
+import logging
+import math
+import os
+import runpy
+import threading
+import time
+import uuid
+from concurrent.futures import Executor
+from typing import NamedTuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from calc import calculate_pnl_linear, format_pnl, format_price
+from risk_limits import RISK_LIMITS
+from scenarios import DEFAULT_LEVERAGES, mark_ladder, scenario_grid
+from configs.fonts import FONTS
+from configs.layout import LAYOUT, BYBIT_CUSTOM_LAYOUT
+from utils.bundle import AssetBundle
+from utils.animation import EXTENSIONS as ANIMATION_EXTENSIONS, available_format, ease_out, render_animation
+from utils.canvas import Canvas
+from utils.coin_icons import CoinIcons, base_asset
+from utils.draw_text import draw_text, load_font
+from utils.encode import EXTENSIONS, Encoder
+from utils.hotreload import FileWatcher, file_cache
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+log = logging.getLogger("tg_trade_bot.render")
+
+# =====================================================
+# Конфиги шрифтов и разметки. Снимок подменяется целиком (одно присваивание),
+# рендер берёт CONFIG один раз в начале и до конца видит согласованную версию.
+# =====================================================
+class Config(NamedTuple):
+    fonts: dict
+    layout: dict
+    custom_layout: dict
+
+CONFIG = Config(FONTS, LAYOUT, BYBIT_CUSTOM_LAYOUT)
+
+def _read_config() -> Config:
+    # Свежие модули с диска, без importlib.reload: старый снимок не трогаем
+    fonts = runpy.run_path(os.path.join(BASE_DIR, "configs", "fonts.py"))
+    layout = runpy.run_path(os.path.join(BASE_DIR, "configs", "layout.py"))
+    return Config(fonts["FONTS"], layout["LAYOUT"], layout["BYBIT_CUSTOM_LAYOUT"])
+
+# =====================================================
+# Кэш шрифтов — шрифты грузятся один раз (общий с utils.draw_text)
+# =====================================================
+_load_font = load_font
+
+# =====================================================
+# Бандл предекодированных ассетов (собирается build_assets.py).
+# Если он есть и исходник не менялся — шаблон/иконка берётся из mmap без
+# декодирования PNG; иначе обычный путь через Image.open.
+# =====================================================
+BUNDLE_PATH = os.getenv("RENDER_BUNDLE", os.path.join(BASE_DIR, "assets", "bundle.rgba"))
+
+@functools.lru_cache(maxsize=1)
+def _get_bundle() -> AssetBundle | None:
+    if not BUNDLE_PATH or not os.path.exists(BUNDLE_PATH):
+        return None
+    try:
+        return AssetBundle(BUNDLE_PATH)
+    except (OSError, ValueError):
+        log.warning("asset bundle unreadable, falling back to PNG", exc_info=True)
+        return None
+
+def bundle_key(path: str, size: int | None = None) -> str:
+    key = os.path.relpath(path, BASE_DIR).replace(os.sep, "/")
+    return f"{key}@{size}" if size is not None else key
+
+def _from_bundle(path: str, size: int | None = None) -> Image.Image | None:
+    bundle = _get_bundle()
+    return bundle.image(bundle_key(path, size), path) if bundle is not None else None
+
+def _decode_template(path: str) -> Image.Image:
+    return Image.open(path).convert("RGBA")
+
+def _decode_icon(path: str, size: int) -> Image.Image:
+    icon = Image.open(path).convert("RGBA")
+    return icon.resize((size, size), Image.LANCZOS)
+
+# =====================================================
+# Кэш шаблонов — изображения грузятся один раз, сбрасываются по файлу
+# при горячей перезагрузке
+# =====================================================
+@file_cache(maxsize=16)
+def _load_template(path: str) -> Image.Image:
+    return _from_bundle(path) or _decode_template(path)
+
+# =====================================================
+# Кэш иконок
+# =====================================================
+@file_cache(maxsize=32)
+def _load_icon(path: str, size: int) -> Image.Image:
+    return _from_bundle(path, size) or _decode_icon(path, size)
+
+# =====================================================
+# Холсты: у каждого потока рендера свой холст на шаблон, между рендерами
+# восстанавливаются только закрашенные прямоугольники (см. utils/canvas.py).
+# Держим не больше _CANVASES_PER_THREAD холстов на поток.
+# =====================================================
+REUSE_CANVAS = os.getenv("RENDER_REUSE_CANVAS", "1") != "0"
+_CANVASES_PER_THREAD = 2
+_canvases = threading.local()
+
+def _canvas(template_path: str) -> Canvas:
+    canvas = _reuse_canvas(template_path) if REUSE_CANVAS else Canvas(_load_template(template_path))
+    # Рендер статичного слоя анимации (см. _capturing) — «живые» надписи не рисуются
+    canvas.captured = getattr(_canvases, "capture", None)
+    return canvas
+
+def _reuse_canvas(template_path: str) -> Canvas:
+    template = _load_template(template_path)
+    cache = getattr(_canvases, "lru", None)
+    if cache is None:
+        cache = _canvases.lru = collections.OrderedDict()
+    canvas = cache.get(template_path)
+    if canvas is None or canvas.template is not template:
+        canvas = cache[template_path] = Canvas(template)
+        while len(cache) > _CANVASES_PER_THREAD:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(template_path)
+        canvas.begin()
+    return canvas
+
+# =====================================================
+# Иконки монет (utils/coin_icons.py): память -> диск -> assets/coins;
+# если иконки монеты нет — прежняя assets/bybit/icon.png
+# =====================================================
+COIN_ICONS = CoinIcons.from_env(BASE_DIR)
+
+BASE_H = 467
+
+def scale_font(size: int, img_h: int) -> int:
+    return max(10, int(size * img_h / BASE_H))
+
+def px(val: float, size: int) -> int:
+    return int(val * size)
+
+# =====================================================
+# Кодирование результата (формат и бюджет — RENDER_FORMAT / RENDER_MAX_BYTES /
+# RENDER_MAX_ENCODE_MS, см. utils/encode.py)
+# =====================================================
+ENCODER = Encoder.from_env()
+
+def save_card(img: Image.Image, subdir: str, prefix: str) -> str:
+    output_dir = os.path.join(BASE_DIR, subdir)
+    os.makedirs(output_dir, exist_ok=True)
+    path = ENCODER.save(img, output_dir, prefix)
+    # Синхронная очистка старых файлов — здесь мы уже в пуле потоков
+    _cleanup_old_files(output_dir, prefix)
+    return path
+
+def _cleanup_old_files(directory: str, prefix: str, max_age_seconds: int = 3600) -> None:
+    try:
+        now = time.time()
+        for fname in os.listdir(directory):
+            if fname.startswith(prefix):
+                fpath = os.path.join(directory, fname)
+                try:
+                    if now - os.path.getmtime(fpath) > max_age_seconds:
+                        os.remove(fpath)
+                except OSError:
+                    pass
+    except Exception:
+        pass
+
+# =====================================================
+# РЕНДЕР ОБЫЧНОЙ КАРТИНКИ
+# =====================================================
+def draw_gray_box(draw, x, y, text, font, cfg):
+    padding_x = cfg.get("pad_x", 16)
+    padding_y = cfg.get("pad_y", 10)
+    radius = cfg.get("radius", 14)
+    bbox = draw.textbbox((0, 0), text, font=font)
+    w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    draw.rounded_rectangle(
+        (x - w // 2 - padding_x, y - h // 2 - padding_y,
+         x + w // 2 + padding_x, y + h // 2 + padding_y),
+        radius=radius, fill=(80, 80, 80),
+    )
+    draw.text((x, y), text, fill=(255, 255, 255), font=font, anchor="mm")
+
+def draw_side_badge(draw, x, y, text, color, exchange, fonts_cfg, cfg=None):
+    img_h = draw.im.size[1]
+    font = _load_font(
+        os.path.join(BASE_DIR, fonts_cfg["files"]["regular"]),
+        scale_font(fonts_cfg["sizes"]["badge"], img_h),
+    )
+    if exchange == "bingx" and cfg is not None:
+        box_w = cfg.get("w", 140)
+        box_h = cfg.get("h", 48)
+        radius = cfg.get("radius", 18)
+    else:
+        padding_x, padding_y = 16, 18
+        radius = cfg.get("radius", 20) if cfg is not None else 20
+        bbox = draw.textbbox((0, 0), text, font=font)
+        box_w = bbox[2] - bbox[0] + padding_x * 2
+        box_h = bbox[3] - bbox[1] + padding_y * 1.5
+    x1, y1 = x - box_w // 2, y - box_h // 2
+    x2, y2 = x1 + box_w, y1 + box_h
+    badge_style = fonts_cfg.get("badge_style", "outline")
+    fill_color = color if badge_style == "filled" else (30, 30, 30)
+    text_color = (255, 255, 255) if badge_style == "filled" else color
+    draw.rounded_rectangle((x1, y1, x2, y2), radius=radius, fill=fill_color)
+    draw.text(((x1 + x2) / 2, (y1 + y2) / 2), text, fill=text_color, font=font, anchor="mm")
+
+def clear_by_layout(img, draw, layout, key):
+    cfg = layout.get(key)
+    if cfg is None:
+        return
+    iw, ih = img.size
+    x, y = px(cfg["x"], iw), px(cfg["y"], ih)
+    cw, ch = px(cfg["w"], iw), px(cfg["h"], ih)
+    bgx = px(cfg["bg_x"], iw) if "bg_x" in cfg else x + 2
+    bgy = px(cfg["bg_y"], ih) if "bg_y" in cfg else y + 2
+    bg = img.getpixel((bgx, bgy))
+    draw.rectangle((x, y, x + cw, y + ch), fill=bg)
+
+def draw_trade_image(data: dict, percent: float, pnl: float, pnl_usdt: float) -> Image.Image:
+    exchange = data["exchange"]
+    template_path = os.path.join(BASE_DIR, "assets", exchange, "template.png")
+
+    conf = CONFIG
+    cfg = conf.fonts[exchange]
+    layout = conf.layout[exchange]
+    font_regular = os.path.join(BASE_DIR, cfg["files"]["regular"])
+    font_bold = os.path.join(BASE_DIR, cfg["files"]["bold"])
+    sizes = cfg["sizes"]
+
+    # Холст шаблона: грязные с прошлого рендера области уже восстановлены
+    canvas = _canvas(template_path)
+    img = canvas.image
+    draw = canvas.draw()
+
+    clear_keys = [
+        "clear_symbol", "clear_leverage", "clear_side_badge", "clear_entry",
+        "clear_mark", "clear_pnl", "clear_qty", "clear_liq", "clear_margin", "clear_risk",
+    ]
+    for key in clear_keys:
+        if exchange == "bybit" and key == "clear_margin":
+            continue
+        clear_by_layout(img, draw, layout, key)
+
+    WHITE, GREEN, RED, ORANGE = (255,255,255), (0,200,120), (230,60,60), (245,166,89)
+    side_color = GREEN if data["side"] == "long" else RED
+    pnl_color = GREEN if pnl >= 0 else RED
+
+    symbol_font = _load_font(font_bold, sizes["symbol"])
+    pnl_font = _load_font(font_bold, sizes["pnl"])
+    lev_font = _load_font(font_regular, sizes["leverage"])
+
+    w, h = img.size
+
+    def pos(c):
+        return int(c["x"] * w) + c.get("dx", 0), int(c["y"] * h) + c.get("dy", 0)
+
+    symbol_text = data["symbol"]
+    badge_text = "Лонг" if data["side"] == "long" else "Шорт"
+    pnl_text = format_pnl(pnl, pnl_usdt)
+    lev_text = f"Кросс {data['leverage']}x" if exchange == "bybit" else ""
+
+    sx, sy = pos(layout["symbol"])
+    draw.text((sx, sy), symbol_text, fill=WHITE, font=symbol_font, anchor=layout["symbol"]["anchor"])
+
+    bx, by = pos(layout["side_badge"])
+    if exchange == "bybit":
+        sym_bbox = draw.textbbox((0, 0), symbol_text, font=symbol_font)
+        bx = sx + (sym_bbox[2] - sym_bbox[0]) + 75 + layout["side_badge"].get("dx", 0)
+    draw_side_badge(draw, bx, by, badge_text, side_color, exchange, cfg, layout.get("side_badge"))
+
+    px_val, py_val = pos(layout["pnl"])
+    draw.text((px_val, py_val), pnl_text, fill=pnl_color, font=pnl_font, anchor=layout["pnl"]["anchor"])
+
+    lx, ly = pos(layout["leverage"])
+    draw.text((lx, ly), lev_text, fill=WHITE, font=lev_font, anchor=layout["leverage"]["anchor"])
+
+    if exchange == "bingx":
+        badge_font = _load_font(font_regular, sizes["leverage"])
+        mx, my = pos(layout["margin_mode"])
+        lbx, lby = pos(layout["leverage_bingx"])
+        draw_gray_box(draw, mx, my, "Кросс", badge_font, layout["margin_mode"])
+        draw_gray_box(draw, lbx, lby, f"{data['leverage']}x", badge_font, layout["leverage_bingx"])
+
+        # ----- Позиция / qty -----
+    if exchange == "bybit":
+        # Bybit: количество монет
+        qty_value = float(data.get("qty") or 0)
+        qty_text = f"{qty_value:.4f}"
+    else:  # bingx
+        # BingX: маржа * плечо (позиция в USDT)
+        margin = float(data.get("amount") or 0)
+        lev = float(data.get("leverage") or 0)
+        qty_value = margin * lev
+        qty_text = f"{qty_value:.2f}"
+
+    # рисуем qty для ОБЕИХ бирж
+    draw_text(
+        draw,
+        layout,
+        "qty",
+        qty_text,
+        font_regular,
+        sizes["qty"],
+        WHITE,
+        w,
+        h,
+    )
+
+    precision = data.get("price_precision")
+
+    # дальше — ОБЩИЙ вывод цен для обеих бирж
+    draw_text(
+        draw,
+        layout,
+        "entry",
+        format_price(data["entry"], precision),
+        font_regular,
+        sizes["entry"],
+        WHITE,
+        w,
+        h,
+    )
+    draw_text(
+        draw,
+        layout,
+        "mark",
+        format_price(data["mark"], precision),
+        font_regular,
+        sizes["mark"],
+        WHITE,
+        w,
+        h,
+    )
+    draw_text(
+        draw,
+        layout,
+        "liq",
+        format_price(data["liquidation"], precision),
+        font_regular,
+        sizes["liq"],
+        ORANGE,
+        w,
+        h,
+    )
+
+
+    precision = data.get("price_precision")
+
+    if exchange == "bingx":
+        margin_usdt = float(data.get("amount") or 0) * float(data.get("leverage") or 0)
+        draw_text(draw, layout, "margin", f"{data['amount']:.2f}", font_regular, sizes["qty"], WHITE, w, h)
+        draw_text(draw, layout, "entry", format_price(data["entry"], precision), font_regular, sizes["entry"], WHITE, w, h)
+        draw_text(draw, layout, "mark", format_price(data["mark"], precision), font_regular, sizes["mark"], WHITE, w, h)
+        draw_text(draw, layout, "liq", format_price(data["liquidation"], precision), font_regular, sizes["liq"], ORANGE, w, h)
+
+    if exchange == "bingx" and "risk" in layout:
+        entry_v = float(data.get("entry") or 0)
+        qty_v = float(data.get("qty") or 0)
+        margin_v = float(data.get("amount") or 0)
+        pos_margin = entry_v * qty_v
+        if pos_margin and margin_v:
+            risk = margin_v / pos_margin * 100.0
+            risk_text = f"{risk:.2f}%" if round(risk, 2) != 0 else "--"
+            risk_color = GREEN if risk <= 40 else (ORANGE if risk <= 70 else RED)
+        else:
+            risk_text, risk_color = "--", ORANGE
+        rx, ry = pos(layout["risk"])
+        draw.text((rx, ry), risk_text, fill=risk_color,
+                  font=_load_font(font_regular, sizes["leverage"]),
+                  anchor=layout["risk"]["anchor"])
+
+    return img
+
+def encode_trade_image(data: dict, percent: float, pnl: float, pnl_usdt: float) -> tuple[str, bytes]:
+    # Для частых перерисовок (live): байты в памяти, без файла в output/ и его очистки
+    fmt, body = ENCODER.encode(draw_trade_image(data, percent, pnl, pnl_usdt), "result_")
+    return f"result{EXTENSIONS[fmt]}", body
+
+def generate_trade_image(data: dict, percent: float, pnl: float, pnl_usdt: float,
+                         animation: str | None = None) -> str:
+    # animation: "counter" / "replay" — вместо картинки короткая анимация (см. ниже)
+    if animation:
+        return animate_trade_card(data, pnl, pnl_usdt, animation)[0]
+    return save_card(draw_trade_image(data, percent, pnl, pnl_usdt), "output", "result_")
+
+
+# =====================================================
+# КАСТОМНЫЕ КАРТИНКИ
+# =====================================================
+def draw_custom_bybit_image(data: dict) -> Image.Image:
+    try:
+        pnl = float(str(data["pnl"]).replace("%", "").replace(",", "."))
+    except ValueError:
+        pnl = 0.0
+    template_side = "long" if pnl >= 0 else "short"
+    template_path = os.path.join(BASE_DIR, "assets", "bybit", f"screenshot_{template_side}.png")
+
+    canvas = _canvas(template_path)
+    w, h = canvas.size
+    draw = canvas.draw()
+    conf = CONFIG
+    cfg = conf.fonts["custom_bybit"]
+    layout = conf.custom_layout["bybit"]
+
+    icon_path = os.path.join(BASE_DIR, "assets", "bybit", "icon.png")
+    cfg_icon = layout.get("symbol_icon")
+    if cfg_icon:
+        size = cfg_icon.get("size", 60)
+        icon = COIN_ICONS.get(base_asset(data["symbol"]), size)
+        if icon is None and os.path.exists(icon_path):
+            icon = _load_icon(icon_path, size)
+        if icon is not None:
+            canvas.paste(icon, (int(cfg_icon["x"] * w) + cfg_icon.get("dx", 0),
+                                int(cfg_icon["y"] * h) + cfg_icon.get("dy", 0)), icon)
+
+    fp = lambda name, bold=False: os.path.join(BASE_DIR, cfg["files"]["bold" if bold else "regular"])
+    username_font = _load_font(fp("regular"), cfg["sizes"]["username"])
+    symbol_font = _load_font(fp("bold", True), cfg["sizes"]["symbol"])
+    pnl_abs = abs(pnl)
+    pnl_size = 80 if pnl_abs > 99 else (100 if pnl_abs > 49 else cfg["sizes"]["pnl"])
+    pnl_font = _load_font(fp("bold", True), pnl_size)
+    entry_font = _load_font(fp("bold", True), cfg["sizes"]["entry"])
+    exit_font = _load_font(fp("bold", True), cfg["sizes"]["exit"])
+    lev_font = _load_font(fp("regular"), cfg["sizes"]["leverage_text"])
+
+    WHITE, GREEN, RED = (255,255,255), (0,200,120), (230,60,60)
+
+    def pos(c):
+        return int(c["x"] * w) + c.get("dx", 0), int(c["y"] * h) + c.get("dy", 0)
+
+    if "username" in data and "username" in layout:
+        draw.text(pos(layout["username"]), data["username"], fill=WHITE, font=username_font, anchor="lm")
+    if "symbol" in layout:
+        draw.text(pos(layout["symbol"]), data["symbol"], fill=WHITE, font=symbol_font, anchor="lm")
+    if "pnl" in layout:
+        pnl_color = GREEN if pnl >= 0 else RED
+        draw.text(pos(layout["pnl"]), f"{pnl:+.2f}%", fill=pnl_color, font=pnl_font, anchor="lm")
+    if "entry" in layout:
+        draw.text(pos(layout["entry"]), format_price(data["entry"]), fill=WHITE, font=entry_font, anchor="lm")
+    if "exit" in layout:
+        draw.text(pos(layout["exit"]), format_price(data["exit"]), fill=WHITE, font=exit_font, anchor="lm")
+    if "cross_leverage" in layout:
+        direction_text = "Лонг" if data["side"] == "long" else "Шорт"
+        leverage_num = float(str(data["leverage"]).replace("x", ""))
+        lev_text = f"{direction_text} {leverage_num:.1f}X"
+        base_x = layout["cross_leverage"]["x"] * w
+        shift_x = len(data["symbol"]) * 10 + 100
+        lev_pos = (base_x + shift_x, layout["cross_leverage"]["y"] * h)
+        padding_x, padding_y = 16, 10
+        bbox = draw.textbbox((0, 0), lev_text, font=lev_font)
+        box_w = bbox[2] - bbox[0] + padding_x * 2
+        box_h = bbox[3] - bbox[1] + padding_y * 2
+        x1, y1 = lev_pos[0] - box_w // 2, lev_pos[1] - box_h // 2
+        x2, y2 = x1 + box_w, y1 + box_h
+        # Полупрозрачная плашка: оверлей размером с её рамку, а не со всю картинку
+        ox, oy = math.floor(x1), math.floor(y1)
+        overlay = Image.new("RGBA", (math.ceil(x2) - ox + 1, math.ceil(y2) - oy + 1), (0, 0, 0, 0))
+        ImageDraw.Draw(overlay).rounded_rectangle([x1 - ox, y1 - oy, x2 - ox, y2 - oy],
+                                                  radius=65, fill=(35, 35, 35, 100))
+        canvas.composite(overlay, (ox, oy))
+        text_color = GREEN if data["side"] == "long" else RED
+        draw.text(lev_pos, lev_text, fill=text_color, font=lev_font, anchor="mm")
+
+    return canvas.image
+
+
+def generate_custom_bybit_image(data: dict, animation: str | None = None) -> str:
+    if animation:
+        return animate_custom_card(data, "bybit", animation)[0]
+    return save_card(draw_custom_bybit_image(data), "images", "custom_bybit_")
+
+
+def draw_custom_bingx_image(data: dict) -> Image.Image:
+    try:
+        pnl = float(str(data["pnl"]).replace("%", "").replace(",", "."))
+    except ValueError:
+        pnl = 0.0
+    template_side = "long" if pnl >= 0 else "short"
+    template_path = os.path.join(BASE_DIR, "assets", "bingx", f"screenshot_{template_side}.png")
+
+    if not os.path.exists(template_path):
+        raise FileNotFoundError(f"Создай {template_path}")
+
+    canvas = _canvas(template_path)
+    draw = canvas.draw()
+    w, h = canvas.size
+    conf = CONFIG
+    cfg = conf.fonts["custom_bingx"]
+    layout = conf.custom_layout["bingx"]
+
+    fp_r = os.path.join(BASE_DIR, cfg["files"]["regular"])
+    fp_b = os.path.join(BASE_DIR, cfg["files"]["bold"])
+    username_font = _load_font(fp_r, cfg["sizes"]["username"])
+    symbol_font = _load_font(fp_b, cfg["sizes"]["symbol"])
+    pnl_font = _load_font(fp_b, cfg["sizes"]["pnl"])
+    entry_font = _load_font(fp_b, cfg["sizes"]["entry"])
+    exit_font = _load_font(fp_b, cfg["sizes"]["exit"])
+    lev_font = _load_font(fp_r, cfg["sizes"]["leverage_text"])
+    small_font = _load_font(fp_r, cfg["sizes"].get("leverage_text", 36))
+
+    draw_custom_bingx_lines(canvas, data, layout, small_font, symbol_font, w, h)
+
+    WHITE, GREEN, RED, GRAY = (255,255,255), (0,200,120), (230,60,60), (150,150,150)
+
+    def pos(c):
+        return int(c["x"] * w), int(c["y"] * h)
+
+    if "username" in data and "username" in layout:
+        draw.text(pos(layout["username"]), data["username"], fill=WHITE, font=username_font)
+    if "symbol" in layout:
+        draw.text(pos(layout["symbol"]), data["symbol"], fill=WHITE, font=symbol_font)
+    if "pnl" in layout:
+        pnl_color = GREEN if pnl >= 0 else RED
+        draw.text(pos(layout["pnl"]), f"{pnl:+.2f}%", fill=pnl_color, font=pnl_font)
+    if "entry" in layout:
+        draw.text(pos(layout["entry"]), format_price(data["entry"]), fill=WHITE, font=entry_font)
+    if "exit" in layout:
+        draw.text(pos(layout["exit"]), format_price(data["exit"]), fill=WHITE, font=exit_font)
+    datetime_text = data.get("datetime_str", "").strip()
+    referral_code = data.get("referral", "").strip()
+    if datetime_text and "datetime" in layout:
+        draw.text(pos(layout["datetime"]), datetime_text, fill=GRAY, font=small_font)
+    if referral_code and "referral" in layout:
+        draw.text(pos(layout["referral"]), referral_code, fill=WHITE, font=small_font)
+
+    return canvas.image
+
+
+def generate_custom_bingx_image(data: dict, animation: str | None = None) -> str:
+    if animation:
+        return animate_custom_card(data, "bingx", animation)[0]
+    return save_card(draw_custom_bingx_image(data), "images", "custom_bingx_")
+
+
+def draw_custom_bingx_lines(canvas, data, layout, font_side, font_symbol, w, h):
+    symbol = data["symbol"]
+    cfg = layout.get("lines")
+    if not cfg:
+        return
+    line_path = os.path.join(BASE_DIR, "assets", "bingx", "line.png")
+    if not os.path.exists(line_path):
+        return
+    size = int(cfg.get("size", 80))
+    line = _load_icon(line_path, size)
+    base_x = int(cfg["x"] * w + cfg.get("dx", 0))
+    base_y = int(cfg["y"] * h + cfg.get("dy", 0))
+    draw = canvas.draw()
+    bbox_sym = draw.textbbox((0, 0), symbol, font=font_symbol)
+    sym_width = bbox_sym[2] - bbox_sym[0]
+    gap = cfg.get("gap", 10)
+    spacing = cfg.get("spacing", 221)
+    x1, y1 = base_x + sym_width + gap, base_y
+    x2, y2 = x1 + size + spacing, base_y
+    canvas.paste(line, (x1, y1), line)
+    canvas.paste(line, (x2, y2), line)
+    side_cfg = layout.get("side_position", {})
+    side_x = int(side_cfg.get("x", 0.5) * w)
+    side_y = int(side_cfg.get("y", 0.335) * h)
+    side_text = "Лонг" if data.get("side") == "long" else "Шорт"
+    side_color = (0, 200, 120) if data.get("side") == "long" else (230, 60, 60)
+    draw.text((side_x, side_y), side_text, fill=side_color, font=font_side, anchor=side_cfg.get("anchor", "lm"))
+    lev_cfg = layout.get("leverage_position", {})
+    lev_x = int(lev_cfg.get("x", 0.15) * w)
+    lev_y = int(lev_cfg.get("y", 0.335) * h)
+    lev_raw = str(data.get("leverage", "")).replace("x", "").upper()
+    if lev_raw:
+        draw.text((lev_x, lev_y), f"{lev_raw}X", fill=(255, 255, 255), font=font_side,
+                  anchor=lev_cfg.get("anchor", "lm"))
+
+
+# =====================================================
+# АНИМАЦИИ (utils/animation.py): счётчик PnL от нуля («counter») или прогон
+# цены по пути («replay»). Статичный слой — обычная функция рисования
+# карточки, в которой холст перехватывает PnL и цену (Canvas.captured);
+# кадры рисуют только их. Кадров ANIMATION_FRAMES, бюджет на запрос —
+# ANIMATION_MAX_SECONDS, формат — ANIMATION_FORMAT (gif, mp4 при ffmpeg).
+# =====================================================
+ANIMATION_FRAMES = max(2, int(os.getenv("ANIMATION_FRAMES", "36")))
+ANIMATION_FPS = float(os.getenv("ANIMATION_FPS", "18"))
+ANIMATION_MAX_SECONDS = float(os.getenv("ANIMATION_MAX_SECONDS", "4"))
+ANIMATION_FORMAT = os.getenv("ANIMATION_FORMAT", "gif")
+# Цена-заглушка статичного слоя: её строка не совпадёт ни с одной надписью карточки
+_PRICE_STUB = 987654321.123
+
+@contextlib.contextmanager
+def _capturing(texts):
+    captured = {text: [] for text in texts}
+    _canvases.capture = captured
+    try:
+        yield captured
+    finally:
+        _canvases.capture = None
+
+def _price_path(start: float, end: float, prices, n: int) -> np.ndarray:
+    # Цена на n кадров: история (растянутая или прореженная) или плавно от start к end
+    if prices is not None and len(prices) >= 2:
+        prices = np.asarray(prices, dtype=np.float64)
+        path = np.interp(np.linspace(0, len(prices) - 1, n), np.arange(len(prices)), prices)
+    else:
+        path = start + (end - start) * np.asarray(ease_out(n))
+    path[0], path[-1] = start, end
+    return path
+
+def _frame(captured: dict, values: dict) -> list:
+    # values: перехваченная строка -> (текст кадра, цвет или None — как на карточке)
+    texts = []
+    for key, (text, fill) in values.items():
+        for xy, captured_fill, font, anchor, _ in captured[key]:
+            texts.append((xy, text, fill or captured_fill, font, anchor))
+    return texts
+
+def _pnl_color(value: float) -> tuple:
+    return (0, 200, 120) if value >= 0 else (230, 60, 60)
+
+def _save_animation(static: Image.Image, frames: list, subdir: str, prefix: str,
+                    fmt: str | None) -> tuple[str, dict]:
+    fmt = available_format(fmt or ANIMATION_FORMAT)
+    output_dir = os.path.join(BASE_DIR, subdir)
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{prefix}{uuid.uuid4().hex[:8]}{ANIMATION_EXTENSIONS[fmt]}")
+    stats = render_animation(static, frames, path, fmt, ANIMATION_FPS, ANIMATION_MAX_SECONDS)
+    _cleanup_old_files(output_dir, prefix)
+    log.info("animation rendered", extra={"fields": {"prefix": prefix, **stats}})
+    return path, stats
+
+def _trade_layer(data: dict, percent: float, pnl_usdt: float, mode: str = "counter"):
+    # Статичный слой анимации и захваченные «живые» надписи (PnL, в replay — марк).
+    # Отдельно, чтобы golden.py сверял ровно тот слой, поверх которого идут кадры
+    pnl_key = format_pnl(percent, pnl_usdt)
+    mark_key = format_price(_PRICE_STUB, data.get("price_precision")) if mode == "replay" else None
+    if mark_key is None:
+        with _capturing((pnl_key,)) as captured:
+            static = draw_trade_image(data, percent, percent, pnl_usdt).convert("RGB")
+    else:
+        with _capturing((pnl_key, mark_key)) as captured:
+            static = draw_trade_image({**data, "mark": _PRICE_STUB}, percent, percent, pnl_usdt).convert("RGB")
+    return static, captured, pnl_key, mark_key
+
+def animate_trade_card(data: dict, percent: float, pnl_usdt: float, mode: str = "counter",
+                       prices=None, fmt: str | None = None) -> tuple[str, dict]:
+    # counter — PnL растёт от нуля до итога; replay — марк идёт от входа
+    # (или по prices) к текущему, PnL пересчитывается на каждом кадре
+    n = ANIMATION_FRAMES
+    precision = data.get("price_precision")
+    static, captured, pnl_key, mark_key = _trade_layer(data, percent, pnl_usdt, mode)
+    if mark_key is not None:
+        frames = []
+        for mark in _price_path(data["entry"], data["mark"], prices, n)[:-1].tolist():
+            usdt, _, pct = calculate_pnl_linear(data["entry"], mark, data["qty"], data["side"], data["leverage"])
+            frames.append(_frame(captured, {pnl_key: (format_pnl(pct, usdt), _pnl_color(usdt)),
+                                            mark_key: (format_price(mark, precision), None)}))
+        frames.append(_frame(captured, {pnl_key: (pnl_key, None),
+                                        mark_key: (format_price(data["mark"], precision), None)}))
+    else:
+        frames = [
+            _frame(captured, {pnl_key: (format_pnl(percent * t, pnl_usdt * t), None)})
+            for t in ease_out(n)[:-1]
+        ]
+        frames.append(_frame(captured, {pnl_key: (pnl_key, None)}))
+    return _save_animation(static, frames, "output", "anim_", fmt)
+
+def _custom_layer(data: dict, exchange: str = "bybit", mode: str = "counter"):
+    # То же для кастомных карточек: слой, надписи, итоговый PnL, ключи PnL и цены выхода
+    draw = draw_custom_bingx_image if exchange == "bingx" else draw_custom_bybit_image
+    try:
+        pnl = float(str(data["pnl"]).replace("%", "").replace(",", "."))
+    except ValueError:
+        pnl = 0.0
+    pnl_key = f"{pnl:+.2f}%"
+    exit_key = format_price(_PRICE_STUB) if mode == "replay" else None
+    if exit_key is None:
+        with _capturing((pnl_key,)) as captured:
+            static = draw(data).convert("RGB")
+    else:
+        with _capturing((pnl_key, exit_key)) as captured:
+            static = draw({**data, "exit": _PRICE_STUB}).convert("RGB")
+    return static, captured, pnl, pnl_key, exit_key
+
+def animate_custom_card(data: dict, exchange: str = "bybit", mode: str = "counter",
+                        prices=None, fmt: str | None = None) -> tuple[str, dict]:
+    # То же для кастомных карточек; в replay цена выхода идёт от входа по prices
+    # (закрытия свечей из klines.py) к выходу. Шаблон (long/short) — по итогу
+    n = ANIMATION_FRAMES
+    static, captured, pnl, pnl_key, exit_key = _custom_layer(data, exchange, mode)
+    if exit_key is not None:
+        entry, exit_price = float(data["entry"]), float(data["exit"])
+        sign = 1.0 if data["side"] == "long" else -1.0
+        move = sign * (exit_price - entry)
+        frames = []
+        for price in _price_path(entry, exit_price, prices, n)[:-1].tolist():
+            # PnL пропорционален ходу цены: плечо уже сидит в итоговом pnl
+            value = pnl * sign * (price - entry) / move if move else 0.0
+            frames.append(_frame(captured, {pnl_key: (f"{value:+.2f}%", _pnl_color(value)),
+                                            exit_key: (format_price(price), None)}))
+        frames.append(_frame(captured, {pnl_key: (pnl_key, None), exit_key: (format_price(exit_price), None)}))
+    else:
+        frames = [_frame(captured, {pnl_key: (f"{pnl * t:+.2f}%", None)}) for t in ease_out(n)[:-1]]
+        frames.append(_frame(captured, {pnl_key: (pnl_key, None)}))
+    return _save_animation(static, frames, "images", f"anim_custom_{exchange}_", fmt)
+
+
+# =====================================================
+# ЛЕСЕНКА СЦЕНАРИЕВ: ROI по сетке «цена марк × плечо» (scenarios.py).
+# Крупная сетка — тепловая карта, мелкая — таблица с числами в ячейках.
+# =====================================================
+SCENARIO_W = 1200
+_SC_NEUTRAL = np.array((45, 45, 45), dtype=np.float32)
+_SC_GREEN = np.array((0, 200, 120), dtype=np.float32)
+_SC_RED = np.array((230, 60, 60), dtype=np.float32)
+_SC_LIQ = (110, 70, 35)
+
+def _roi_colors(roi: np.ndarray, liquidated: np.ndarray, clip: float) -> np.ndarray:
+    t = np.clip(roi / clip, -1.0, 1.0)[..., None]
+    colors = np.where(t >= 0, _SC_NEUTRAL + (_SC_GREEN - _SC_NEUTRAL) * t,
+                      _SC_NEUTRAL + (_SC_RED - _SC_NEUTRAL) * -t)
+    colors[liquidated] = _SC_LIQ
+    return colors.astype(np.uint8)
+
+def draw_scenario_image(data: dict, marks=None, leverages=None) -> Image.Image:
+    exchange = data.get("exchange", "bybit")
+    entry, amount, side = float(data["entry"]), float(data["amount"]), data["side"]
+    marks = mark_ladder(entry) if marks is None else marks
+    leverages = DEFAULT_LEVERAGES if leverages is None else leverages
+    tiers = RISK_LIMITS.table(exchange, data.get("symbol", ""))
+    grid = scenario_grid(exchange, side, entry, amount, marks, leverages, tiers)
+    roi, liquidated = grid["roi"], grid["liquidated"]
+    rows, cols = roi.shape
+
+    cfg = CONFIG.fonts[exchange]
+    font_regular = os.path.join(BASE_DIR, cfg["files"]["regular"])
+    font_bold = os.path.join(BASE_DIR, cfg["files"]["bold"])
+    title_font = _load_font(font_bold, 44)
+    small_font = _load_font(font_regular, 22)
+    cell_font = _load_font(font_regular, 20)
+
+    pad, left, top = 40, 190, 190
+    cell_w = (SCENARIO_W - left - pad) // cols
+    cell_h = max(4, min(44, 1100 // rows))
+    table = cell_h >= 30 and cell_w >= 60
+    grid_w, grid_h = cell_w * cols, cell_h * rows
+    height = top + grid_h + 110
+
+    # Фон — цвет угла шаблона биржи из общего кэша шаблонов
+    template = _load_template(os.path.join(BASE_DIR, "assets", exchange, "template.png"))
+    bg = template.getpixel((4, 4))[:3]
+    img = Image.new("RGB", (SCENARIO_W, height), bg)
+    draw = ImageDraw.Draw(img)
+
+    WHITE, GRAY = (255, 255, 255), (150, 150, 150)
+    side_text = "Лонг" if side == "long" else "Шорт"
+    draw.text((pad, 50), f"{data.get('symbol', '')} {side_text}", fill=WHITE, font=title_font, anchor="lm")
+    draw.text((pad, 100), f"Вход {format_price(entry)} · маржа {amount:g}$", fill=WHITE,
+              font=small_font, anchor="lm")
+    draw.text((pad, 132), "ROI % по цене марк и плечу; оранжевым — ликвидация", fill=GRAY,
+              font=small_font, anchor="lm")
+
+    finite = roi[~liquidated]
+    clip = float(np.percentile(np.abs(finite), 95)) if finite.size else 100.0
+    clip = max(clip, 1.0)
+    cells = Image.fromarray(_roi_colors(roi, liquidated, clip), "RGB")
+    img.paste(cells.resize((grid_w, grid_h), Image.NEAREST), (left, top))
+
+    # Плечи над столбцами
+    for j, lev in enumerate(grid["leverages"]):
+        draw.text((left + j * cell_w + cell_w // 2, top - 18), f"{lev:g}x", fill=WHITE,
+                  font=cell_font, anchor="mm")
+    # Цены слева: не чаще, чем раз в 30 px
+    label_every = max(1, math.ceil(30 / cell_h))
+    for i in range(0, rows, label_every):
+        draw.text((left - 12, top + i * cell_h + cell_h // 2), format_price(float(grid["marks"][i])),
+                  fill=WHITE, font=cell_font, anchor="rm")
+    # Строка ближайшей к входу цены
+    i_entry = int(np.argmin(np.abs(grid["marks"] - entry)))
+    y = top + i_entry * cell_h
+    draw.rectangle((left, y, left + grid_w - 1, y + cell_h - 1), outline=WHITE, width=2)
+
+    if table:
+        for i in range(rows):
+            for j in range(cols):
+                text = "ликв." if liquidated[i, j] else f"{roi[i, j]:+.0f}%"
+                draw.text((left + j * cell_w + cell_w // 2, top + i * cell_h + cell_h // 2), text,
+                          fill=WHITE, font=cell_font, anchor="mm")
+
+    # Шкала
+    bar_y = top + grid_h + 45
+    bar = np.linspace(-clip, clip, grid_w)[None, :]
+    bar_img = Image.fromarray(_roi_colors(bar, np.zeros_like(bar, dtype=bool), clip), "RGB")
+    img.paste(bar_img.resize((grid_w, 18), Image.NEAREST), (left, bar_y))
+    draw.text((left, bar_y + 40), f"{-clip:+.0f}%", fill=WHITE, font=cell_font, anchor="lm")
+    draw.text((left + grid_w, bar_y + 40), f"{clip:+.0f}%", fill=WHITE, font=cell_font, anchor="rm")
+    return img
+
+def generate_scenario_image(data: dict, marks=None, leverages=None) -> str:
+    return save_card(draw_scenario_image(data, marks, leverages), "output", "scenario_")
+
+
+# =====================================================
+# МАРАФОН: кривая капитала по истории сделок (marathon.trade_stats)
+# =====================================================
+EQUITY_W, EQUITY_H = 1200, 760
+
+def _envelope(values: np.ndarray, width: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Точек больше, чем пикселей, — min/max по каждому столбцу одним reduceat
+    n = len(values)
+    if n <= width:
+        xs = np.linspace(0, width - 1, n) if n > 1 else np.zeros(1)
+        return xs, values, values
+    edges = np.linspace(0, n, width + 1).astype(np.int64)[:-1]
+    return np.arange(width), np.minimum.reduceat(values, edges), np.maximum.reduceat(values, edges)
+
+def draw_equity_image(stats: dict, exchange: str = "bybit") -> Image.Image:
+    equity = stats["equity"]
+    cfg = CONFIG.fonts[exchange]
+    font_regular = os.path.join(BASE_DIR, cfg["files"]["regular"])
+    font_bold = os.path.join(BASE_DIR, cfg["files"]["bold"])
+    title_font = _load_font(font_bold, 44)
+    value_font = _load_font(font_bold, 30)
+    small_font = _load_font(font_regular, 22)
+
+    template = _load_template(os.path.join(BASE_DIR, "assets", exchange, "template.png"))
+    bg = template.getpixel((4, 4))[:3]
+    img = Image.new("RGB", (EQUITY_W, EQUITY_H), bg)
+    draw = ImageDraw.Draw(img)
+
+    WHITE, GRAY = (255, 255, 255), (150, 150, 150)
+    GREEN, RED = (0, 200, 120), (230, 60, 60)
+    pad = 40
+    color = GREEN if stats["pnl"] >= 0 else RED
+    draw.text((pad, 50), "Марафон", fill=WHITE, font=title_font, anchor="lm")
+    draw.text((EQUITY_W - pad, 50), f"{stats['balance']:,.2f} USDT", fill=WHITE, font=title_font, anchor="rm")
+    draw.text((EQUITY_W - pad, 100), f"{stats['pnl']:+,.2f} USDT ({stats['pnl_pct']:+.2f}%)",
+              fill=color, font=small_font, anchor="rm")
+    draw.text((pad, 100), f"Старт {stats['start']:,.2f} USDT", fill=GRAY, font=small_font, anchor="lm")
+
+    pf = stats["profit_factor"]
+    cells = (
+        ("Сделок", f"{stats['trades']}"),
+        ("Винрейт", f"{stats['win_rate'] * 100:.1f}%"),
+        ("Просадка", f"{stats['max_drawdown'] * 100:.1f}%"),
+        ("Profit factor", "∞" if pf == float("inf") else f"{pf:.2f}"),
+        ("Sharpe/сделка", f"{stats['sharpe']:.2f}"),
+    )
+    cell_w = (EQUITY_W - 2 * pad) // len(cells)
+    for k, (label, value) in enumerate(cells):
+        x = pad + k * cell_w
+        draw.text((x, 150), label, fill=GRAY, font=small_font, anchor="lm")
+        draw.text((x, 188), value, fill=WHITE, font=value_font, anchor="lm")
+
+    left, top, right, bottom = 130, 250, EQUITY_W - pad, EQUITY_H - 60
+    plot_w, plot_h = right - left, bottom - top
+    lo, hi = float(equity.min()), float(equity.max())
+    span = (hi - lo) or max(abs(hi), 1.0) * 0.1
+    lo, hi = lo - span * 0.05, hi + span * 0.05
+    to_y = lambda v: bottom - (v - lo) / (hi - lo) * plot_h
+    to_x = lambda i: left + (i / (len(equity) - 1) * plot_w if len(equity) > 1 else 0)
+
+    for k in range(5):
+        value = lo + (hi - lo) * k / 4
+        y = to_y(value)
+        draw.line((left, y, right, y), fill=(70, 70, 70), width=1)
+        draw.text((left - 12, y), f"{value:,.0f}" if span >= 50 else f"{value:,.2f}",
+                  fill=GRAY, font=small_font, anchor="rm")
+    draw.line((left, to_y(stats["start"]), right, to_y(stats["start"])), fill=GRAY, width=1)
+
+    # Максимальная просадка — полоса от пика до дна
+    if stats["max_drawdown"] > 0:
+        shade = tuple(int(b + (r - b) * 0.25) for b, r in zip(bg, RED))
+        draw.rectangle((to_x(stats["dd_peak"]), top, to_x(stats["dd_trough"]), bottom), fill=shade)
+
+    xs, mins, maxs = _envelope(equity, plot_w)
+    if len(equity) <= plot_w:
+        points = [(left + float(x), to_y(float(v))) for x, v in zip(xs, mins)]
+        if len(points) > 1:
+            draw.line(points, fill=color, width=3, joint="curve")
+    else:
+        # Зигзаг max/min по столбцам: и огибающая, и связность одной линией
+        ys_max, ys_min = to_y(maxs), to_y(mins)
+        points = [pt for x, a, b in zip(xs.tolist(), ys_max.tolist(), ys_min.tolist())
+                  for pt in ((left + x, a), (left + x, b))]
+        draw.line(points, fill=color, width=2)
+
+    draw.text((left, bottom + 30), "0", fill=GRAY, font=small_font, anchor="mm")
+    draw.text((right, bottom + 30), f"{stats['trades']} сделок", fill=GRAY, font=small_font, anchor="rm")
+    return img
+
+def generate_equity_image(stats: dict, exchange: str = "bybit") -> str:
+    return save_card(draw_equity_image(stats, exchange), "output", "equity_")
+
+
+# =====================================================
+# МАРАФОН: рейтинг участников (marathon.Leaderboard.top)
+# =====================================================
+LEADERBOARD_W = 1000
+
+def draw_leaderboard_image(rows: list, total: int, exchange: str = "bybit") -> Image.Image:
+    cfg = CONFIG.fonts[exchange]
+    font_regular = os.path.join(BASE_DIR, cfg["files"]["regular"])
+    font_bold = os.path.join(BASE_DIR, cfg["files"]["bold"])
+    title_font = _load_font(font_bold, 44)
+    row_font = _load_font(font_regular, 30)
+    row_bold = _load_font(font_bold, 30)
+    small_font = _load_font(font_regular, 22)
+
+    pad, top, row_h = 40, 150, 64
+    height = top + max(len(rows), 1) * row_h + pad
+    template = _load_template(os.path.join(BASE_DIR, "assets", exchange, "template.png"))
+    bg = template.getpixel((4, 4))[:3]
+    img = Image.new("RGB", (LEADERBOARD_W, height), bg)
+    draw = ImageDraw.Draw(img)
+
+    WHITE, GRAY = (255, 255, 255), (150, 150, 150)
+    GREEN, RED = (0, 200, 120), (230, 60, 60)
+    MEDALS = ((255, 200, 60), (200, 200, 210), (205, 127, 50))
+    stripe = tuple(min(c + 14, 255) for c in bg)
+    draw.text((pad, 55), "Рейтинг марафона", fill=WHITE, font=title_font, anchor="lm")
+    draw.text((pad, 105), f"Участников: {total}", fill=GRAY, font=small_font, anchor="lm")
+    if not rows:
+        draw.text((pad, top + row_h // 2), "Пока никого", fill=GRAY, font=row_font, anchor="lm")
+        return img
+
+    for k, (place, name, return_pct, balance) in enumerate(rows):
+        y = top + k * row_h
+        if k % 2 == 0:
+            draw.rectangle((pad - 16, y, LEADERBOARD_W - pad + 16, y + row_h - 1), fill=stripe)
+        cy = y + row_h // 2
+        place_color = MEDALS[place - 1] if place <= len(MEDALS) else GRAY
+        draw.text((pad + 30, cy), str(place), fill=place_color, font=row_bold, anchor="mm")
+        name = name if len(name) <= 22 else name[:21] + "…"
+        draw.text((pad + 80, cy), name, fill=WHITE, font=row_font, anchor="lm")
+        draw.text((LEADERBOARD_W - pad - 220, cy), f"{balance:,.2f}", fill=GRAY, font=row_font, anchor="rm")
+        draw.text((LEADERBOARD_W - pad, cy), f"{return_pct:+.2f}%",
+                  fill=GREEN if return_pct >= 0 else RED, font=row_bold, anchor="rm")
+    return img
+
+def generate_leaderboard_image(rows: list, total: int, exchange: str = "bybit") -> str:
+    return save_card(draw_leaderboard_image(rows, total, exchange), "output", "leaderboard_")
+
+
+# =====================================================
+# МАРАФОН: Монте-Карло прогноз (projection.simulate) — веер перцентилей
+# =====================================================
+def draw_projection_image(result: dict, subtitle: str = "", exchange: str = "bybit") -> Image.Image:
+    bands = result["bands"]
+    percentiles = result["percentiles"]
+    cfg = CONFIG.fonts[exchange]
+    font_regular = os.path.join(BASE_DIR, cfg["files"]["regular"])
+    font_bold = os.path.join(BASE_DIR, cfg["files"]["bold"])
+    title_font = _load_font(font_bold, 44)
+    value_font = _load_font(font_bold, 30)
+    small_font = _load_font(font_regular, 22)
+
+    template = _load_template(os.path.join(BASE_DIR, "assets", exchange, "template.png"))
+    bg = template.getpixel((4, 4))[:3]
+    img = Image.new("RGB", (EQUITY_W, EQUITY_H), bg)
+    draw = ImageDraw.Draw(img)
+
+    WHITE, GRAY = (255, 255, 255), (150, 150, 150)
+    BLUE, RED = (70, 150, 255), (230, 60, 60)
+    pad = 40
+    draw.text((pad, 50), f"Прогноз на {result['trades']} сделок", fill=WHITE, font=title_font, anchor="lm")
+    draw.text((pad, 100), subtitle or f"{result['paths']} путей", fill=GRAY, font=small_font, anchor="lm")
+
+    lo_band, hi_band = bands[0, -1], bands[-1, -1]
+    cells = (
+        ("Медиана", f"{result['median']:,.2f}"),
+        (f"{percentiles[0]}–{percentiles[-1]}%", f"{lo_band:,.0f} – {hi_band:,.0f}"),
+        ("В плюсе", f"{result['profit_probability'] * 100:.1f}%"),
+        ("Слив", f"{result['ruin_probability'] * 100:.1f}%"),
+    )
+    cell_w = (EQUITY_W - 2 * pad) // len(cells)
+    for k, (label, value) in enumerate(cells):
+        x = pad + k * cell_w
+        draw.text((x, 150), label, fill=GRAY, font=small_font, anchor="lm")
+        color = RED if label == "Слив" and result["ruin_probability"] > 0 else WHITE
+        draw.text((x, 188), value, fill=color, font=value_font, anchor="lm")
+
+    left, top, right, bottom = 130, 250, EQUITY_W - pad, EQUITY_H - 60
+    plot_w, plot_h = right - left, bottom - top
+    # У модели «тейк или стоп» перцентили прыгают по чётности числа сделок;
+    # на графике усредняем соседние точки (цифры в шапке — без сглаживания)
+    if bands.shape[1] > 3:
+        bands = bands.copy()
+        bands[:, 2:] = (bands[:, 2:] + bands[:, 1:-1]) / 2
+    lo, hi = float(bands.min()), float(bands.max())
+    span = (hi - lo) or max(abs(hi), 1.0) * 0.1
+    lo, hi = max(lo - span * 0.05, 0.0), hi + span * 0.05
+    xs = left + np.linspace(0, plot_w, bands.shape[1])
+    ys = bottom - (bands - lo) / (hi - lo) * plot_h
+
+    for k in range(5):
+        value = lo + (hi - lo) * k / 4
+        y = bottom - (value - lo) / (hi - lo) * plot_h
+        draw.line((left, y, right, y), fill=(70, 70, 70), width=1)
+        draw.text((left - 12, y), f"{value:,.0f}" if span >= 50 else f"{value:,.2f}",
+                  fill=GRAY, font=small_font, anchor="rm")
+    start_y = bottom - (result["balance"] - lo) / (hi - lo) * plot_h
+    draw.line((left, start_y, right, start_y), fill=GRAY, width=1)
+
+    # Полосы: внешняя (5–95) светлее, внутренняя (25–75) насыщеннее
+    mid = len(percentiles) // 2
+    for k in range(mid):
+        alpha = 0.2 + 0.2 * k
+        fill = tuple(int(b + (c - b) * alpha) for b, c in zip(bg, BLUE))
+        upper = list(zip(xs.tolist(), ys[-1 - k].tolist()))
+        lower = list(zip(xs.tolist(), ys[k].tolist()))
+        draw.polygon(upper + lower[::-1], fill=fill)
+    draw.line(list(zip(xs.tolist(), ys[mid].tolist())), fill=WHITE, width=3, joint="curve")
+
+    draw.text((left, bottom + 30), "сейчас", fill=GRAY, font=small_font, anchor="lm")
+    draw.text((right, bottom + 30), f"+{result['trades']} сделок", fill=GRAY, font=small_font, anchor="rm")
+    return img
+
+def generate_projection_image(result: dict, subtitle: str = "", exchange: str = "bybit") -> str:
+    return save_card(draw_projection_image(result, subtitle, exchange), "output", "projection_")
+
+
+# =====================================================
+# ПРОГРЕВ: все шаблоны, шрифты и иконки грузятся заранее,
+# чтобы первые пользователи после деплоя не платили за декод PNG и FreeType
+# =====================================================
+def template_paths() -> list[str]:
+    return [
+        os.path.join(BASE_DIR, "assets", exchange, name)
+        for exchange, name in (
+            ("bybit", "template.png"),
+            ("bingx", "template.png"),
+            ("bybit", "screenshot_long.png"),
+            ("bybit", "screenshot_short.png"),
+            ("bingx", "screenshot_long.png"),
+            ("bingx", "screenshot_short.png"),
+        )
+    ]
+
+def _font_jobs() -> set[tuple[str, int]]:
+    # Те же (файл, размер), что запрашивают генераторы
+    fonts = CONFIG.fonts
+    jobs: set[tuple[str, int]] = set()
+    for exchange in ("bybit", "bingx"):
+        cfg = fonts[exchange]
+        sizes = cfg["sizes"]
+        regular = os.path.join(BASE_DIR, cfg["files"]["regular"])
+        bold = os.path.join(BASE_DIR, cfg["files"]["bold"])
+        jobs.update((bold, sizes[key]) for key in ("symbol", "pnl"))
+        jobs.update((regular, sizes[key]) for key in ("leverage", "qty", "entry", "mark", "liq"))
+        template = os.path.join(BASE_DIR, "assets", exchange, "template.png")
+        if os.path.exists(template):
+            with Image.open(template) as img:
+                jobs.add((regular, scale_font(sizes["badge"], img.size[1])))
+    for name in ("custom_bybit", "custom_bingx"):
+        cfg = fonts[name]
+        sizes = cfg["sizes"]
+        regular = os.path.join(BASE_DIR, cfg["files"]["regular"])
+        bold = os.path.join(BASE_DIR, cfg["files"]["bold"])
+        jobs.update((regular, sizes[key]) for key in ("username", "leverage_text"))
+        jobs.update((bold, sizes[key]) for key in ("symbol", "pnl", "entry", "exit"))
+    # generate_custom_bybit_image уменьшает PnL для больших значений
+    bold = os.path.join(BASE_DIR, fonts["custom_bybit"]["files"]["bold"])
+    jobs.update({(bold, 80), (bold, 100)})
+    return jobs
+
+def icon_specs() -> list[tuple[str, int]]:
+    custom_layout = CONFIG.custom_layout
+    jobs = []
+    icon_cfg = custom_layout["bybit"].get("symbol_icon")
+    if icon_cfg:
+        jobs.append((os.path.join(BASE_DIR, "assets", "bybit", "icon.png"), icon_cfg.get("size", 60)))
+    lines_cfg = custom_layout["bingx"].get("lines")
+    if lines_cfg:
+        jobs.append((os.path.join(BASE_DIR, "assets", "bingx", "line.png"), int(lines_cfg.get("size", 80))))
+    return jobs
+
+def warmup_jobs() -> list[tuple]:
+    # (функция, *аргументы) — независимые задачи, их можно гнать параллельно
+    jobs: list[tuple] = [(_load_template, path) for path in template_paths() if os.path.exists(path)]
+    jobs += [(_load_icon, path, size) for path, size in icon_specs() if os.path.exists(path)]
+    jobs += [(_load_font, path, size) for path, size in sorted(_font_jobs())]
+    return jobs
+
+def warmup(executor: Executor | None = None) -> int:
+    jobs = warmup_jobs()
+    if executor is None:
+        for func, *args in jobs:
+            func(*args)
+    else:
+        for future in [executor.submit(func, *args) for func, *args in jobs]:
+            future.result()
+    return len(jobs)
+
+
+# =====================================================
+# ГОРЯЧАЯ ПЕРЕЗАГРУЗКА: опрос mtime по assets/, fonts/, configs/ (цикл — в main.py).
+# Сбрасывается только то, что зависит от изменившегося файла; рендеры,
+# которые уже идут, дорисуют со своим шаблоном и своим снимком CONFIG.
+# =====================================================
+WATCH_DIRS = [os.path.join(BASE_DIR, name) for name in ("assets", "fonts", "configs")]
+
+def make_watcher() -> FileWatcher:
+    return FileWatcher(WATCH_DIRS)
+
+def apply_changes(paths: list[str]) -> list[str]:
+    # Возвращает виды перезагруженного: template, icon, font, bundle, config
+    global CONFIG
+    kinds = []
+    config_changed = False
+    for path in paths:
+        rel = os.path.relpath(path, BASE_DIR).replace(os.sep, "/")
+        if os.path.abspath(path) == os.path.abspath(BUNDLE_PATH):
+            # Картинки из старого бандла отпускаем, чтобы закрыть его mmap
+            _get_bundle.cache_clear()
+            _load_template.cache_clear()
+            _load_icon.cache_clear()
+            kinds.append("bundle")
+        elif rel.startswith("configs/") and rel.endswith(".py"):
+            config_changed = True
+        elif rel.startswith("fonts/"):
+            if _load_font.invalidate(path):
+                kinds.append("font")
+        elif os.path.dirname(os.path.abspath(path)) == os.path.abspath(COIN_ICONS.local_dir):
+            COIN_ICONS.invalidate(base_asset(os.path.splitext(os.path.basename(path))[0]))
+            kinds.append("coin_icon")
+        elif rel.startswith("assets/"):
+            if _load_template.invalidate(path):
+                kinds.append("template")
+            if _load_icon.invalidate(path):
+                kinds.append("icon")
+    if config_changed:
+        try:
+            CONFIG = _read_config()
+            kinds.append("config")
+        except Exception:
+            # Полузаписанный или сломанный конфиг: остаёмся на прошлом снимке
+            log.warning("config reload failed, keeping the previous layout", exc_info=True)
+    return kinds
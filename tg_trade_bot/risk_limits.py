@@ -0,0 +1,240 @@
+# risk_limits.py
+#
+# Ступенчатая поддерживающая маржа (risk limit / MMR tiers) и цена ликвидации.
+# Таблицы тиров грузятся пачкой на всю биржу (Bybit — /v5/market/risk-limit,
+# любая биржа — JSON-снапшот в cache/risk_limits/<exchange>.json) и лежат по
+# символу в отсортированных массивах; тир для стоимости позиции — bisect по
+# верхним границам, для пачки позиций — np.searchsorted.
+# Символ без таблицы — один тир mmr=0.005, ровно как calc.calculate_liquidation.
+#
+# Линейные USDT-контракты, MM считается от стоимости позиции по входу:
+#   MM       = notional * mmr - deduction
+#   isolated — обеспечение = IM = notional / leverage
+#   cross    — обеспечение = весь баланс (deposit), но не меньше IM
+#   long  liq = entry - (обеспечение - MM) / qty
+#   short liq = entry + (обеспечение - MM) / qty
+
+import bisect
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+log = logging.getLogger("tg_trade_bot.risk_limits")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MMR = 0.005
+MARGIN_MODES = ("isolated", "cross")
+
+
+def normalize_symbol(symbol: str) -> str:
+    # BingX пишет BTC-USDT, Bybit — BTCUSDT
+    return symbol.upper().replace("-", "").replace("/", "")
+
+
+class RiskTable:
+    # Тиры одного символа: верхняя граница стоимости позиции (включительно),
+    # mmr, вычет и максимальное плечо. Позиция больше последней границы
+    # считается по последнему тиру.
+    __slots__ = ("limits", "mmr", "deduction", "max_leverage", "_bounds")
+
+    def __init__(self, tiers):
+        rows = np.array(sorted(tiers), dtype=np.float64).reshape(-1, 4)
+        if not len(rows):
+            raise ValueError("empty risk table")
+        self.limits, self.mmr, self.deduction, self.max_leverage = (col.copy() for col in rows.T)
+        # bisect по списку для одиночной позиции быстрее, чем searchsorted
+        self._bounds = self.limits.tolist()
+
+    def tier(self, notional: float) -> int:
+        return min(bisect.bisect_left(self._bounds, notional), len(self._bounds) - 1)
+
+    def tiers(self, notional) -> np.ndarray:
+        index = np.searchsorted(self.limits, notional, side="left")
+        return np.minimum(index, len(self.limits) - 1)
+
+    def maintenance(self, notional: float) -> float:
+        i = self.tier(notional)
+        return max(notional * float(self.mmr[i]) - float(self.deduction[i]), 0.0)
+
+    def rows(self) -> list[list[float]]:
+        return [[float(v) if np.isfinite(v) else None for v in row]
+                for row in zip(self.limits, self.mmr, self.deduction, self.max_leverage)]
+
+    def __len__(self) -> int:
+        return len(self._bounds)
+
+
+DEFAULT_TABLE = RiskTable([(float("inf"), DEFAULT_MMR, 0.0, 125.0)])
+
+
+# =====================================================
+# Формулы: скаляр и векторный вариант
+# =====================================================
+def liquidation_price(
+    side: str, entry: float, qty: float, leverage: float, table: RiskTable = DEFAULT_TABLE,
+    mode: str = "isolated", balance: float | None = None,
+) -> float:
+    if leverage <= 0:
+        return 0.0
+    notional = entry * qty
+    i = table.tier(notional)
+    mmr = float(table.mmr[i])
+    # qty округлился до нуля — остаётся чистая формула по mmr первого тира
+    deduction = float(table.deduction[i]) if qty > 0 else 0.0
+    qty = qty if qty > 0 else 1.0
+    if mode == "cross" and balance is not None and notional > 0:
+        # (balance - MM) / qty при balance = IM — ровно формула isolated
+        collateral = max(balance, notional / leverage)
+        cushion = (collateral - notional * mmr + deduction) / qty
+        price = entry - cushion if side == "long" else entry + cushion
+    elif side == "long":
+        price = entry * (1 - 1 / leverage + mmr) - deduction / qty
+    else:
+        price = entry * (1 + 1 / leverage - mmr) + deduction / qty
+    return max(price, 0.0)
+
+
+def liquidation_prices(long, entry, qty, collateral, mmr, deduction) -> np.ndarray:
+    # Все аргументы — массивы одной формы (или скаляры); long — bool
+    entry = np.asarray(entry, dtype=np.float64)
+    qty = np.asarray(qty, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cushion = (collateral - entry * qty * mmr + deduction) / qty
+    price = np.where(long, entry - cushion, entry + cushion)
+    return np.where(qty > 0, np.maximum(price, 0.0), 0.0)
+
+
+# =====================================================
+# Реестр таблиц по биржам
+# =====================================================
+class RiskLimits:
+    def __init__(self, snapshot_dir: str):
+        self.snapshot_dir = snapshot_dir
+        # exchange -> {symbol -> RiskTable}; словарь биржи подменяется целиком
+        self._tables: dict[str, dict[str, RiskTable]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RiskLimits":
+        return cls(os.getenv("RISK_LIMITS_DIR", os.path.join(BASE_DIR, "cache", "risk_limits")))
+
+    def _exchange(self, exchange: str) -> dict[str, RiskTable]:
+        tables = self._tables.get(exchange)
+        if tables is None:
+            # Первое обращение (в т.ч. в воркере batch_render) — берём снапшот
+            with self._lock:
+                if exchange not in self._tables:
+                    self._tables[exchange] = self._read_snapshot(exchange)
+                tables = self._tables[exchange]
+        return tables
+
+    def table(self, exchange: str, symbol: str) -> RiskTable:
+        return self._exchange(exchange).get(normalize_symbol(symbol), DEFAULT_TABLE)
+
+    def symbols(self, exchange: str) -> int:
+        return len(self._exchange(exchange))
+
+    def replace(self, exchange: str, tables: dict[str, RiskTable], save: bool = True) -> int:
+        self._tables[exchange] = tables
+        if save:
+            self._write_snapshot(exchange, tables)
+        return len(tables)
+
+    # ---------- снапшоты ----------
+    def _snapshot_path(self, exchange: str) -> str:
+        return os.path.join(self.snapshot_dir, f"{exchange}.json")
+
+    def _read_snapshot(self, exchange: str) -> dict[str, RiskTable]:
+        # {"BTCUSDT": [[limit, mmr, deduction, max_leverage], ...], ...};
+        # limit null — без верхней границы
+        path = self._snapshot_path(exchange)
+        try:
+            with open(path, encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            log.warning("risk limit snapshot unreadable", exc_info=True, extra={"fields": {"path": path}})
+            return {}
+        tables = {}
+        for symbol, rows in raw.items():
+            try:
+                tables[normalize_symbol(symbol)] = RiskTable(
+                    (float("inf") if limit is None else limit, mmr, deduction or 0.0, max_lev or 0.0)
+                    for limit, mmr, deduction, max_lev in rows
+                )
+            except (TypeError, ValueError):
+                log.warning("bad risk table in snapshot", extra={"fields": {"symbol": symbol}})
+        return tables
+
+    def _write_snapshot(self, exchange: str, tables: dict[str, RiskTable]) -> None:
+        path = self._snapshot_path(exchange)
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({symbol: table.rows() for symbol, table in tables.items()}, f)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            log.warning("risk limit snapshot write failed", exc_info=True)
+
+    # ---------- расчёт ----------
+    def liquidation(
+        self, exchange: str, symbol: str, side: str, entry: float, qty: float, leverage: float,
+        mode: str = "isolated", balance: float | None = None,
+    ) -> float:
+        return liquidation_price(side, entry, qty, leverage, self.table(exchange, symbol), mode, balance)
+
+    def liquidation_batch(
+        self, exchange: str, symbols, sides, entries, qtys, leverages,
+        mode: str = "isolated", balances=None,
+    ) -> np.ndarray:
+        # Много позиций одной биржи: тиры ищутся одним searchsorted на символ
+        symbols = np.asarray(symbols)
+        entries = np.asarray(entries, dtype=np.float64)
+        qtys = np.asarray(qtys, dtype=np.float64)
+        leverages = np.asarray(leverages, dtype=np.float64)
+        long = np.asarray(sides) == "long"
+        notional = entries * qtys
+        mmr = np.empty_like(notional)
+        deduction = np.empty_like(notional)
+        # Группировка одной сортировкой: позиции символа — непрерывный срез order
+        unique, inverse = np.unique(symbols, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(unique) + 1))
+        for k, symbol in enumerate(unique):
+            rows = order[bounds[k]:bounds[k + 1]]
+            table = self.table(exchange, str(symbol))
+            index = table.tiers(notional[rows])
+            mmr[rows] = table.mmr[index]
+            deduction[rows] = table.deduction[index]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            collateral = np.where(leverages > 0, notional / leverages, 0.0)
+        if mode == "cross" and balances is not None:
+            collateral = np.maximum(np.asarray(balances, dtype=np.float64), collateral)
+        return liquidation_prices(long, entries, qtys, collateral, mmr, deduction)
+
+
+# =====================================================
+# Разбор ответов бирж
+# =====================================================
+def parse_bybit(rows: list[dict]) -> dict[str, RiskTable]:
+    # /v5/market/risk-limit?category=linear: по строке на (символ, тир)
+    grouped: dict[str, list[tuple[float, float, float, float]]] = {}
+    for row in rows:
+        try:
+            tier = (
+                float(row["riskLimitValue"]),
+                float(row["maintenanceMargin"]),
+                float(row.get("mmDeduction") or 0.0),
+                float(row.get("maxLeverage") or 0.0),
+            )
+        except (KeyError, TypeError, ValueError):
+            continue
+        grouped.setdefault(normalize_symbol(row.get("symbol", "")), []).append(tier)
+    return {symbol: RiskTable(tiers) for symbol, tiers in grouped.items() if symbol}
+
+
+RISK_LIMITS = RiskLimits.from_env()
@@ -0,0 +1,55 @@
+# scenarios.py
+#
+# Лесенка сценариев: PnL, ROI и ликвидация для сетки «цена марк × плечо»
+# за один векторный проход NumPy. Формулы те же, что в calc.py
+# (calculate_qty / calculate_pnl_linear), ликвидация — по тирам
+# поддерживающей маржи из risk_limits.py.
+
+import numpy as np
+
+from risk_limits import DEFAULT_TABLE, RiskTable, liquidation_prices
+
+DEFAULT_LEVERAGES = (1, 2, 3, 5, 8, 10, 15, 20, 25, 30, 40, 50, 60, 75, 100, 125)
+DEFAULT_SPAN = 0.10  # марк от entry −10% до +10%
+DEFAULT_STEPS = 41
+
+
+def mark_ladder(entry: float, span: float = DEFAULT_SPAN, steps: int = DEFAULT_STEPS) -> np.ndarray:
+    # Сверху вниз: от самой высокой цены к самой низкой, entry посередине
+    return entry * np.linspace(1 + span, 1 - span, steps)
+
+
+def scenario_grid(
+    exchange: str, side: str, entry: float, amount: float,
+    marks, leverages, table: RiskTable = DEFAULT_TABLE,
+) -> dict[str, np.ndarray]:
+    # Строки — цены марк, столбцы — плечи. Возвращает массивы формы
+    # (len(marks), len(leverages)) для pnl/roi/liquidated и (len(leverages),)
+    # для qty/margin/liquidation. Плечо растит стоимость позиции — у каждого
+    # столбца свой тир MMR.
+    marks = np.asarray(marks, dtype=np.float64)
+    leverages = np.asarray(leverages, dtype=np.float64)
+    qty = np.round(amount * leverages / entry, 4 if exchange == "bybit" else 2)
+    sign = 1.0 if side == "long" else -1.0
+    pnl = (marks[:, None] - entry) * qty[None, :] * sign
+    margin = entry * qty / leverages
+    with np.errstate(divide="ignore", invalid="ignore"):
+        roi = np.where(margin > 0, pnl / margin * 100, 0.0)
+    tier = table.tiers(entry * qty)
+    liquidation = liquidation_prices(
+        side == "long", entry, qty, margin, table.mmr[tier], table.deduction[tier]
+    )
+    if side == "long":
+        liquidated = marks[:, None] <= liquidation[None, :]
+    else:
+        liquidated = marks[:, None] >= liquidation[None, :]
+    return {
+        "marks": marks,
+        "leverages": leverages,
+        "qty": qty,
+        "margin": margin,
+        "liquidation": liquidation,
+        "pnl": pnl,
+        "roi": roi,
+        "liquidated": liquidated,
+    }
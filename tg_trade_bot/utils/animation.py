@@ -0,0 +1,188 @@
+# utils/animation.py
+#
+# Короткие анимации карточек (GIF / MP4) поверх статичного слоя.
+#
+# Статичный слой (шаблон, очищенные зоны, иконки, подписи) рисуется один раз;
+# кадр — это только «живые» надписи (PnL, цена). Перед каждым кадром из слоя
+# восстанавливаются рамки надписей прошлого кадра, рисуются новые, и в файл
+# уходит лишь рамка изменений:
+#   gif — кадр-подпрямоугольник с общей палитрой (GIF это умеет сам), байты
+#         пишутся в файл сразу, в памяти — один рабочий кадр;
+#   mp4 — полные кадры в stdin ffmpeg (если он есть в PATH, иначе gif).
+# Бюджет времени на запрос: когда он исчерпан, анимация прыгает сразу на
+# последний кадр — итоговые цифры на картинке всегда настоящие.
+
+import logging
+import shutil
+import subprocess
+import time
+
+from PIL import GifImagePlugin, Image, ImageDraw
+
+log = logging.getLogger("tg_trade_bot.animation")
+
+Box = tuple[int, int, int, int]
+# Надпись кадра: (xy, текст, цвет, шрифт, anchor)
+Text = tuple[tuple[float, float], str, tuple, object, str | None]
+
+EXTENSIONS = {"gif": ".gif", "mp4": ".mp4"}
+
+
+def ease_out(n: int) -> list[float]:
+    # Доли 0..1 для счётчика: быстро в начале, плавно к итоговому значению
+    if n < 2:
+        return [1.0] * n
+    return [1 - (1 - i / (n - 1)) ** 3 for i in range(n)]
+
+
+def _union(boxes: list[Box], size: tuple[int, int]) -> Box | None:
+    if not boxes:
+        return None
+    x0 = max(0, min(b[0] for b in boxes))
+    y0 = max(0, min(b[1] for b in boxes))
+    x1 = min(size[0], max(b[2] for b in boxes))
+    y1 = min(size[1], max(b[3] for b in boxes))
+    return (x0, y0, x1, y1) if x0 < x1 and y0 < y1 else None
+
+
+class GifWriter:
+    def __init__(self, fp, palette: Image.Image, duration_ms: int):
+        self.fp = fp
+        self.palette = palette  # P-картинка: её палитра — общая для всех кадров
+        self.duration_ms = duration_ms
+        self.frames = 0
+
+    def _quantize(self, img: Image.Image) -> Image.Image:
+        return img.quantize(palette=self.palette, dither=Image.Dither.NONE)
+
+    def write(self, frame: Image.Image, box: Box | None, last: bool = False) -> None:
+        if self.frames == 0:
+            first = self._quantize(frame)
+            header, _ = GifImagePlugin.getheader(first, None, {"loop": 0})
+            for chunk in header:
+                self.fp.write(chunk)
+            tile, offset = first, (0, 0)
+        elif box is None:
+            # Ничего не изменилось — однопиксельный кадр держит паузу
+            tile, offset = self._quantize(frame.crop((0, 0, 1, 1))), (0, 0)
+        else:
+            tile, offset = self._quantize(frame.crop(box)), box[:2]
+        # На последнем кадре задерживаемся, чтобы итог успели прочитать
+        duration = self.duration_ms * (12 if last else 1)
+        for chunk in GifImagePlugin.getdata(tile, offset, duration=duration, disposal=1):
+            self.fp.write(chunk)
+        self.frames += 1
+
+    def close(self) -> None:
+        self.fp.write(b";")
+
+
+class Mp4Writer:
+    def __init__(self, path: str, size: tuple[int, int], fps: float):
+        self.frames = 0
+        self.fps = fps
+        self._proc = subprocess.Popen(
+            [
+                shutil.which("ffmpeg"), "-loglevel", "error", "-y",
+                "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{size[0]}x{size[1]}", "-r", str(fps),
+                "-i", "-",
+                # yuv420p требует чётных сторон
+                "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+                "-movflags", "+faststart", path,
+            ],
+            stdin=subprocess.PIPE,
+        )
+
+    def write(self, frame: Image.Image, box: Box | None, last: bool = False) -> None:
+        # В видео кадр всегда полный; буфер один — текущий кадр
+        data = frame.tobytes()
+        repeats = int(self.fps) if last else 1
+        for _ in range(repeats):
+            self._proc.stdin.write(data)
+        self.frames += repeats
+
+    def close(self) -> None:
+        self._proc.stdin.close()
+        if self._proc.wait() != 0:
+            raise RuntimeError("ffmpeg failed")
+
+
+def available_format(fmt: str) -> str:
+    if fmt == "mp4" and shutil.which("ffmpeg") is None:
+        log.warning("ffmpeg not found, falling back to gif")
+        return "gif"
+    return fmt if fmt in EXTENSIONS else "gif"
+
+
+def render_animation(static: Image.Image, frames: list[list[Text]], path: str, fmt: str = "gif",
+                     fps: float = 20.0, max_seconds: float = 4.0) -> dict:
+    # frames — надписи каждого кадра; последний кадр — итоговая карточка.
+    # Возвращает статистику: кадры, мс на кадр, размер файла, обрезан ли бюджетом
+    start = time.perf_counter()
+    frame = static.convert("RGB")
+    static = frame.copy()
+    draw = ImageDraw.Draw(frame)
+
+    def paint(texts: list[Text]) -> list[Box]:
+        boxes = []
+        for xy, text, fill, font, anchor in texts:
+            x0, y0, x1, y1 = draw.textbbox(xy, text, font=font, anchor=anchor)
+            boxes.append((int(x0), int(y0), int(x1) + 1, int(y1) + 1))
+            draw.text(xy, text, fill=fill, font=font, anchor=anchor)
+        return boxes
+
+    if fmt == "gif":
+        # Палитра по первому и последнему кадру: в ней есть цвета обоих знаков PnL
+        sample = Image.new("RGB", (frame.width, frame.height * 2))
+        paint(frames[-1])
+        sample.paste(frame, (0, 0))
+        frame.paste(static)
+        paint(frames[0])
+        sample.paste(frame, (0, frame.height))
+        frame.paste(static)
+        palette = sample.quantize(256, method=Image.Quantize.FASTOCTREE)
+        del sample
+        fp = open(path, "wb")
+        writer = GifWriter(fp, palette, int(1000 / fps))
+    else:
+        fp = None
+        writer = Mp4Writer(path, frame.size, fps)
+
+    drawn: list[Box] = []
+    frame_seconds = []
+    truncated = False
+    try:
+        index = 0
+        while index < len(frames):
+            began = time.perf_counter()
+            last = index == len(frames) - 1
+            for box in drawn:
+                frame.paste(static.crop(box), box[:2])
+            boxes = paint(frames[index])
+            writer.write(frame, _union(drawn + boxes, frame.size), last)
+            drawn = boxes
+            frame_seconds.append(time.perf_counter() - began)
+            index += 1
+            if not last and time.perf_counter() - start > max_seconds:
+                truncated = True
+                index = len(frames) - 1
+        writer.close()
+    finally:
+        if fp is not None:
+            fp.close()
+
+    size = 0
+    try:
+        with open(path, "rb") as f:
+            size = f.seek(0, 2)
+    except OSError:
+        pass
+    return {
+        "format": fmt,
+        "frames": len(frame_seconds),
+        "frame_ms": sum(frame_seconds) / len(frame_seconds) * 1000 if frame_seconds else 0.0,
+        "total_ms": (time.perf_counter() - start) * 1000,
+        "bytes": size,
+        "truncated": truncated,
+    }
@@ -0,0 +1,93 @@
+# utils/bundle.py
+#
+# Бандл предекодированных RGBA-ассетов в одном файле:
+#   8 байт MAGIC | uint64 длина индекса | JSON-индекс | данные (выравнивание 64 байта)
+# Индекс: ключ -> offset, width, height и mtime/size исходного PNG.
+# Файл мапится в память (mmap), картинки — Image.frombuffer поверх него без
+# копирования, так что все процессы-воркеры делят одни и те же страницы.
+
+import json
+import mmap
+import os
+import struct
+
+from PIL import Image
+
+MAGIC = b"TGRBNDL1"
+_HEADER = struct.Struct("<8sQ")
+_ALIGN = 64
+
+
+def _align(value: int) -> int:
+    return (value + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def source_stamp(path: str) -> tuple[int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+class AssetBundle:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path}: not an asset bundle")
+        start = _HEADER.size
+        self.index: dict[str, dict] = json.loads(self._mm[start:start + index_len])
+        self._view = memoryview(self._mm)
+
+    def image(self, key: str, source_path: str | None = None) -> Image.Image | None:
+        # None — ключа нет или исходный файл поменялся после сборки бандла
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        if source_path is not None:
+            try:
+                if list(source_stamp(source_path)) != entry["source"]:
+                    return None
+            except OSError:
+                return None
+        w, h = entry["width"], entry["height"]
+        buf = self._view[entry["offset"]:entry["offset"] + w * h * 4]
+        # Для "raw"/RGBA с такими аргументами PIL мапит буфер без копирования (read-only)
+        return Image.frombuffer("RGBA", (w, h), buf, "raw", "RGBA", 0, 1)
+
+
+def build_bundle(out_path: str, items: list[tuple[str, Image.Image, str]]) -> int:
+    # items: (ключ, картинка, путь к исходнику). Пишем во временный файл и
+    # подменяем атомарно — уже замапленные старые версии остаются валидны.
+    images = [(key, img.convert("RGBA"), src) for key, img, src in items]
+    index: dict[str, dict] = {}
+    # Длина индекса зависит от offset'ов, поэтому считаем их при заведомо
+    # достаточном резерве под сам индекс
+    draft = json.dumps({
+        key: {"offset": 0, "width": img.width, "height": img.height, "source": list(source_stamp(src))}
+        for key, img, src in images
+    })
+    data_start = offset = _align(_HEADER.size + len(draft.encode()) + 32 * len(images) + 64)
+    for key, img, src in images:
+        index[key] = {
+            "offset": offset,
+            "width": img.width,
+            "height": img.height,
+            "source": list(source_stamp(src)),
+        }
+        offset = _align(offset + img.width * img.height * 4)
+    index_bytes = json.dumps(index).encode()
+    if _HEADER.size + len(index_bytes) > data_start:
+        raise ValueError("bundle index does not fit into the reserved header")
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(index_bytes)))
+        f.write(index_bytes)
+        for key, img, _ in images:
+            f.seek(index[key]["offset"])
+            f.write(img.tobytes())
+        f.truncate(offset)
+    os.replace(tmp_path, out_path)
+    return offset
@@ -0,0 +1,105 @@
+# utils/canvas.py
+#
+# Переиспользуемый холст под один шаблон. Вместо полной копии шаблона на
+# каждый рендер холст помнит прямоугольники, в которых рисовали в прошлый раз
+# (текст, плашки, иконки), и перед следующим рендером восстанавливает из
+# шаблона только их. Выделяется память лишь под эти тайлы.
+#
+# Картинка холста живёт до следующего begin() — её нужно закодировать или
+# скопировать сразу. Холст не потокобезопасен: один на поток (см. render.py).
+#
+# captured — для анимаций: строки из этого словаря draw.text не рисует, а
+# записывает параметры вызова (xy, fill, font, anchor, kwargs). Так из обычной
+# функции рисования карточки получаются статичный слой и «живые» надписи.
+
+import math
+
+from PIL import Image, ImageDraw
+
+Box = tuple[int, int, int, int]
+
+
+class TrackingDraw(ImageDraw.ImageDraw):
+    # ImageDraw, который сообщает холсту рамку каждой нарисованной фигуры
+
+    def __init__(self, canvas: "Canvas"):
+        super().__init__(canvas.image)
+        self._canvas = canvas
+
+    def text(self, xy, text, fill=None, font=None, anchor=None, *args, **kwargs):
+        captured = self._canvas.captured
+        if captured is not None and text in captured:
+            captured[text].append((xy, fill, font, anchor, kwargs))
+            return None
+        bbox_kwargs = {k: kwargs[k] for k in ("spacing", "align", "direction", "stroke_width") if k in kwargs}
+        self._canvas.mark(self.textbbox(xy, text, font=font, anchor=anchor, **bbox_kwargs))
+        return super().text(xy, text, fill, font, anchor, *args, **kwargs)
+
+    def rectangle(self, xy, *args, **kwargs):
+        self._canvas.mark(_xy_box(xy))
+        return super().rectangle(xy, *args, **kwargs)
+
+    def rounded_rectangle(self, xy, *args, **kwargs):
+        self._canvas.mark(_xy_box(xy))
+        return super().rounded_rectangle(xy, *args, **kwargs)
+
+
+def _xy_box(xy) -> tuple[float, float, float, float]:
+    if len(xy) == 2:
+        (x0, y0), (x1, y1) = xy
+    else:
+        x0, y0, x1, y1 = xy
+    # Рамка ImageDraw включает правую/нижнюю границу
+    return x0, y0, x1 + 1, y1 + 1
+
+
+class Canvas:
+    def __init__(self, template: Image.Image):
+        self.template = template
+        # Непрозрачный RGBA-шаблон держим в RGB: меньше памяти, и энкодеру
+        # не нужно отдельно выбрасывать альфу
+        opaque = template.mode == "RGBA" and template.getchannel("A").getextrema() == (255, 255)
+        self.image = template.convert("RGB") if opaque else template.copy()
+        self._dirty: list[Box] = []
+        self._draw: TrackingDraw | None = None
+        self.captured: dict[str, list] | None = None
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.image.size
+
+    def mark(self, box) -> None:
+        w, h = self.image.size
+        x0, y0 = max(0, math.floor(box[0])), max(0, math.floor(box[1]))
+        x1, y1 = min(w, math.ceil(box[2])), min(h, math.ceil(box[3]))
+        if x0 < x1 and y0 < y1:
+            self._dirty.append((x0, y0, x1, y1))
+
+    def begin(self) -> Image.Image:
+        # Возвращаем холст к чистому шаблону: только там, где рисовали
+        for box in self._dirty:
+            self.image.paste(self.template.crop(box), box[:2])
+        self._dirty = []
+        return self.image
+
+    def draw(self) -> TrackingDraw:
+        if self._draw is None:
+            self._draw = TrackingDraw(self)
+        return self._draw
+
+    def paste(self, im: Image.Image, xy: tuple[int, int], mask: Image.Image | None = None) -> None:
+        x, y = int(xy[0]), int(xy[1])
+        self.mark((x, y, x + im.width, y + im.height))
+        self.image.paste(im, (x, y), mask)
+
+    def composite(self, overlay: Image.Image, xy: tuple[int, int]) -> None:
+        # Альфа-композит маленького оверлея только в его рамке
+        x, y = int(xy[0]), int(xy[1])
+        box = (x, y, x + overlay.width, y + overlay.height)
+        self.mark(box)
+        if self.image.mode == "RGBA":
+            self.image.alpha_composite(overlay, (x, y))
+        else:
+            tile = self.image.crop(box).convert("RGBA")
+            tile.alpha_composite(overlay)
+            self.image.paste(tile.convert(self.image.mode), box[:2])
@@ -0,0 +1,59 @@
+# utils/cleanup.py
+
+import asyncio
+
+from aiogram import Bot
+
+# Лимит Bot API на один вызов deleteMessages
+DELETE_BATCH_LIMIT = 100
+
+
+class MessageCleaner:
+    # Фоновая очистка сообщений: хендлер только ставит id в очередь,
+    # а удаление уходит пачками через deleteMessages, не блокируя ответ.
+
+    def __init__(self, flush_delay: float = 0.3):
+        self.flush_delay = flush_delay
+        # (bot_id, chat_id) -> (bot, {message_id: None}) — dict как упорядоченное множество
+        self._pending: dict[tuple[int, int], tuple[Bot, dict[int, None]]] = {}
+        self._tasks: dict[tuple[int, int], asyncio.Task] = {}
+
+    def schedule(self, bot: Bot, chat_id: int, message_id: int | None) -> None:
+        if not message_id:
+            return
+        key = (bot.id, chat_id)
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = self._pending[key] = (bot, {})
+        entry[1][message_id] = None
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.get_running_loop().create_task(self._flush_later(key))
+
+    async def _flush_later(self, key: tuple[int, int]) -> None:
+        try:
+            await asyncio.sleep(self.flush_delay)
+        finally:
+            self._tasks.pop(key, None)
+            await self._flush(key)
+
+    async def _flush(self, key: tuple[int, int]) -> None:
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            return
+        bot, ids = entry
+        chat_id = key[1]
+        message_ids = list(ids)
+        for i in range(0, len(message_ids), DELETE_BATCH_LIMIT):
+            try:
+                await bot.delete_messages(chat_id, message_ids[i:i + DELETE_BATCH_LIMIT])
+            except Exception:
+                # Сообщения могли быть уже удалены или устарели (>48 ч) — не критично
+                pass
+
+    async def close(self) -> None:
+        # Дожимаем всё, что накопилось, до закрытия сессии бота
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        for key in list(self._pending):
+            await self._flush(key)
@@ -0,0 +1,201 @@
+# utils/coin_icons.py
+#
+# Иконки монет по базовому активу (BTCUSDT -> BTC). Уровни:
+#   память  — LRU готовых RGBA-иконок по (актив, размер)
+#   диск    — cache_dir/ASSET@size.png, уже нормализованные и нужного размера;
+#             объём ограничен, при переполнении удаляются самые старые файлы
+#   исходник — local_dir/ASSET.png (свои иконки) или cache_dir/src/ASSET.png,
+#             скачанный заранее из url_template
+# get() работает только с памятью, диском и локальными файлами и вызывается из
+# потока рендера; сеть — только в асинхронном prefetch() из хендлеров.
+# Ресайз делается один раз на (актив, размер), дальше рендер — один paste.
+
+import collections
+import io
+import logging
+import os
+import re
+import threading
+import time
+
+from PIL import Image
+
+from utils.hotreload import CacheInfo
+
+log = logging.getLogger("tg_trade_bot.coin_icons")
+
+_QUOTES = ("USDT", "USDC", "BUSD", "FDUSD", "USD", "PERP")
+_SOURCE_SIZE = 256
+_MISSING_TTL = 3600
+
+
+def base_asset(symbol: str) -> str:
+    symbol = re.sub(r"[^A-Z0-9]", "", symbol.upper())
+    for quote in _QUOTES:
+        if symbol.endswith(quote) and len(symbol) > len(quote):
+            return symbol[:-len(quote)]
+    return symbol
+
+
+def normalize(img: Image.Image, size: int) -> Image.Image:
+    # RGBA, без прозрачных полей, по центру квадрата, затем ресайз
+    img = img.convert("RGBA")
+    bbox = img.getchannel("A").getbbox()
+    if bbox:
+        img = img.crop(bbox)
+    side = max(img.size)
+    square = Image.new("RGBA", (side, side), (0, 0, 0, 0))
+    square.paste(img, ((side - img.width) // 2, (side - img.height) // 2))
+    return square.resize((size, size), Image.LANCZOS)
+
+
+class CoinIcons:
+    def __init__(self, local_dir: str, cache_dir: str, url_template: str = "",
+                 max_disk_bytes: int = 50 * 2**20, memory_size: int = 256):
+        self.local_dir = local_dir
+        self.cache_dir = cache_dir
+        self.url_template = url_template
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_size = memory_size
+        self._memory: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Актив -> время, до которого не пытаемся скачать снова
+        self._missing: dict[str, float] = {}
+        self._fetching: set[str] = set()
+        self.hits = self.misses = 0
+
+    @classmethod
+    def from_env(cls, base_dir: str) -> "CoinIcons":
+        return cls(
+            local_dir=os.getenv("COIN_ICON_DIR", os.path.join(base_dir, "assets", "coins")),
+            cache_dir=os.getenv("COIN_ICON_CACHE", os.path.join(base_dir, "cache", "coin_icons")),
+            # Например https://cdn.jsdelivr.net/gh/spothq/cryptocurrency-icons@master/128/color/{asset_lower}.png
+            url_template=os.getenv("COIN_ICON_URL", ""),
+            max_disk_bytes=int(float(os.getenv("COIN_ICON_CACHE_MB", "50")) * 2**20),
+        )
+
+    def _source_path(self, asset: str) -> str | None:
+        for directory in (self.local_dir, os.path.join(self.cache_dir, "src")):
+            for name in (asset, asset.lower()):
+                path = os.path.join(directory, f"{name}.png")
+                if os.path.exists(path):
+                    return path
+        return None
+
+    def _disk_path(self, asset: str, size: int) -> str:
+        return os.path.join(self.cache_dir, f"{asset}@{size}.png")
+
+    def get(self, asset: str, size: int) -> Image.Image | None:
+        # None тоже кэшируется: у монет без иконки рендер не ходит на диск;
+        # invalidate() снимает его, когда иконка появилась
+        key = (asset, size)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            self.misses += 1
+        icon = self._load(asset, size)
+        with self._lock:
+            self._memory[key] = icon
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+        return icon
+
+    def _load(self, asset: str, size: int) -> Image.Image | None:
+        source = self._source_path(asset)
+        if source is None:
+            return None
+        cached = self._disk_path(asset, size)
+        try:
+            if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(source):
+                with Image.open(cached) as img:
+                    return img.convert("RGBA")
+            with Image.open(source) as img:
+                icon = normalize(img, size)
+        except OSError:
+            log.warning("coin icon unreadable", exc_info=True, extra={"fields": {"asset": asset}})
+            return None
+        self._store(cached, icon)
+        return icon
+
+    def _store(self, path: str, icon: Image.Image) -> None:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + ".tmp"
+            icon.save(tmp, "PNG")
+            os.replace(tmp, path)
+            self._trim_disk()
+        except OSError:
+            log.warning("coin icon cache write failed", exc_info=True)
+
+    def _trim_disk(self) -> None:
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def cache_info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.memory_size, len(self._memory))
+
+    def invalidate(self, asset: str) -> None:
+        # Исходник поменялся (горячая перезагрузка assets/coins)
+        with self._lock:
+            for key in [k for k in self._memory if k[0] == asset]:
+                del self._memory[key]
+        self._missing.pop(asset, None)
+
+    def needs_fetch(self, asset: str) -> bool:
+        return (
+            bool(self.url_template) and bool(asset)
+            and asset not in self._fetching
+            and self._missing.get(asset, 0) < time.time()
+            and self._source_path(asset) is None
+        )
+
+    async def prefetch(self, asset: str, session, run_sync) -> bool:
+        # Скачивает исходник в cache_dir/src; run_sync(func, *args) выполняет
+        # декод и запись вне event loop. True — иконка теперь есть.
+        if not self.needs_fetch(asset):
+            return self._source_path(asset) is not None
+        self._fetching.add(asset)
+        try:
+            url = self.url_template.format(asset=asset, asset_lower=asset.lower())
+            async with session.get(url) as resp:
+                if resp.status != 200:
+                    self._missing[asset] = time.time() + _MISSING_TTL
+                    return False
+                body = await resp.read()
+            return await run_sync(self._save_source, asset, body)
+        except Exception:
+            self._missing[asset] = time.time() + _MISSING_TTL
+            log.warning("coin icon fetch failed", exc_info=True, extra={"fields": {"asset": asset}})
+            return False
+        finally:
+            self._fetching.discard(asset)
+
+    def _save_source(self, asset: str, body: bytes) -> bool:
+        try:
+            with Image.open(io.BytesIO(body)) as img:
+                icon = normalize(img, _SOURCE_SIZE)
+        except OSError:
+            self._missing[asset] = time.time() + _MISSING_TTL
+            return False
+        self._store(os.path.join(self.cache_dir, "src", f"{asset}.png"), icon)
+        self.invalidate(asset)
+        return True
@@ -2,6 +2,13 @@
 
 from PIL import ImageFont
 
+from utils.hotreload import file_cache
+
+
+@file_cache(maxsize=64)
+def load_font(path, size):
+    return ImageFont.truetype(path, size)
+
 
 def px(val, size):
     return int(val * size)
@@ -26,7 +33,7 @@ def draw_text(
     x += cfg.get("dx", 0)
     y += cfg.get("dy", 0)
 
-    font = ImageFont.truetype(font_path, font_size)
+    font = load_font(font_path, font_size)
 
     anchor = cfg.get("anchor", "la")
 
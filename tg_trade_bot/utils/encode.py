@@ -0,0 +1,156 @@
+# utils/encode.py
+#
+# Кодирование готовой карточки в файл. Форматы:
+#   png         — как раньше, img.save() с настройками PIL по умолчанию
+#   png_fast    — PNG с compress_level=1: чуть больше, но в разы быстрее
+#   png_palette — PNG с квантованием до 256 цветов (плоский UI почти не страдает)
+#   webp        — lossy WebP
+#   jpeg        — JPEG высокого качества, альфа сводится на фон
+#   auto        — первый формат из AUTO_ORDER, который влезает в бюджет
+#                 по размеру; бюджет по времени обрывает перебор
+
+import io
+import os
+import threading
+import time
+import uuid
+
+from PIL import Image
+
+EXTENSIONS = {
+    "png": ".png",
+    "png_fast": ".png",
+    "png_palette": ".png",
+    "webp": ".webp",
+    "jpeg": ".jpg",
+}
+
+# От лучшего качества к меньшему размеру
+AUTO_ORDER = ("png_fast", "png_palette", "webp", "jpeg")
+
+# Ступени качества JPEG, если и на quality файл не влез в бюджет
+_JPEG_FLOOR = 60
+_JPEG_STEP = 10
+
+# Сколько кодирований одной карточки доверять выбранному auto формату,
+# прежде чем снова перебрать форматы с начала
+_REPROBE_EVERY = 50
+
+
+def flatten(img: Image.Image, background: tuple[int, int, int] = (0, 0, 0)) -> Image.Image:
+    if img.mode == "RGB":
+        return img
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    base = Image.new("RGB", img.size, background)
+    base.paste(img, mask=img.getchannel("A"))
+    return base
+
+
+def drop_opaque_alpha(img: Image.Image) -> Image.Image:
+    # Шаблоны в основном RGB, а рисуем в RGBA: полностью непрозрачный альфа-канал
+    # только раздувает PNG и замедляет zlib
+    if img.mode == "RGBA" and img.getchannel("A").getextrema() == (255, 255):
+        return img.convert("RGB")
+    return img
+
+
+def encode(img: Image.Image, fmt: str, quality: int = 90,
+           background: tuple[int, int, int] = (0, 0, 0)) -> bytes:
+    buf = io.BytesIO()
+    if fmt in ("png", "png_fast", "png_palette", "webp"):
+        img = drop_opaque_alpha(img)
+    if fmt == "png":
+        img.save(buf, "PNG")
+    elif fmt == "png_fast":
+        img.save(buf, "PNG", compress_level=1)
+    elif fmt == "png_palette":
+        # FASTOCTREE понимает и RGB, и RGBA и на карточках в разы быстрее MEDIANCUT
+        img.quantize(256, method=Image.Quantize.FASTOCTREE).save(buf, "PNG", compress_level=6)
+    elif fmt == "webp":
+        img.save(buf, "WEBP", quality=quality, method=2)
+    elif fmt == "jpeg":
+        flatten(img, background).save(buf, "JPEG", quality=quality, subsampling=0 if quality >= 90 else 2)
+    else:
+        raise ValueError(f"unknown image format: {fmt}")
+    return buf.getvalue()
+
+
+class Encoder:
+    def __init__(self, fmt: str = "png", max_bytes: int = 0, max_ms: float = 0,
+                 quality: int = 90, background: tuple[int, int, int] = (0, 0, 0)):
+        if fmt != "auto" and fmt not in EXTENSIONS:
+            raise ValueError(f"unknown image format: {fmt}")
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.max_ms = max_ms
+        self.quality = quality
+        self.background = background
+        # Вид карточки -> (формат, качество, сколько раз уже использован)
+        self._choice: dict[str, tuple[str, int, int]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Encoder":
+        background = os.getenv("RENDER_JPEG_BACKGROUND", "0,0,0")
+        return cls(
+            # По умолчанию auto с бюджетом 500 КБ: мелкие карточки идут PNG без
+            # потерь, крупные — палитровым PNG (в 5-6 раз меньше и быстрее)
+            fmt=os.getenv("RENDER_FORMAT", "auto"),
+            max_bytes=int(os.getenv("RENDER_MAX_BYTES", "512000")),
+            max_ms=float(os.getenv("RENDER_MAX_ENCODE_MS", "0")),
+            quality=int(os.getenv("RENDER_QUALITY", "90")),
+            background=tuple(int(c) for c in background.split(",")),
+        )
+
+    def _fits(self, data: bytes) -> bool:
+        return not self.max_bytes or len(data) <= self.max_bytes
+
+    def _candidates(self):
+        for fmt in AUTO_ORDER:
+            if fmt == "jpeg":
+                for quality in range(self.quality, _JPEG_FLOOR - 1, -_JPEG_STEP):
+                    yield fmt, quality
+            else:
+                yield fmt, self.quality
+
+    def _auto(self, img: Image.Image, kind: str) -> tuple[str, bytes]:
+        with self._lock:
+            cached = self._choice.get(kind)
+        if cached is not None and cached[2] < _REPROBE_EVERY:
+            fmt, quality, uses = cached
+            data = encode(img, fmt, quality, self.background)
+            if self._fits(data):
+                with self._lock:
+                    self._choice[kind] = (fmt, quality, uses + 1)
+                return fmt, data
+
+        start = time.perf_counter()
+        best = None
+        for fmt, quality in self._candidates():
+            data = encode(img, fmt, quality, self.background)
+            if best is None or len(data) < len(best[2]):
+                best = (fmt, quality, data)
+            if self._fits(data):
+                best = (fmt, quality, data)
+                break
+            if self.max_ms and (time.perf_counter() - start) * 1000 >= self.max_ms:
+                break
+        fmt, quality, data = best
+        with self._lock:
+            self._choice[kind] = (fmt, quality, 0)
+        return fmt, data
+
+    def encode(self, img: Image.Image, kind: str = "") -> tuple[str, bytes]:
+        # kind — вид карточки (префикс файла): auto запоминает выбор по нему,
+        # карточки одного вида почти одинаковы по размеру
+        if self.fmt == "auto":
+            return self._auto(img, kind)
+        return self.fmt, encode(img, self.fmt, self.quality, self.background)
+
+    def save(self, img: Image.Image, output_dir: str, prefix: str) -> str:
+        fmt, data = self.encode(img, prefix)
+        path = os.path.join(output_dir, f"{prefix}{uuid.uuid4().hex[:8]}{EXTENSIONS[fmt]}")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
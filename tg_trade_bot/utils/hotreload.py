@@ -0,0 +1,120 @@
+# utils/hotreload.py
+#
+# Горячая перезагрузка ассетов без рестарта бота:
+#   FileCache   — LRU-кэш загрузчика с ключом (путь, *аргументы); invalidate(path)
+#                 выкидывает только записи этого файла, остальное остаётся тёплым
+#   FileWatcher — дешёвый опрос mtime/size по каталогам; файл отдаётся как
+#                 изменённый, только когда он не менялся между двумя опросами
+#                 (не ловим PNG или layout.py посреди записи)
+
+import collections
+import functools
+import os
+import threading
+
+CacheInfo = collections.namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+_MISSING = object()
+
+
+class FileCache:
+    def __init__(self, loader, maxsize: int = 128):
+        functools.update_wrapper(self, loader)
+        self._loader = loader
+        self.maxsize = maxsize
+        self._data: collections.OrderedDict = collections.OrderedDict()
+        # Поколение файла: загрузка, начатая до invalidate(), не кладёт в кэш
+        # устаревшую версию
+        self._generation: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._hits = self._misses = 0
+
+    def __call__(self, path, *args):
+        key = (path, *args)
+        norm = os.path.normpath(path)
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is not _MISSING:
+                self._data.move_to_end(key)
+                self._hits += 1
+                return value
+            self._misses += 1
+            generation = self._generation.get(norm, 0)
+        value = self._loader(path, *args)
+        with self._lock:
+            if self._generation.get(norm, 0) == generation:
+                self._data[key] = value
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return value
+
+    def invalidate(self, path: str) -> int:
+        norm = os.path.normpath(path)
+        with self._lock:
+            self._generation[norm] = self._generation.get(norm, 0) + 1
+            stale = [key for key in self._data if os.path.normpath(key[0]) == norm]
+            for key in stale:
+                del self._data[key]
+        return len(stale)
+
+    def cache_clear(self) -> None:
+        with self._lock:
+            for path in {os.path.normpath(key[0]) for key in self._data}:
+                self._generation[path] = self._generation.get(path, 0) + 1
+            self._data.clear()
+
+    def cache_info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self.maxsize, len(self._data))
+
+
+def file_cache(maxsize: int = 128):
+    # Декоратор по образцу functools.lru_cache
+    return lambda loader: FileCache(loader, maxsize)
+
+
+class FileWatcher:
+    IGNORED_DIRS = {"__pycache__"}
+    IGNORED_SUFFIXES = (".pyc", ".tmp", ".swp", "~")
+
+    def __init__(self, roots: list[str]):
+        self.roots = roots
+        self._applied = self._scan()
+        self._pending: dict[str, object] = {}
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        stamps = {}
+        for root in self.roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = [d for d in dirnames if d not in self.IGNORED_DIRS]
+                for name in filenames:
+                    if name.endswith(self.IGNORED_SUFFIXES):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    stamps[path] = (st.st_mtime_ns, st.st_size)
+        return stamps
+
+    def poll(self) -> list[str]:
+        current = self._scan()
+        candidates = {
+            path for path in current.keys() | self._applied.keys()
+            if current.get(path) != self._applied.get(path)
+        }
+        changed = []
+        for path in candidates:
+            stamp = current.get(path)
+            if self._pending.get(path, _MISSING) == stamp:
+                changed.append(path)
+                if stamp is None:
+                    self._applied.pop(path, None)
+                else:
+                    self._applied[path] = stamp
+            else:
+                self._pending[path] = stamp
+        # Всё, что применили или что вернулось к прежнему виду, больше не ждёт
+        self._pending = {p: s for p, s in self._pending.items() if p in candidates and p not in changed}
+        return sorted(changed)
@@ -0,0 +1,109 @@
+# utils/profiling.py
+
+import asyncio
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import tracemalloc
+
+# Один профиль на процесс (все потоки сразу) — с Python 3.12
+_SHARED_PROFILER = sys.version_info >= (3, 12)
+
+
+class Profiler:
+    # Профилирование по запросу. Пока сессии нет, потоки рендера проверяют
+    # только флаг active — больше никакой нагрузки.
+
+    def __init__(self):
+        self.active = False
+        self._busy = False
+        self._lock = threading.Lock()
+        self._render_profiles: list[cProfile.Profile] = []
+
+    @property
+    def busy(self) -> bool:
+        return self._busy
+
+    def call(self, func, args):
+        # Вызывается в потоке рендера вместо func(*args), когда идёт сессия.
+        # С 3.12 cProfile работает через sys.monitoring: профиль потока event
+        # loop уже видит все потоки, а второй активный профиль — ValueError
+        if _SHARED_PROFILER:
+            return func(*args)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Профилирование никогда не ломает рендер
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+            with self._lock:
+                self._render_profiles.append(profile)
+
+    async def profile(self, seconds: float, limit: int = 40) -> str:
+        # cProfile на потоке event loop (хендлеры, middleware, aiogram)
+        # + отдельный профиль на каждый рендер, затем всё сливается в один отчёт
+        self._busy = True
+        self._render_profiles = []
+        loop_profile = cProfile.Profile()
+        try:
+            self.active = True
+            loop_profile.enable()
+            await asyncio.sleep(seconds)
+        finally:
+            loop_profile.disable()
+            self.active = False
+            self._busy = False
+        with self._lock:
+            render_profiles, self._render_profiles = self._render_profiles, []
+
+        out = io.StringIO()
+        renders = "in the shared profile" if _SHARED_PROFILER else f"render calls: {len(render_profiles)}"
+        out.write(f"cProfile: {seconds:g} s, {renders}\n\n")
+        stats = pstats.Stats(loop_profile, stream=out)
+        for profile in render_profiles:
+            stats.add(profile)
+        stats.strip_dirs()
+        out.write("=== by cumulative time ===\n")
+        stats.sort_stats("cumulative").print_stats(limit)
+        out.write("\n=== by own time ===\n")
+        stats.sort_stats("tottime").print_stats(limit)
+        return out.getvalue()
+
+    async def memory_diff(self, seconds: float, limit: int = 30) -> str:
+        # Два снимка tracemalloc с интервалом seconds и разница по строкам кода
+        self._busy = True
+        started_here = not tracemalloc.is_tracing()
+        try:
+            if started_here:
+                tracemalloc.start(10)
+            before = tracemalloc.take_snapshot()
+            await asyncio.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started_here:
+                tracemalloc.stop()
+            self._busy = False
+
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]
+        before = before.filter_traces(filters)
+        after = after.filter_traces(filters)
+
+        out = io.StringIO()
+        out.write(f"tracemalloc: {seconds:g} s, traced now {current / 2**20:.1f} MB, "
+                  f"peak {peak / 2**20:.1f} MB\n\n=== growth by line ===\n")
+        for stat in after.compare_to(before, "lineno")[:limit]:
+            out.write(f"{stat}\n")
+        out.write("\n=== largest live allocations ===\n")
+        for stat in after.statistics("lineno")[:limit]:
+            out.write(f"{stat}\n")
+        return out.getvalue()
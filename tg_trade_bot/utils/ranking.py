@@ -0,0 +1,121 @@
+# utils/ranking.py
+#
+# Индексируемый skip list (по рецепту Хеттингера): упорядоченное множество
+# ключей, где вставка, удаление, место ключа и выборка по месту — O(log n)
+# в среднем. У каждой ссылки хранится ширина — сколько элементов она
+# перепрыгивает, — поэтому ранг считается по пути поиска, без обхода списка.
+# Ключи должны быть уникальны и сравнимы (например, (-доходность, user_id)).
+
+import random
+
+_MAX_LEVELS = 24  # хватает на ~16 млн ключей
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, levels: int):
+        self.key = key
+        self.next: list = [None] * levels
+        self.width: list[int] = [1] * levels
+
+
+class RankIndex:
+    def __init__(self, seed: int | None = None):
+        self._head = _Node(None, _MAX_LEVELS)
+        self._size = 0
+        # Уровни выше _levels пусты (голова -> конец), по ним не ходим
+        self._levels = 1
+        self._random = random.Random(seed)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _level(self) -> int:
+        # Геометрическое распределение с p = 1/2
+        level = 1
+        while level < _MAX_LEVELS and self._random.random() < 0.5:
+            level += 1
+        return level
+
+    def insert(self, key) -> int:
+        # Возвращает место (с нуля), на которое встал ключ
+        height = self._level()
+        if height > self._levels:
+            # Новые уровни: голова ссылается на конец через весь список
+            for level in range(self._levels, height):
+                self._head.width[level] = self._size + 1
+            self._levels = height
+        chain = [self._head] * self._levels
+        steps = [0] * self._levels
+        node = self._head
+        for level in reversed(range(self._levels)):
+            while node.next[level] is not None and node.next[level].key < key:
+                steps[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+        new = _Node(key, height)
+        passed = 0
+        for level in range(len(new.next)):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - passed
+            prev.width[level] = passed + 1
+            passed += steps[level]
+        for level in range(height, self._levels):
+            chain[level].width[level] += 1
+        self._size += 1
+        return sum(steps)
+
+    def remove(self, key) -> int:
+        # Возвращает место, которое занимал ключ; KeyError, если его нет
+        chain = [None] * self._levels
+        rank = 0
+        node = self._head
+        for level in reversed(range(self._levels)):
+            while node.next[level] is not None and node.next[level].key < key:
+                rank += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+        target = chain[0].next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self._levels):
+            chain[level].width[level] -= 1
+        self._size -= 1
+        return rank
+
+    def rank(self, key) -> int:
+        # Сколько ключей меньше key: место с нуля, если key есть в индексе
+        rank = 0
+        node = self._head
+        for level in reversed(range(self._levels)):
+            while node.next[level] is not None and node.next[level].key < key:
+                rank += node.width[level]
+                node = node.next[level]
+        return rank
+
+    def __getitem__(self, index: int):
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        node = self._head
+        index += 1
+        for level in reversed(range(self._levels)):
+            while node.next[level] is not None and node.width[level] <= index:
+                index -= node.width[level]
+                node = node.next[level]
+        return node.key
+
+    def first(self, n: int) -> list:
+        # Первые n ключей — по нижнему уровню, O(n)
+        out = []
+        node = self._head.next[0]
+        while node is not None and len(out) < n:
+            out.append(node.key)
+            node = node.next[0]
+        return out
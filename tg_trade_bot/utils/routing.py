@@ -0,0 +1,56 @@
+# utils/routing.py
+
+from typing import Awaitable, Callable
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.types import CallbackQuery
+
+# callback_data в формате "prefix:action[:arg]".
+# Ключ маршрута — "prefix:action", arg передаётся в хендлер как есть.
+CallbackHandler = Callable[[CallbackQuery, FSMContext, str], Awaitable[None]]
+
+
+def split_callback_data(data: str) -> tuple[str, str]:
+    first = data.find(":")
+    second = data.find(":", first + 1) if first >= 0 else -1
+    if second < 0:
+        return data, ""
+    return data[:second], data[second + 1:]
+
+
+class CallbackRouter:
+    # Один хендлер на dp.callback_query вместо цепочки фильтров:
+    # хендлер ищется в dict по (состояние, ключ), затем по (None, ключ).
+
+    def __init__(self, aliases: dict[str, str] | None = None):
+        self._routes: dict[tuple[str | None, str], CallbackHandler] = {}
+        # Старые callback_data (кнопки, уже висящие в чатах) -> новый формат
+        self._aliases = aliases or {}
+
+    def route(self, key: str, state: State | None = None):
+        state_name = state.state if state is not None else None
+
+        def decorator(handler: CallbackHandler) -> CallbackHandler:
+            if (state_name, key) in self._routes:
+                raise ValueError(f"callback route already registered: {key} ({state_name})")
+            self._routes[(state_name, key)] = handler
+            return handler
+
+        return decorator
+
+    def resolve(self, data: str, raw_state: str | None) -> tuple[CallbackHandler | None, str]:
+        data = self._aliases.get(data, data)
+        key, arg = split_callback_data(data)
+        handler = self._routes.get((raw_state, key)) if raw_state else None
+        if handler is None:
+            handler = self._routes.get((None, key))
+        return handler, arg
+
+    async def dispatch(self, call: CallbackQuery, state: FSMContext, raw_state: str | None = None) -> None:
+        handler, arg = self.resolve(call.data or "", raw_state)
+        if handler is None:
+            # Неизвестная кнопка — просто гасим "часики"
+            await call.answer()
+            return
+        await handler(call, state, arg)
@@ -0,0 +1,170 @@
+# utils/tracing.py
+
+import contextvars
+import heapq
+import logging
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.types import TelegramObject, Update
+
+log = logging.getLogger("tg_trade_bot.trace")
+
+
+class Trace:
+    # Один апдейт: список спанов (имя, смещение от старта, длительность), всё в секундах
+    __slots__ = ("update_id", "kind", "state", "start", "duration", "spans", "finished")
+
+    def __init__(self, update_id: int, kind: str, state: str | None):
+        self.update_id = update_id
+        self.kind = kind
+        self.state = state
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.spans: list[tuple[str, float, float]] = []
+        self.finished = False
+
+    def add(self, name: str, start: float, duration: float) -> None:
+        # Фоновые задачи (например, очистка сообщений) наследуют контекст
+        # и могут дописать спан уже после конца апдейта — такие отбрасываем
+        if not self.finished:
+            self.spans.append((name, start - self.start, duration))
+
+    def breakdown(self) -> dict[str, float]:
+        totals: dict[str, float] = {}
+        for name, _, duration in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration * 1000
+        return {name: round(ms, 2) for name, ms in totals.items()}
+
+    def as_fields(self) -> dict[str, Any]:
+        return {
+            "update_id": self.update_id,
+            "kind": self.kind,
+            "state": self.state,
+            "total_ms": round(self.duration * 1000, 2),
+            "spans_ms": self.breakdown(),
+        }
+
+
+_CURRENT: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("trace", default=None)
+
+
+def current_trace() -> Trace | None:
+    return _CURRENT.get()
+
+
+@contextmanager
+def span(name: str):
+    trace = _CURRENT.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter() - start)
+
+
+def record_span(name: str, start: float, duration: float) -> None:
+    # Для отрезков, измеренных вне текущего контекста (например, в потоке рендера)
+    trace = _CURRENT.get()
+    if trace is not None:
+        trace.add(name, start, duration)
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = 0.1, slow_ms: float = 1500.0, keep: int = 20):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.keep = keep
+        # min-heap по длительности: в корне самый быстрый из сохранённых
+        self._slowest: list[tuple[float, int, Trace]] = []
+
+    def should_sample(self) -> bool:
+        return self.sample_rate >= 1.0 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def finish(self, trace: Trace) -> None:
+        trace.duration = time.perf_counter() - trace.start
+        trace.finished = True
+        item = (trace.duration, trace.update_id, trace)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, item)
+        elif trace.duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, item)
+        if trace.duration * 1000 >= self.slow_ms:
+            log.warning("slow update", extra={"fields": trace.as_fields()})
+
+    def slowest(self) -> list[Trace]:
+        return [item[2] for item in sorted(self._slowest, reverse=True)]
+
+    def dump(self) -> None:
+        for rank, trace in enumerate(self.slowest(), start=1):
+            log.info("slowest update", extra={"fields": {"rank": rank, **trace.as_fields()}})
+
+
+class TracingMiddleware(BaseMiddleware):
+    # Outer-middleware на dp.update. Регистрируется после FSMContextMiddleware,
+    # поэтому raw_state уже известен, а чтение состояния до старта трейса не попадает в спаны.
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        if not self.tracer.should_sample():
+            return await handler(event, data)
+        trace = Trace(event.update_id, event.event_type, data.get("raw_state"))
+        token = _CURRENT.set(trace)
+        try:
+            return await handler(event, data)
+        finally:
+            _CURRENT.reset(token)
+            self.tracer.finish(trace)
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    # Каждый вызов Bot API — отдельный спан: api:sendMessage, api:sendPhoto (upload) и т.д.
+
+    async def __call__(self, make_request, bot, method):
+        with span(f"api:{method.__api_method__}"):
+            return await make_request(bot, method)
+
+
+class TracedStorage(BaseStorage):
+    # Обёртка над FSM-хранилищем: каждое обращение пишет спан "fsm"
+
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        with span("fsm"):
+            await self.storage.set_state(key, state)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        with span("fsm"):
+            return await self.storage.get_state(key)
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        with span("fsm"):
+            await self.storage.set_data(key, data)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        with span("fsm"):
+            return await self.storage.get_data(key)
+
+    async def update_data(self, key: StorageKey, data) -> dict[str, Any]:
+        with span("fsm"):
+            return await self.storage.update_data(key, data)
+
+    async def close(self) -> None:
+        await self.storage.close()